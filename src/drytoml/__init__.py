@@ -1,6 +1,47 @@
 # -*- coding: utf-8 -*-
 """DRY Toml - Inheritance and centralization with toml files."""
 
+import importlib
 import logging
+import sys
 
 logger = logging.getLogger(__name__)
+
+_LAZY = {
+    "load": "drytoml.loader",
+    "Resolver": "drytoml.resolver",
+}
+"""Public names, imported on first access to keep `dry` startup fast."""
+
+
+def __getattr__(name: str):
+    """Import the public api on demand (see `_LAZY`).
+
+    Args:
+        name: Attribute being accessed.
+
+    Raises:
+        AttributeError: Unknown attribute.
+
+    Returns:
+        The attribute.
+    """
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    """List the module attributes, including the lazy ones.
+
+    Returns:
+        Sorted attribute names.
+    """
+    return sorted({*globals(), *_LAZY})
+
+
+if sys.version_info < (3, 7):  # pragma: no cover - no module __getattr__
+    from drytoml.loader import load  # noqa: E402
+    from drytoml.resolver import Resolver  # noqa: E402
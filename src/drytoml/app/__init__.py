@@ -6,30 +6,50 @@ import logging
 import sys
 from typing import List
 from typing import Optional
+from typing import Tuple
 
 import fire
 
+from drytoml import budget
 from drytoml import logger
+from drytoml import settings
+from drytoml.app.bench import bench
 from drytoml.app.cache import Cache
 from drytoml.app.explain import explain
 from drytoml.app.export import export
+from drytoml.app.materialize import materialize
 from drytoml.app.wrappers import black
 from drytoml.app.wrappers import check
 from drytoml.app.wrappers import flake8helled
 from drytoml.app.wrappers import flakehell
 from drytoml.app.wrappers import isort
 from drytoml.app.wrappers import pylint
+from drytoml.app.zygote import delegate
+from drytoml.app.zygote import zygote
+from drytoml.profiling import profiled
 
 INTERNAL_CMDS = {
     cmd.__name__.lower(): cmd
     for cmd in (
         Cache,
+        bench,
         explain,
         export,
+        materialize,
+        zygote,
         check,
     )
 }
 
+LIMIT_FLAGS = {
+    "--max-bytes": ("max_bytes", int),
+    "--max-references": ("max_references", int),
+    "--max-depth": ("max_depth", int),
+    "--max-values": ("max_values", int),
+    "--deadline": ("seconds", float),
+}
+"""Leading flags overriding the resolution budget (see `drytoml.budget`)."""
+
 WRAPPERS = {
     cmd.__name__.lower(): cmd
     for cmd in (
@@ -69,6 +89,63 @@ def setup_log(argv: Optional[List[str]]) -> List[str]:
     return sys.argv[:1] + unknown
 
 
+def setup_profile(argv: List[str]) -> Tuple[str, List[str]]:
+    """Enable profiling using "--profile PATH" as leading flag.
+
+    The flag is only recognized before the sub-command, to avoid
+    clashing with flags from wrapped tools.
+
+    Args:
+        argv: Command line arguments, including the program name.
+
+    Returns:
+        Destination for the profiling reports (or an empty string if
+            disabled, defaulting to `drytoml.settings.PROFILE`), and
+            the remaining arguments.
+    """
+    path = settings.PROFILE
+    if len(argv) > 1 and argv[1].startswith("--profile="):
+        path = argv[1].split("=", 1)[1]
+        argv = [argv[0], *argv[2:]]
+    elif len(argv) > 2 and argv[1] == "--profile":
+        path = argv[2]
+        argv = [argv[0], *argv[3:]]
+    return path, argv
+
+
+def setup_limits(argv: List[str]) -> Tuple[budget.Budget, List[str]]:
+    """Override resource limits using leading flags, eg "--max-depth 5".
+
+    Like "--profile", the flags (see `LIMIT_FLAGS`) are only recognized
+    before the sub-command. Non-positive values disable a limit.
+
+    Args:
+        argv: Command line arguments, including the program name.
+
+    Raises:
+        ValueError: A flag without value, or with an invalid one.
+
+    Returns:
+        The limits of every resolution of the invocation (see
+            `drytoml.budget.defaults`), defaulting to
+            `drytoml.settings`, and the remaining arguments.
+    """
+    overrides = {}
+    rest = argv[1:]
+    while rest and rest[0].split("=", 1)[0] in LIMIT_FLAGS:
+        flag, separator, raw = rest[0].partition("=")
+        if not separator:
+            if len(rest) < 2:
+                raise ValueError(f"Missing value for {flag}")
+            raw = rest[1]
+            rest = rest[1:]
+        rest = rest[1:]
+        name, cast = LIMIT_FLAGS[flag]
+        value = cast(raw)
+        overrides[name] = value if value > 0 else None
+    return budget.Budget.from_settings(**overrides), [argv[0], *rest]
+
+
 def main():
     """Execute the cli application.
 
@@ -76,12 +153,22 @@ def main():
         The result of the wrapped command
     """
     sys.argv = setup_log(sys.argv)
-
-    if len(sys.argv) == 1 or sys.argv[1] not in WRAPPERS:
-        return fire.Fire(INTERNAL_CMDS)
-
-    del sys.argv[0]
-    return WRAPPERS[sys.argv[0]]()
+    path, sys.argv = setup_profile(sys.argv)
+    limits, sys.argv = setup_limits(sys.argv)
+
+    wrapped = len(sys.argv) > 1 and sys.argv[1] in WRAPPERS
+    if wrapped and settings.ZYGOTE:
+        # the zygote applies the limits and profiles the tool itself
+        code = delegate(sys.argv[1], sys.argv[1:], limits=limits, profile=path)
+        if code is not None:
+            sys.exit(code)
+
+    with profiled(path), budget.defaults(limits):
+        if not wrapped:
+            return fire.Fire(INTERNAL_CMDS)
+
+        del sys.argv[0]
+        return WRAPPERS[sys.argv[0]]()
 
 
 if __name__ == "__main__":
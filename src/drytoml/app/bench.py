@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""This module contains the `bench` command and its required utilities.
+
+A document is resolved several times under each condition:
+
+* `cold`: Every run starts with an empty (temporary) cache, so every
+  remote reference is fetched.
+* `warm`: Runs use drytoml's cache, populated by a previous run.
+* `offline`: As `warm`, but fetching is disabled (see
+  `drytoml.settings.OFFLINE`), so the network can not add noise.
+
+In-memory caches (see `drytoml.merge.LAYERS`) are cleared before every
+run, which thus costs as much as a fresh `dry` invocation.
+"""
+
+import json
+import logging
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+from drytoml import merge
+from drytoml import paths
+from drytoml import settings
+from drytoml.metrics import percentile
+from drytoml.parser import DEFAULT_EXTEND_KEY
+from drytoml.parser import Parser
+from drytoml.profiling import step
+from drytoml.profiling import timed
+
+CONDITIONS = ("cold", "warm", "offline")
+"""Supported conditions, in the order they are measured by default."""
+
+PERCENTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+"""Percentiles reported for every measurement."""
+
+Run = Tuple[float, Dict[str, float], int]
+
+
+def resolve_once(source: Path, key: str) -> Run:
+    """Resolve and serialize a document, timing each step.
+
+    Args:
+        source: The document.
+        key: Name to look for inside the document to activate
+            interpolation.
+
+    Returns:
+        The total seconds, the seconds spent in each step (see
+            `drytoml.profiling.step`), and the number of documents
+            involved, including `source`.
+    """
+    merge.LAYERS.clear()
+    with timed() as stopwatch:
+        start = time.perf_counter()
+        parser = Parser.from_file(source, extend_key=key)
+        document = parser.parse()
+        with step("serialize"):
+            document.as_string()
+        total = time.perf_counter() - start
+    return total, stopwatch.steps, len(set(map(str, parser.dependencies)))
+
+
+def traced(source: Path, key: str) -> Tuple[Run, int]:
+    """Resolve a document once, measuring its memory usage.
+
+    Args:
+        source: The document.
+        key: Name to look for inside the document to activate
+            interpolation.
+
+    Returns:
+        As `resolve_once` (but slower, because of `tracemalloc`), and
+            the peak of memory allocated, in bytes.
+    """
+    tracemalloc.start()
+    try:
+        result = resolve_once(source, key)
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@contextmanager
+def _isolated(condition: str):
+    if condition != "cold":
+        yield
+        return
+    previous = paths.CACHE
+    with tempfile.TemporaryDirectory(prefix="drytoml-bench.") as tmp:
+        paths.CACHE = Path(tmp)
+        try:
+            yield
+        finally:
+            paths.CACHE = previous
+
+
+@contextmanager
+def _network(condition: str):
+    previous = settings.OFFLINE
+    settings.OFFLINE = condition == "offline"
+    try:
+        yield
+    finally:
+        settings.OFFLINE = previous
+
+
+def _measure(
+    condition: str,
+    source: Path,
+    key: str,
+    runs: int,
+) -> Tuple[List[Run], int]:
+    if condition != "cold":
+        # populate drytoml's cache
+        resolve_once(source, key)
+    with _network(condition):
+        with _isolated(condition):
+            __, peak = traced(source, key)
+        results = []
+        for __ in range(runs):
+            with _isolated(condition):
+                results.append(resolve_once(source, key))
+    return results, peak
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Compute the distribution of some measurements.
+
+    Args:
+        samples: The measurements.
+
+    Returns:
+        Minimum, percentiles (see `PERCENTILES`) and maximum.
+    """
+    return {
+        "min": min(samples),
+        **{
+            name: percentile(samples, rank)
+            for name, rank in PERCENTILES.items()
+        },
+        "max": max(samples),
+    }
+
+
+def bench(
+    file="pyproject.toml",
+    key=DEFAULT_EXTEND_KEY,
+    runs=10,
+    conditions: Union[str, Sequence[str]] = CONDITIONS,
+    output="",
+) -> Union[str, None]:
+    """Measure how long it takes to resolve a document.
+
+    Args:
+        file: TOML file to transclude values.
+        key: Name too look for inside the file to activate interpolation.
+        runs: Measured resolutions per condition.
+        conditions: Conditions to measure (see `CONDITIONS`), as a
+            sequence or a comma-separated string.
+        output: If set, write the report to this file instead.
+
+    Raises:
+        ValueError: Unknown condition, or no runs.
+
+    Returns:
+        Json report, or `None` if it was written to `output`. Times
+            are in seconds. For every condition, it contains the
+            distribution of the total time and of each step, the peak
+            memory allocated by a resolution (bytes, measured in an
+            extra run), and the number of documents involved.
+
+    Example:
+        >>> report = json.loads(bench("pyproject.toml", runs=20))
+        >>> report["conditions"]["cold"]["total"]["p90"]
+        0.18
+    """
+    logging.basicConfig(level=60, format="%(message)s", force=True)
+    if isinstance(conditions, str):
+        conditions = conditions.split(",")
+    unknown = sorted(set(conditions) - set(CONDITIONS))
+    if unknown:
+        raise ValueError(f"Unknown conditions {unknown}, use {CONDITIONS}")
+    if runs < 1:
+        raise ValueError("Must measure at least one run")
+
+    source = Path(file).resolve()
+    report = {"file": str(source), "runs": runs, "conditions": {}}
+    for condition in conditions:
+        results, peak = _measure(condition, source, key, runs)
+        names = sorted({name for __, steps, __ in results for name in steps})
+        report["conditions"][condition] = {
+            "total": summarize([total for total, __, __ in results]),
+            "steps": {
+                name: summarize(
+                    [steps.get(name, 0) for __, steps, __ in results]
+                )
+                for name in names
+            },
+            "peak_memory": peak,
+            "references": results[-1][2],
+        }
+
+    result = json.dumps(report, indent=2)
+    if not output:
+        return result
+    with open(output, "w") as fp:
+        fp.write(result)
+    return None
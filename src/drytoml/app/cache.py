@@ -5,14 +5,164 @@ This module contains the Cache class, which allows fire to execute any
 method (bound, static, or classmethod) as sub-command from the cli.
 """
 
+import hashlib
+import io
+import json
+import os
+import re
 import shutil
 import sys
+import tarfile
+import tempfile
+import time
+from fnmatch import fnmatchcase
 from pathlib import Path
 from typing import Dict
+from typing import List
+from typing import Tuple
 from typing import Union
 
 from drytoml import logger
-from drytoml.paths import CACHE
+from drytoml import paths
+from drytoml import settings
+from drytoml.files import LOCKS_DIR
+from drytoml.files import LockTimeout
+from drytoml.files import locked
+from drytoml.files import remove_lock
+from drytoml.graph import dependencies
+from drytoml.graph import references
+from drytoml.graph import remote
+from drytoml.index import CacheIndex
+from drytoml.metrics import Metrics
+from drytoml.metrics import flush
+from drytoml.metrics import percentile
+from drytoml.parser import DEFAULT_EXTEND_KEY
+from drytoml.parser import requires_transclusion
+from drytoml.server import CacheServer
+from drytoml.types import GitRef
+from drytoml.types import Url
+from drytoml.utils import cache_path
+from drytoml.utils import git_revision
+
+CACHE_KEY = re.compile(r"^[0-9a-f]{64}$")
+"""Names of the cache entries (see `drytoml.utils.cache_path`)."""
+
+MANIFEST = "manifest.json"
+"""Name of the manifest inside cache bundles."""
+
+SORT_KEYS = {
+    "url": lambda entry: entry["url"],
+    "size": lambda entry: -entry["size"],
+    "age": lambda entry: entry.get("fetched") or 0,
+    "accessed": lambda entry: -(entry.get("accessed") or 0),
+    "hits": lambda entry: -entry.get("hits", 0),
+}
+"""Available orderings for `Cache.show`: biggest, oldest, most recently
+used, and most used first, respectively."""
+
+
+def _select(
+    index: CacheIndex,
+    name: str = "",
+    pattern: str = "",
+) -> List[Tuple[str, dict]]:
+    """Filter index entries by key/url and url pattern.
+
+    Args:
+        index: Where to look for entries.
+        name: If set, only keep the entry with this cache key or url.
+        pattern: If set, only keep entries whose url matches this glob.
+
+    Returns:
+        Matching (cache key, metadata) tuples.
+    """
+    return [
+        (key, entry)
+        for key, entry in index.items()
+        if (not name or name in {key, Path(name).stem, entry["url"]})
+        and (not pattern or fnmatchcase(entry["url"], pattern))
+    ]
+
+
+def _discover(directory: str, pattern: str, key: str) -> Tuple[int, List]:
+    """Find the files using transclusions inside a directory tree.
+
+    Hidden directories (eg `.git`, `.tox`) are skipped.
+
+    Args:
+        directory: Where to start walking.
+        pattern: Glob to select candidate files.
+        key: Name to look for inside the files.
+
+    Returns:
+        The number of candidate files, and the ones using `key`.
+    """
+    candidates = 0
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(name for name in dirs if not name.startswith("."))
+        for name in sorted(files):
+            if not fnmatchcase(name, pattern):
+                continue
+            candidates += 1
+            path = Path(root) / name
+            try:
+                with open(path) as fp:
+                    uses_key = requires_transclusion(fp.read(), key)
+            except (OSError, UnicodeDecodeError):
+                continue
+            if uses_key:
+                found.append(path)
+    return candidates, found
+
+
+def _ago(timestamp) -> str:
+    if not timestamp:
+        return "unknown"
+    seconds = int(time.time() - timestamp)
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return f"{seconds // size}{unit} ago"
+    return f"{seconds}s ago"
+
+
+def _manifest(archive: str, bundle: tarfile.TarFile) -> Dict[str, dict]:
+    """Read and validate the entries listed in a cache bundle.
+
+    Args:
+        archive: Location of the bundle, for error messages.
+        bundle: The opened bundle.
+
+    Raises:
+        ValueError: The manifest is missing or malformed.
+
+    Returns:
+        Cache key -> entry metadata, with `url`, `size` and `sha256`.
+    """
+    try:
+        manifest = json.load(bundle.extractfile(MANIFEST))
+    except (KeyError, ValueError) as exc:
+        raise ValueError(f"{archive}: Missing manifest") from exc
+
+    entries = manifest.get("entries") if isinstance(manifest, dict) else None
+    if not isinstance(entries, dict):
+        raise ValueError(f"{archive}: Malformed manifest")
+    for name, entry in entries.items():
+        try:
+            valid = (
+                cache_path(entry["url"]).name == name
+                and isinstance(entry["size"], int)
+                and isinstance(entry["sha256"], str)
+            )
+        except (KeyError, TypeError, ValueError):
+            valid = False
+        if not valid:
+            raise ValueError(f"{archive}: Unexpected entry {name}")
+        try:
+            bundle.getmember(f"entries/{name}")
+        except KeyError as exc:
+            raise ValueError(f"{archive}: Missing entry {name}") from exc
+    return entries
 
 
 class Cache:
@@ -20,13 +170,19 @@ class Cache:
 
     @classmethod
     def clear(
-        cls, force: bool = False, name: str = ""
+        cls,
+        force: bool = False,
+        name: str = "",
+        pattern: str = "",
     ) -> Dict[Union[Path, str], str]:
         """Clear drytoml's cache.
 
         Args:
             force: Clear without asking.
-            name: If set, only clear a specific cache element.
+            name: If set, only clear a specific cache element, by url or
+                cache key.
+            pattern: If set, only clear elements whose url matches this
+                glob pattern, eg `"*githubusercontent.com/org/*"`.
 
         Returns:
             Contents of the cache after clearing it.
@@ -40,41 +196,459 @@ class Cache:
                 logger.error("Aborted")
                 sys.exit(1)
 
+        cache = paths.CACHE
         worked = False
-        for descendant in CACHE.glob("**/*"):
-            if name and (descendant.stem != Path(name).stem):
-                continue
-
-            if descendant.is_file():
-                descendant.unlink()
-                worked = True
-            elif descendant.is_dir():
-                shutil.rmtree(str(descendant.resolve()))
+        if not (name or pattern):
+            for child in cache.glob("*"):
+                if child.is_dir():
+                    shutil.rmtree(str(child.resolve()))
+                else:
+                    child.unlink()
                 worked = True
+        else:
+            with CacheIndex.updating() as index:
+                for key, __ in _select(index, name, pattern):
+                    entry = cache / key
+                    for path in (entry, entry.with_suffix(".failed")):
+                        if path.exists():
+                            path.unlink()
+                    index.remove(key)
+                    worked = True
+
         if worked:
-            logger.info("Succesfully cleared %s %s", CACHE, name)
+            logger.info("Succesfully cleared %s %s", cache, name or pattern)
         else:
-            logger.info("Nothing cleared from %s", CACHE)
+            logger.info("Nothing cleared from %s", cache)
             sys.exit(1)
 
         return cls.show()
 
     @staticmethod
-    def show() -> Dict[Union[str, Path], str]:
+    def show(
+        pattern: str = "",
+        sort: str = "url",
+        output: str = "text",
+    ) -> Union[str, Dict[str, str]]:
         """Show drytoml's cache contents.
 
+        Args:
+            pattern: If set, only show elements whose url matches this
+                glob pattern.
+            sort: Ordering of the elements, one of `url`, `size`, `age`,
+                `accessed`, `hits`.
+            output: Use `json` to get machine-readable output.
+
+        Raises:
+            ValueError: Unknown `sort` or `output` values.
+
         Returns:
-            Locations -> weight (in kb) mapping
+            Url -> summary mapping, or a json string if requested.
         """
-        data = {
-            descendant: descendant.stat().st_size
-            for descendant in CACHE.glob("**/*")
-            if descendant.is_file()
-        }
-        if not data:
-            return logger.info("Cache is empty: %s", CACHE)
-        info = {
-            **{k: f"{v/1024:.2f} kb" for k, v in data.items()},
-            "__total__": f"{sum(data.values()) / 1024:.2f} kb",
+        if sort not in SORT_KEYS:
+            raise ValueError(
+                f"Unknown sort '{sort}'. Use one of {sorted(SORT_KEYS)}"
+            )
+        if output not in {"text", "json"}:
+            raise ValueError("output must be either 'text' or 'json'")
+
+        selected = sorted(
+            _select(CacheIndex.load(), pattern=pattern),
+            key=lambda key_entry: SORT_KEYS[sort](key_entry[1]),
+        )
+        total = sum(entry["size"] for __, entry in selected)
+
+        if output == "json":
+            return json.dumps(
+                {
+                    "location": str(paths.CACHE),
+                    "entries": [
+                        {"key": key, **entry} for key, entry in selected
+                    ],
+                    "total": total,
+                },
+                indent=2,
+            )
+
+        if not selected:
+            return logger.info("Cache is empty: %s", paths.CACHE)
+        return {
+            **{
+                entry["url"]: "{:.2f} kb, fetched {}, used {}, {} hits".format(
+                    entry["size"] / 1024,
+                    _ago(entry.get("fetched")),
+                    _ago(entry.get("accessed")),
+                    entry.get("hits", 0),
+                )
+                for __, entry in selected
+            },
+            "__total__": f"{total / 1024:.2f} kb",
         }
+
+    @staticmethod
+    def stats(
+        prometheus: str = "",
+        output: str = "text",
+        reset: bool = False,
+    ) -> Union[str, Dict[str, str]]:
+        """Show cache and fetch metrics, accumulated across invocations.
+
+        Args:
+            prometheus: If set, write the metrics to this file, using
+                the prometheus node-exporter textfile format.
+            output: Use `json` to get machine-readable output.
+            reset: Forget the accumulated metrics after showing them.
+
+        Raises:
+            ValueError: Unknown `output` value.
+
+        Returns:
+            Host -> summary mapping, or a json string if requested.
+        """
+        if output not in {"text", "json"}:
+            raise ValueError("output must be either 'text' or 'json'")
+
+        flush()
+        metrics = Metrics.load()
+        if prometheus:
+            metrics.write_textfile(prometheus)
+        if reset and Metrics.location().exists():
+            Metrics.location().unlink()
+
+        if output == "json":
+            return json.dumps(metrics.as_dict(), indent=2, sort_keys=True)
+
+        counters = metrics.counters
+        latencies = metrics.histograms.get("fetch_seconds", {})
+        hosts = sorted(
+            {host for values in counters.values() for host in values}
+            | set(latencies)
+        )
+        if not hosts:
+            return logger.info("No metrics recorded yet in %s", paths.CACHE)
+
+        info = {}
+        for host in hosts:
+            hits = counters.get("hits", {}).get(host, 0)
+            lookups = sum(
+                counters.get(name, {}).get(host, 0)
+                for name in ("hits", "misses", "revalidations")
+            )
+            latency = latencies.get(host, {"sum": 0, "count": 0})
+            mean = latency["sum"] / latency["count"] if latency["count"] else 0
+            info[host] = (
+                "{} hits, {} misses, {} revalidations ({:.1%} hit ratio), "
+                "{} fetches ({:.1f} ms avg), {:.2f} kb fetched"
+            ).format(
+                hits,
+                counters.get("misses", {}).get(host, 0),
+                counters.get("revalidations", {}).get(host, 0),
+                hits / lookups if lookups else 0,
+                latency["count"],
+                mean * 1000,
+                counters.get("bytes_fetched", {}).get(host, 0) / 1024,
+            )
         return info
+
+    @staticmethod
+    def warm(
+        directory: str = ".",
+        key: str = DEFAULT_EXTEND_KEY,
+        pattern: str = "*.toml",
+        workers: int = 8,
+        output: str = "text",
+    ) -> Union[str, Dict[str, Union[int, str]]]:
+        """Prefetch every remote reference used inside a directory tree.
+
+        Every file matching `pattern` which uses `key` is a root, and
+        every reference reachable from the roots (including transitive
+        bases) is fetched into the cache, concurrently. Later
+        invocations can then be served from the cache.
+
+        Args:
+            directory: Where to look for toml files.
+            key: Name to look for inside the files to activate
+                interpolation.
+            pattern: Glob to select the files to inspect.
+            workers: Number of concurrent fetches.
+            output: Use `json` to get machine-readable output.
+
+        Raises:
+            ValueError: Unknown `output` value.
+
+        Returns:
+            Summary of the warm-up, or a json string if requested.
+        """
+        if output not in {"text", "json"}:
+            raise ValueError("output must be either 'text' or 'json'")
+
+        started = time.monotonic()
+        candidates, roots = _discover(directory, pattern, key)
+        logger.info("Found %s/%s files using %s", len(roots), candidates, key)
+
+        latencies = []
+        cached = []
+        failed = {}
+
+        def visit(reference, extend_key):
+            is_url = isinstance(reference, Url)
+            if is_url and cache_path(reference).exists():
+                cached.append(reference)
+            begin = time.monotonic()
+            try:
+                return references(reference, extend_key)
+            except Exception as exc:  # noqa: W0703
+                failed[str(reference)] = str(exc)
+                logger.error("Unable to warm %s: %s", reference, exc)
+                return []
+            finally:
+                if is_url:
+                    latencies.append(time.monotonic() - begin)
+                    logger.info(
+                        "[%s] %s (%.1f ms)",
+                        len(latencies),
+                        reference,
+                        latencies[-1] * 1000,
+                    )
+
+        graph = dependencies(roots, key, max_workers=workers, visit=visit)
+        urls = remote(graph)
+        summary = {
+            "files": candidates,
+            "roots": len(roots),
+            "remote": len(urls),
+            "cached": len(cached),
+            "fetched": len(set(urls) - set(cached) - set(failed)),
+            "failed": len(failed),
+            "elapsed": "{:.2f} s".format(time.monotonic() - started),
+        }
+        if latencies:
+            summary["latency"] = (
+                "p50 {:.1f} ms, p95 {:.1f} ms, max {:.1f} ms".format(
+                    percentile(latencies, 0.5) * 1000,
+                    percentile(latencies, 0.95) * 1000,
+                    max(latencies) * 1000,
+                )
+            )
+
+        if output == "json":
+            return json.dumps({**summary, "errors": failed}, indent=2)
+        return summary
+
+    @staticmethod
+    def gc(
+        *roots: str,
+        key: str = DEFAULT_EXTEND_KEY,
+        dry_run: bool = False,
+        workers: int = 8,
+    ) -> Dict[str, Union[int, str]]:
+        """Evict the cache entries unreachable from some toml files.
+
+        The full inheritance graph of every root is walked (fetching
+        missing references), and every other entry is removed, so the
+        ones in use stay warm.
+
+        Args:
+            roots: Files whose (transitive) references must be kept.
+                Defaults to `pyproject.toml`.
+            key: Name to look for inside the files to activate
+                interpolation.
+            dry_run: Only report what would be evicted.
+            workers: Number of concurrent fetches while walking.
+
+        Returns:
+            Number of kept and evicted entries, and the freed space.
+        """
+        graph = dependencies(roots or ["pyproject.toml"], key, workers)
+        keep = {cache_path(url).name for url in remote(graph)}
+        keep.update(
+            cache_path(ref.at(git_revision(ref))).name
+            for ref in graph
+            if isinstance(ref, GitRef)
+        )
+
+        cache = paths.CACHE
+        # name -> files of the unreachable entries, including the ones
+        # which only left a lock file behind
+        stale: Dict[str, List[Path]] = {}
+        for path in sorted(cache.glob("*")):
+            name = path.stem if path.suffix == ".failed" else path.name
+            if CACHE_KEY.match(name) and name not in keep:
+                stale.setdefault(name, []).append(path)
+        for path in (cache / LOCKS_DIR).glob("*.lock"):
+            if CACHE_KEY.match(path.stem) and path.stem not in keep:
+                stale.setdefault(path.stem, [])
+
+        evicted = 0
+        freed = 0
+        busy = set()
+        with CacheIndex.updating() as index:
+            for name, found in sorted(stale.items()):
+                size = sum(path.stat().st_size for path in found)
+                if found:
+                    logger.info("Evicting %s", index.entries.get(name, name))
+                if dry_run:
+                    evicted += any(path.name == name for path in found)
+                    freed += size
+                    continue
+                try:
+                    # entries in use are kept, for the next gc
+                    with locked(name, timeout=0) as lock:
+                        for path in found:
+                            path.unlink()
+                        remove_lock(lock)
+                except LockTimeout:
+                    logger.info("Skipping %s: in use", name)
+                    busy.add(name)
+                    continue
+                evicted += any(path.name == name for path in found)
+                freed += size
+                index.remove(name)
+            if not dry_run:
+                for name in [name for name, __ in index.items()]:
+                    if name not in keep and name not in busy:
+                        index.remove(name)
+
+        logger.info(
+            "%s %s unreachable entries from %s",
+            "Would evict" if dry_run else "Evicted",
+            evicted,
+            cache,
+        )
+        return {
+            "kept": len(keep),
+            "evicted": evicted,
+            "freed": f"{freed / 1024:.2f} kb",
+        }
+
+    @staticmethod
+    def serve(
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        ttl: float = 300,
+        allow: str = "",
+    ):
+        """Share this cache over HTTP, as a proxy for remote references.
+
+        Clients use it by setting the DRYTOML_PROXY env var to the
+        server url, eg `http://cache-node:8765`.
+
+        Args:
+            host: Interface to listen on. Use `0.0.0.0` to accept
+                requests from other machines.
+            port: Port to listen on.
+            ttl: Seconds after which cached entries are revalidated
+                against the upstream. Use 0 to never revalidate.
+            allow: Comma-separated glob patterns of the urls which can
+                be requested, eg `"https://raw.githubusercontent.com/*"`.
+                Required: use `"*"` to allow any url, turning the server
+                into an open proxy.
+
+        .. seealso:: `drytoml.server`
+        """
+        patterns = [pattern for pattern in allow.split(",") if pattern]
+        if not patterns:
+            logger.error("Missing --allow: which urls can be requested?")
+            sys.exit(1)
+        settings.CACHE_TTL = ttl if ttl > 0 else None
+        # the server must fetch from the upstream, not from another proxy
+        settings.PROXY = ""
+        server = CacheServer((host, int(port)), patterns)
+        logger.warning("Serving %s on %s", paths.CACHE, server.url)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Stopped")
+        finally:
+            server.server_close()
+
+    @staticmethod
+    def pack(
+        *roots: str,
+        output: str = "drytoml-cache.tar.gz",
+        key: str = DEFAULT_EXTEND_KEY,
+    ) -> Dict[str, str]:
+        """Bundle the cache entries reachable from some toml files.
+
+        Args:
+            roots: Files whose (transitive) remote references should be
+                bundled. Defaults to `pyproject.toml`.
+            output: Destination of the compressed bundle.
+            key: Name to look for inside the files to activate
+                interpolation.
+
+        Returns:
+            Bundled url -> sha256 mapping.
+        """
+        urls = remote(dependencies(roots or ["pyproject.toml"], key))
+        missing = [url for url in urls if not cache_path(url).exists()]
+        if missing:
+            logger.error(
+                "Not cached (run `dry cache warm` first): %s",
+                ", ".join(sorted(map(str, missing))),
+            )
+            sys.exit(1)
+
+        entries = {}
+        with tarfile.open(output, "w:gz") as bundle:
+            for url in urls:
+                path = cache_path(url)
+                with open(path, "rb") as fp:
+                    content = fp.read()
+                entries[path.name] = {
+                    "url": str(url),
+                    "size": len(content),
+                    "sha256": hashlib.sha256(content).hexdigest(),
+                }
+                bundle.add(str(path), arcname=f"entries/{path.name}")
+
+            manifest = json.dumps({"version": 1, "entries": entries}).encode()
+            info = tarfile.TarInfo(MANIFEST)
+            info.size = len(manifest)
+            info.mtime = int(time.time())
+            bundle.addfile(info, io.BytesIO(manifest))
+
+        logger.info("Packed %s cache entries into %s", len(entries), output)
+        return {entry["url"]: entry["sha256"] for entry in entries.values()}
+
+    @staticmethod
+    def unpack(archive: str) -> Dict[str, str]:
+        """Restore a cache bundle created with `pack`.
+
+        Every entry is verified against the bundled hashes and staged
+        before touching the cache, and then moved into place with an
+        atomic rename, so readers never see partial contents. Index
+        metadata is recomputed locally, as if just fetched.
+
+        Args:
+            archive: Location of the bundle.
+
+        Raises:
+            ValueError: The bundle is malformed or corrupted.
+
+        Returns:
+            Restored url -> sha256 mapping.
+        """
+        cache = paths.CACHE
+        cache.mkdir(exist_ok=True, parents=True)
+        with tarfile.open(archive, "r:gz") as bundle, tempfile.TemporaryDirectory(
+            prefix=".unpack.", dir=str(cache)
+        ) as tmp:
+            entries = _manifest(archive, bundle)
+            for name, entry in entries.items():
+                member = bundle.extractfile(f"entries/{name}")
+                content = member.read() if member else b""
+                if (
+                    len(content) != entry["size"]
+                    or hashlib.sha256(content).hexdigest() != entry["sha256"]
+                ):
+                    raise ValueError(f"{archive}: Corrupted entry {name}")
+                with open(os.path.join(tmp, name), "wb") as fp:
+                    fp.write(content)
+
+            with CacheIndex.updating() as index:
+                for name, entry in entries.items():
+                    os.replace(os.path.join(tmp, name), str(cache / name))
+                    index.record_fetch(name, entry["url"], entry["size"])
+
+        logger.info("Unpacked %s cache entries into %s", len(entries), cache)
+        return {entry["url"]: entry["sha256"] for entry in entries.values()}
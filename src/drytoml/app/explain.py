@@ -1,4 +1,7 @@
 """This module contains the `explain` command and its required utilities."""
+import logging
+from typing import Optional
+
 from drytoml.parser import DEFAULT_EXTEND_KEY
 from drytoml.parser import Parser
 
@@ -6,14 +9,30 @@ from drytoml.parser import Parser
 def explain(
     file="pyproject.toml",
     key=DEFAULT_EXTEND_KEY,
-):
+    lookup="",
+) -> Optional[str]:
     """Show steps for toml transclusion.
 
     Args:
         file: TOML file to interpolate values.
         key: Name too look for inside the file to activate interpolation.
+        lookup: If set, only show where this dotted key (or every key
+            inside this table) comes from, and which values it shadows.
+
+    Returns:
+        The origins of `lookup`, if set.
 
     Example:
         >>> explain("isort.toml", "base")
+        >>> print(explain("pyproject.toml", lookup="tool.black.line-length"))
+        tool.black.line-length
+          uses 100 from /path/to/pyproject.toml (level 0)
+          shadows 79 from https://example.com/black.toml (level 1)
     """
-    Parser.from_file(file, extend_key=key).parse()
+    if lookup:
+        logging.basicConfig(level=60, format="%(message)s", force=True)
+    parser = Parser.from_file(file, extend_key=key)
+    parser.parse(provenance=bool(lookup))
+    if lookup:
+        return parser.provenance.explain(lookup)
+    return None
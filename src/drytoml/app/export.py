@@ -1,26 +1,62 @@
 """This module contains the `export` command and its required utilities."""
+
 import logging
+import sys
+from typing import Union
+
+import tomlkit
 
+from drytoml.formats import BINARY_FORMATS
+from drytoml.formats import dumps
 from drytoml.parser import DEFAULT_EXTEND_KEY
 from drytoml.parser import Parser
+from drytoml.parser import requires_transclusion
 
 
 def export(
     file="pyproject.toml",
     key=DEFAULT_EXTEND_KEY,
-) -> str:
+    format="toml",  # noqa: A002
+    output="",
+) -> Union[str, bytes, None]:
     """Generate resulting TOML after transclusion.
 
     Args:
         file: TOML file to transclude values.
         key: Name too look for inside the file to activate interpolation.
+        format: One of `toml`, `json`, `msgpack`, `pickle`. Use
+            `drytoml.formats.loads` to load non-toml outputs.
+        output: If set, write the result to this file instead. Use `-`
+            for stdout, eg to pipe binary formats from the cli.
 
     Returns:
-        The transcluded toml.
+        The transcluded toml, serialized with the requested format, or
+            `None` if it was written to `output`.
 
     Example:
         >>> toml = export("isort.toml", "base")
+        >>> data = export("pyproject.toml", format="msgpack")
     """
 
     logging.basicConfig(level=60, format="%(message)s", force=True)
-    return Parser.from_file(file, extend_key=key).parse().as_string()
+    with open(file) as fp:
+        raw = fp.read()
+    if not requires_transclusion(raw, key):
+        # nothing to transclude: avoid the round-trip through tomlkit
+        result = raw if format == "toml" else dumps(tomlkit.parse(raw), format)
+    else:
+        document = Parser(raw, extend_key=key, reference=file).parse()
+        result = dumps(document, format)
+
+    if not output:
+        return result
+
+    if output == "-":
+        stream = sys.stdout.buffer if format in BINARY_FORMATS else sys.stdout
+        stream.write(result)
+        stream.flush()
+    else:
+        mode = "wb" if format in BINARY_FORMATS else "w"
+        with open(output, mode) as fp:
+            fp.write(result)
+    return None
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""Write tool-native configuration files from a resolved document.
+
+Wrapped tools (see `drytoml.app.wrappers`) resolve the document on
+every run. Materialized files are resolved once, so tools (and their
+editor integrations) can read them natively, without drytoml:
+
+* `black`: `black.toml`, a standalone `[tool.black]` document (use it
+  with `black --config black.toml`).
+* `isort`: `.isort.cfg`, from `[tool.isort]`.
+* `pylint`: `.pylintrc`, from `[tool.pylint]`. Values outside a
+  sub-table go into the `MASTER` section.
+* `flake8`: The `[flake8]` section of `setup.cfg`, from `[tool.flake8]`.
+  Only that section is rewritten: the rest of `setup.cfg` (other
+  sections, comments, formatting) is kept as is.
+
+A stamp file records the sources involved in the resolution and the
+files written, so `dry materialize --check` can tell whether they are
+current by stat-ing them, without parsing nor fetching anything. Every
+file is replaced atomically.
+"""
+
+import configparser
+import hashlib
+import io
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+import tomlkit
+
+from drytoml import logger
+from drytoml.files import atomic_write
+from drytoml.formats import unwrap
+from drytoml.memo import fingerprint
+from drytoml.parser import DEFAULT_EXTEND_KEY
+from drytoml.parser import Parser
+from drytoml.parser import requires_transclusion
+
+STAMP_NAME = ".drytoml.stamp"
+"""Name of the stamp file, next to the materialized files."""
+
+SECTION = re.compile(r"\[(?P<name>[^]]+)\]")
+"""Header of an ini section, as recognized by `configparser`."""
+
+Sections = Dict[str, Dict[str, str]]
+
+
+def ini_value(value) -> str:
+    """Represent a toml value inside an ini file.
+
+    Args:
+        value: The (unwrapped) value.
+
+    Returns:
+        Lowercase booleans, comma-separated lists, or the value as is.
+
+    Examples:
+        >>> ini_value(["E501", "W503"])
+        'E501,W503'
+    """
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, list):
+        return ",".join(ini_value(item) for item in value)
+    return str(value)
+
+
+def ini_sections(table: dict, default: str) -> Sections:
+    """Split a toml table into ini sections.
+
+    Args:
+        table: The tool's table, eg `[tool.pylint]`.
+        default: Section for the values outside sub-tables.
+
+    Returns:
+        Section -> option -> value mapping.
+    """
+    sections: Sections = {}
+    for key, value in table.items():
+        if isinstance(value, dict):
+            options = sections.setdefault(key, {})
+            options.update((k, ini_value(v)) for k, v in value.items())
+        else:
+            sections.setdefault(default, {})[key] = ini_value(value)
+    return sections
+
+
+def render_ini(sections: Sections) -> str:
+    """Render ini sections.
+
+    Args:
+        sections: Section -> option -> value mapping.
+
+    Returns:
+        The contents of the ini file.
+    """
+    config = configparser.ConfigParser(interpolation=None)
+    config.optionxform = str
+    config.read_dict(sections)
+    stream = io.StringIO()
+    config.write(stream)
+    return stream.getvalue()
+
+
+def splice_ini(sections: Sections, existing: str) -> str:
+    """Replace some sections of an ini file, keeping the rest verbatim.
+
+    Each section spans from its header to the next one, except for the
+    comments and blank lines right before the next header, which belong
+    to it. Sections missing from the file are appended.
+
+    Args:
+        sections: Section -> option -> value mapping.
+        existing: Current contents of the file.
+
+    Returns:
+        The contents of the ini file.
+    """
+    lines = existing.splitlines(keepends=True)
+    headers = [
+        index
+        for index, line in enumerate(lines)
+        if line[:1] == "[" and SECTION.match(line.strip())
+    ]
+    spliced = lines[: headers[0]] if headers else lines
+    pending = dict(sections)
+    for start, end in zip(headers, [*headers[1:], len(lines)]):
+        name = SECTION.match(lines[start].strip()).group("name")
+        if name not in sections:
+            spliced.extend(lines[start:end])
+            continue
+        trailing = end
+        while trailing > start + 1 and (
+            not lines[trailing - 1].strip()
+            or lines[trailing - 1].lstrip()[:1] in "#;"
+        ):
+            trailing -= 1
+        if name in pending:
+            spliced.append(render_ini({name: pending.pop(name)}).rstrip())
+            spliced.append("\n")
+            separated = trailing < end and not lines[trailing].strip()
+            if end < len(lines) and not separated:
+                spliced.append("\n")
+        spliced.extend(lines[trailing:end])
+
+    contents = "".join(spliced)
+    if pending:
+        if contents and not contents.endswith("\n"):
+            contents += "\n"
+        if contents and not contents.endswith("\n\n"):
+            contents += "\n"
+        contents += render_ini(pending).rstrip() + "\n"
+    return contents
+
+
+def _black(table: dict, existing: str) -> str:
+    return tomlkit.dumps({"tool": {"black": table}})
+
+
+def _isort(table: dict, existing: str) -> str:
+    return render_ini(ini_sections(table, "settings"))
+
+
+def _pylint(table: dict, existing: str) -> str:
+    return render_ini(ini_sections(table, "MASTER"))
+
+
+def _flake8(table: dict, existing: str) -> str:
+    sections = {"flake8": ini_sections(table, "flake8").get("flake8", {})}
+    return splice_ini(sections, existing)
+
+
+class Target(NamedTuple):
+    """A tool-native configuration file."""
+
+    filename: str
+    """Name of the file, inside the output directory."""
+
+    render: Callable[[dict, str], str]
+    """Compute the contents of the file from the tool's table and the
+    current contents of the file."""
+
+
+TARGETS = {
+    "black": Target("black.toml", _black),
+    "isort": Target(".isort.cfg", _isort),
+    "pylint": Target(".pylintrc", _pylint),
+    "flake8": Target("setup.cfg", _flake8),
+}
+"""Supported tools, read from `[tool.<name>]`."""
+
+
+def digest(path: Path) -> Optional[str]:
+    """Hash the contents of a file.
+
+    Args:
+        path: The file.
+
+    Returns:
+        Hex sha256 of the contents, or `None` if missing.
+    """
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def _resolve(file: Path, key: str) -> Tuple[dict, List]:
+    with open(file) as fp:
+        raw = fp.read()
+    if not requires_transclusion(raw, key):
+        return unwrap(tomlkit.parse(raw)), [file]
+    parser = Parser(raw, extend_key=key, reference=file)
+    return unwrap(parser.parse()), parser.dependencies
+
+
+def stale(stamp: Path) -> List[str]:
+    """Explain why materialized files are not current.
+
+    Args:
+        stamp: The stamp file written by `materialize`.
+
+    Returns:
+        Reasons, empty if every file is current.
+    """
+    try:
+        with open(stamp) as fp:
+            recorded = json.load(fp)
+    except (OSError, ValueError):
+        return [f"Unable to read {stamp}"]
+
+    sources = dict(recorded["sources"])
+    reasons = [
+        f"{reference} changed"
+        for reference, signature in fingerprint(sources)
+        if sources[reference] != (signature and list(signature))
+    ]
+    reasons.extend(
+        f"{name} was modified"
+        for name, expected in recorded["outputs"].items()
+        if digest(stamp.parent / name) != expected
+    )
+    return reasons
+
+
+def materialize(
+    file="pyproject.toml",
+    key=DEFAULT_EXTEND_KEY,
+    tools: Union[str, Sequence[str]] = tuple(TARGETS),
+    directory="",
+    check=False,
+) -> Union[Dict[str, str], str]:
+    """Write tool-native configuration files from a resolved document.
+
+    Args:
+        file: TOML file to transclude values.
+        key: Name too look for inside the file to activate interpolation.
+        tools: Tools to write files for (see `TARGETS`), as a sequence
+            or a comma-separated string. Tools without a table in the
+            document are skipped.
+        directory: Where to write the files and the stamp. Defaults to
+            the directory of `file`.
+        check: Instead of writing anything, check if the files written
+            last time are still current. Exits with status 1 if not.
+
+    Raises:
+        ValueError: Unknown tool.
+
+    Returns:
+        Written file -> `written` or `unchanged` mapping, or the result
+            of the check.
+
+    Example:
+        >>> materialize("pyproject.toml", tools="black,isort")
+        >>> materialize(check=True)
+    """
+    source = Path(file).resolve()
+    output = Path(directory).resolve() if directory else source.parent
+    stamp = output / STAMP_NAME
+
+    if check:
+        reasons = stale(stamp)
+        if reasons:
+            logger.error("drytoml: Stale files: %s", "; ".join(reasons))
+            sys.exit(1)
+        return "up to date"
+
+    if isinstance(tools, str):
+        tools = tools.split(",")
+    unknown = sorted(set(tools) - set(TARGETS))
+    if unknown:
+        raise ValueError(f"Unknown tools {unknown}, use {list(TARGETS)}")
+
+    document, dependencies = _resolve(source, key)
+    result = {}
+    outputs = {}
+    for tool in tools:
+        table = document.get("tool", {}).get(tool)
+        if table is None:
+            logger.warning("drytoml: No [tool.%s] in %s", tool, source)
+            continue
+        target = TARGETS[tool]
+        path = output / target.filename
+        existing = path.read_text() if path.exists() else ""
+        contents = target.render(table, existing)
+        if contents == existing:
+            result[target.filename] = "unchanged"
+        else:
+            atomic_write(path, contents)
+            result[target.filename] = "written"
+        outputs[target.filename] = digest(path)
+
+    atomic_write(
+        stamp,
+        json.dumps(
+            {
+                "sources": fingerprint(dependencies),
+                "outputs": outputs,
+            },
+            indent=2,
+        ),
+    )
+    return result
@@ -13,7 +13,18 @@ from typing import Callable
 from typing import List
 from typing import Union
 
-from drytoml.parser import Parser
+from drytoml.loader import load
+from drytoml.parser import requires_transclusion
+from drytoml.profiling import phase
+
+ENTRYPOINTS = {
+    "black": "black:patched_main",
+    "isort": "isort.main:main",
+    "pylint": "pylint:run_pylint",
+    "flakehell": "flakehell:entrypoint",
+    "flake8helled": "flakehell:flake8_entrypoint",
+}
+"""Callable of each wrapped tool, in `import_callable` syntax."""
 
 
 def import_callable(string: str) -> Callable:
@@ -52,8 +63,11 @@ class Wrapper:
             self.virtual = virtual
             self.pre_import()
             self.pre_call()
-            tool_main = import_callable(importstr)
-            sys.exit(tool_main())
+            with phase("import"):
+                tool_main = import_callable(importstr)
+            with phase("tool"):
+                code = tool_main()
+            sys.exit(code)
 
     def pre_import(self):
         """Execute custom processing done before callback import."""
@@ -65,11 +79,22 @@ class Wrapper:
     def tmp_dump(self):
         """Yield a temporary file with the configuration toml contents.
 
+        Files without transclusions are used directly, skipping the
+        parse and the temporary copy. Others are resolved through
+        `drytoml.loader.load`, so processes which resolved the file
+        before (eg a forked `drytoml.app.zygote`) reuse the result.
+
         Yields:
             Temporary file with the configuration toml contents
         """
-        parser = Parser.from_file(self.cfg)
-        document = parser.parse()
+        with open(self.cfg) as fp:
+            raw = fp.read()
+            if not requires_transclusion(raw):
+                fp.seek(0)
+                yield fp
+                return
+
+        document = load(self.cfg)
 
         # ensure locally referenced files work
         path = Path(self.cfg)
@@ -156,29 +181,29 @@ class Cli(Wrapper):
 
 def black():
     """Execute black, configured with custom setting cli flag."""
-    Cli(["--config"])("black:patched_main")
+    Cli(["--config"])(ENTRYPOINTS["black"])
 
 
 def isort():
     """Execute isort, configured with custom setting cli flag."""
     Cli(["--sp", "--settings-path", "--settings-file", "--settings"])(
-        "isort.main:main"
+        ENTRYPOINTS["isort"]
     )
 
 
 def pylint():
     """Execute pylint, configured with custom setting cli flag."""
-    Cli(["--rcfile"])("pylint:run_pylint")
+    Cli(["--rcfile"])(ENTRYPOINTS["pylint"])
 
 
 def flakehell():
     """Execute flakehell, configured with custom env var."""
-    Env(["FLAKEHELL_TOML", "PYLINTRC"])("flakehell:entrypoint")
+    Env(["FLAKEHELL_TOML", "PYLINTRC"])(ENTRYPOINTS["flakehell"])
 
 
 def flake8helled():
     """Execute flake8helled, configured with custom env var."""
-    Env(["FLAKEHELL_TOML", "PYLINTRC"])("flakehell:flake8_entrypoint")
+    Env(["FLAKEHELL_TOML", "PYLINTRC"])(ENTRYPOINTS["flake8helled"])
 
 
 def check():
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""Run wrapped tools from a warm, forking process (unix only).
+
+Most of the time of a `dry pylint` invocation goes into starting python
+and importing the tool. A zygote is a long-running process which has
+already imported the tools and resolved the configuration files:
+
+.. code-block:: console
+
+   $ dry zygote --socket /tmp/drytoml.sock &
+   $ export DRYTOML_ZYGOTE=/tmp/drytoml.sock
+   $ dry pylint src  # forked from the zygote
+
+When `drytoml.settings.ZYGOTE` is set, wrapped tools send their argv,
+working directory, environment, resource limits (see `drytoml.budget`),
+profiling destination and standard streams (as file descriptors,
+through the unix socket) to the zygote. It acknowledges the request,
+forks a child which runs the tool as if it was the invoking process,
+and relays its exit status. If the zygote is unreachable, or rejects
+the request, tools run in-process. Once accepted, tools never run
+in-process: if the zygote fails meanwhile, the invocation fails.
+
+Children inherit drytoml's configuration (`drytoml.settings`, the cache
+location) from the zygote, so requests configuring drytoml differently
+(see `CONFIG_ENV`) are rejected.
+
+The socket is only accessible by its owner: any client can run
+arbitrary code as the user running the zygote.
+"""
+
+import array
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import traceback
+from pathlib import Path
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+from drytoml import budget
+from drytoml import index
+from drytoml import logger
+from drytoml import metrics
+from drytoml import settings
+from drytoml.app.wrappers import ENTRYPOINTS
+from drytoml.app.wrappers import import_callable
+from drytoml.loader import RESOLVED
+from drytoml.loader import load
+from drytoml.merge import LAYERS
+from drytoml.profiling import profiled
+
+STREAMS = 3
+"""Number of file descriptors sent by clients: stdin, stdout, stderr."""
+
+ACCEPTED = b'{"accepted": true}\n'
+"""Sent by the zygote before forking a child for a request."""
+
+CONFIG_ENV = ("DRYTOML_", "XDG_")
+"""Prefixes of the env vars read by drytoml when imported (along with
+HOME)."""
+
+IGNORED_ENV = ("DRYTOML_ZYGOTE",)
+"""Env vars which may differ between the zygote and its clients."""
+
+
+def config_env(env: Dict[str, str]) -> Dict[str, str]:
+    """Select the env vars which configure drytoml.
+
+    Args:
+        env: Environment, eg `os.environ`.
+
+    Returns:
+        HOME, and the vars starting with any of `CONFIG_ENV`, except
+            `IGNORED_ENV`.
+    """
+    return {
+        name: value
+        for name, value in env.items()
+        if (name == "HOME" or name.startswith(CONFIG_ENV))
+        and name not in IGNORED_ENV
+    }
+
+
+def _read_line(conn: socket.socket, data: bytes = b"") -> bytes:
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(65536)
+        if not chunk:
+            raise ConnectionError("drytoml: Connection closed")
+        data += chunk
+    return data
+
+
+def exit_code(status: int) -> int:
+    """Convert a `waitpid` status into a shell-like exit code.
+
+    Args:
+        status: As returned by `os.waitpid`.
+
+    Returns:
+        The exit code, or 128 + the signal number if the process was
+            killed by a signal.
+    """
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def delegate(
+    tool: str,
+    argv: List[str],
+    path: Union[str, Path, None] = None,
+    fds: Sequence[int] = (0, 1, 2),
+    limits: Optional[budget.Budget] = None,
+    profile: str = "",
+) -> Optional[int]:
+    """Run a wrapped tool inside a zygote.
+
+    Args:
+        tool: Name of the wrapped tool, eg `pylint`.
+        argv: Arguments for the tool, including its name.
+        path: Location of the zygote socket. Defaults to
+            `drytoml.settings.ZYGOTE`.
+        fds: Standard input, output and error for the tool.
+        limits: Limits of the resolutions of the tool (see
+            `drytoml.budget.defaults`). Defaults to the configured ones.
+        profile: Destination of the profiling reports of the tool (see
+            `drytoml.profiling.profiled`), if set.
+
+    Returns:
+        The exit code of the tool (1 if the zygote failed after
+            accepting the request), or `None` if the zygote is not
+            available or rejected the request (and the tool must run
+            in-process).
+    """
+    path = path or settings.ZYGOTE
+    limits = budget.configured() if limits is None else limits
+    request = {
+        "tool": tool,
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "env": dict(os.environ),
+        "log_level": logging.root.level,
+        "limits": limits.export(),
+        "profile": os.path.abspath(profile) if profile else "",
+    }
+    payload = json.dumps(request).encode("utf-8") + b"\n"
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(str(path))
+    except OSError as exc:
+        conn.close()
+        logger.debug("drytoml: Zygote unavailable at %s (%s)", path, exc)
+        return None
+
+    rights = (socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))
+    with conn, conn.makefile("rb") as responses:
+        try:
+            sent = conn.sendmsg([payload], [rights])
+            if sent < len(payload):
+                conn.sendall(payload[sent:])
+            accepted = responses.readline() == ACCEPTED
+        except OSError as exc:
+            accepted = False
+            logger.debug("drytoml: Zygote at %s failed (%s)", path, exc)
+        if not accepted:
+            logger.debug("drytoml: Zygote at %s rejected %s", path, tool)
+            return None
+
+        # the tool is running: running it again would race with it
+        try:
+            return int(json.loads(responses.readline())["code"])
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            logger.error("drytoml: Zygote at %s failed (%s)", path, exc)
+            return 1
+
+
+class Zygote:
+    """Fork wrapped tools from a process where they are already imported."""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        tools: Dict[str, Callable],
+        configs: Sequence[Union[str, Path]] = (),
+    ):
+        """Prepare a zygote.
+
+        Args:
+            path: Location of the unix socket to listen on.
+            tools: Name -> wrapper command (see `drytoml.app.WRAPPERS`)
+                of the tools which can be run.
+            configs: Files to keep resolved in memory. Children inherit
+                them, so they only resolve other files.
+        """
+        self.path = Path(path)
+        self.tools = tools
+        self.configs = [Path(config).resolve() for config in configs]
+        self.env = config_env(os.environ)
+        self.children: Dict[int, socket.socket] = {}
+        self.listener: Optional[socket.socket] = None
+
+    def warm(self):
+        """Import the tools, and resolve the configuration files."""
+        for name in self.tools:
+            try:
+                import_callable(ENTRYPOINTS[name])
+            except ImportError as exc:
+                logger.warning("drytoml: Unable to import %s (%s)", name, exc)
+        self.refresh()
+
+    def refresh(self):
+        """Resolve the configuration files which changed since last time.
+
+        Resolutions are memoized by `drytoml.loader.load`, so unchanged
+        files cost a few `stat` calls.
+        """
+        for config in self.configs:
+            try:
+                load(config)
+            except Exception as exc:  # noqa: B902
+                logger.warning(
+                    "drytoml: Unable to resolve %s: %s", config, exc
+                )
+
+    def serve_forever(self):
+        """Accept and run requests, until interrupted.
+
+        Must run in the main thread, to be notified of finished children.
+        """
+        self.warm()
+        if self.path.exists():
+            self.path.unlink()
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        previous = os.umask(0o177)
+        try:
+            self.listener.bind(str(self.path))
+        finally:
+            os.umask(previous)
+        self.listener.listen()
+
+        wakeup, notify = os.pipe()
+        os.set_blocking(wakeup, False)
+        os.set_blocking(notify, False)
+        signal.set_wakeup_fd(notify)
+        signal.signal(signal.SIGCHLD, lambda *args: None)
+        # stop (and remove the socket) on SIGTERM as on ctrl-c
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        logger.warning("drytoml: Zygote listening on %s", self.path)
+        try:
+            while True:
+                readable, __, __ = select.select(
+                    [self.listener, wakeup], [], []
+                )
+                if wakeup in readable:
+                    while True:
+                        try:
+                            os.read(wakeup, 512)
+                        except BlockingIOError:
+                            break
+                    self.reap()
+                if self.listener in readable:
+                    conn, __ = self.listener.accept()
+                    self.handle(conn)
+        finally:
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.close(wakeup)
+            os.close(notify)
+            self.listener.close()
+            self.path.unlink()
+
+    def _receive(self, conn: socket.socket) -> Tuple[dict, List[int]]:
+        fds = array.array("i")
+        data, ancillary, __, __ = conn.recvmsg(
+            65536, socket.CMSG_LEN(STREAMS * fds.itemsize)
+        )
+        for level, kind, raw in ancillary:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                fds.frombytes(raw[: len(raw) - len(raw) % fds.itemsize])
+        request = json.loads(_read_line(conn, data))
+        return request, list(fds)
+
+    def handle(self, conn: socket.socket):
+        """Fork a child to run a request.
+
+        Args:
+            conn: Connection with the client.
+        """
+        fds: List[int] = []
+        try:
+            request, fds = self._receive(conn)
+            if len(fds) != STREAMS or request["tool"] not in self.tools:
+                raise ValueError(f"Invalid request for {request['tool']}")
+            if config_env(request["env"]) != self.env:
+                raise ValueError("drytoml is configured differently")
+            budget.Budget(**request["limits"])
+            if not isinstance(request["profile"], str):
+                raise ValueError("Invalid profiling destination")
+            conn.sendall(ACCEPTED)
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            logger.error("drytoml: Rejected request (%s)", exc)
+            for fd in fds:
+                os.close(fd)
+            conn.close()
+            return
+
+        self.refresh()
+        # children flush their own records (see `_child`): don't let
+        # them inherit, and flush again, the zygote's
+        metrics.flush()
+        index.flush()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if not pid:
+            self._child(request, fds, conn)
+        for fd in fds:
+            os.close(fd)
+        self.children[pid] = conn
+
+    def _child(self, request: dict, fds: List[int], conn: socket.socket):
+        code = 1
+        try:
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            self.listener.close()
+            conn.close()
+            for target, fd in enumerate(fds):
+                os.dup2(fd, target)
+                os.close(fd)
+            os.chdir(request["cwd"])
+            os.environ.clear()
+            os.environ.update(request["env"])
+            sys.argv = request["argv"]
+            logging.root.setLevel(request["log_level"])
+            limits = budget.Budget(**request["limits"])
+            if limits.export() != budget.configured().export():
+                # inherited resolutions were only checked against the
+                # zygote's limits
+                RESOLVED.clear()
+                LAYERS.clear()
+            try:
+                with profiled(request["profile"]), budget.defaults(limits):
+                    self.tools[request["tool"]]()
+                code = 0
+            except SystemExit as exc:
+                code = exc.code
+                if code is None:
+                    code = 0
+                elif not isinstance(code, int):
+                    sys.stderr.write(f"{code}\n")
+                    code = 1
+        except BaseException:  # noqa: B902
+            traceback.print_exc()
+        finally:
+            # os._exit skips the atexit handlers
+            metrics.flush()
+            index.flush()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)  # noqa: W0212
+
+    def reap(self):
+        """Relay the exit code of every finished child to its client."""
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            conn = self.children.pop(pid, None)
+            if conn is None:
+                continue
+            with conn:
+                try:
+                    conn.sendall(
+                        json.dumps({"code": exit_code(status)}).encode()
+                        + b"\n"
+                    )
+                except OSError as exc:
+                    logger.debug("drytoml: Client of %s left (%s)", pid, exc)
+
+
+def zygote(
+    socket="",  # noqa: W0621
+    tools: Union[str, Sequence[str]] = tuple(ENTRYPOINTS),
+    config: Union[str, Sequence[str]] = "pyproject.toml",
+):
+    """Serve wrapped tools from a warm process (see `drytoml.app.zygote`).
+
+    Args:
+        socket: Location of the unix socket to listen on. Defaults to
+            `drytoml.settings.ZYGOTE`.
+        tools: Tools to import (see `ENTRYPOINTS`), as a sequence or a
+            comma-separated string. Tools which are not installed are
+            skipped.
+        config: Configuration files to keep resolved in memory, as a
+            sequence or a comma-separated string.
+
+    Raises:
+        ValueError: No socket, or unknown tools.
+    """
+    from drytoml.app import WRAPPERS  # noqa: C0415
+
+    path = socket or settings.ZYGOTE
+    if not path:
+        raise ValueError("Set DRYTOML_ZYGOTE or use --socket")
+    if isinstance(tools, str):
+        tools = tools.split(",")
+    unknown = sorted(set(tools) - set(ENTRYPOINTS))
+    if unknown:
+        raise ValueError(f"Unknown tools {unknown}, use {list(ENTRYPOINTS)}")
+    if isinstance(config, str):
+        config = config.split(",")
+
+    server = Zygote(
+        path,
+        {name: WRAPPERS[name] for name in tools},
+        [path for path in config if Path(path).exists()],
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.warning("drytoml: Zygote stopped")
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""Bound the resources spent resolving a document.
+
+Resolving a third-party document can trigger arbitrary work: a single
+huge base, a deep inheritance chain, a base fanning out to thousands of
+references, or bases extending the same arrays over and over. A
+`Budget` caps every dimension of a resolution:
+
+* `max_bytes`: Total size of the documents read (files, urls and git
+  references), checked while downloading so a huge response is never
+  buffered whole.
+* `max_references`: Number of referenced documents.
+* `max_depth`: Length of the inheritance chain.
+* `max_values`: Number of values (including array items) materialized
+  by the resolution: the values of every document read, plus the ones
+  copied when a layer is merged more than once. Merging only moves
+  values, so this bounds every merged document, without counting them
+  again after each merge.
+* `seconds`: Wall time of each resolution, enforced through
+  `drytoml.utils.deadline`.
+
+Every resolution gets a fresh budget, with the limits of
+`drytoml.settings`, or the ones set by `defaults` (eg the cli flags of
+an invocation). A budget can also be shared by several resolutions with
+`limits`. Exceeding any limit raises `BudgetExceeded`.
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Any
+from typing import Dict
+from typing import Optional
+
+from drytoml import settings
+
+_active = threading.local()
+
+DEFAULTS: Optional["Budget"] = None
+"""Limits of the budgets created by `configured`, set by `defaults`."""
+
+
+class BudgetExceeded(RuntimeError):
+    """A resolution exceeded one of its resource limits."""
+
+
+class Budget:
+    """Thread-safe resource limits, shared by a whole resolution."""
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        max_references: Optional[int] = None,
+        max_depth: Optional[int] = None,
+        max_values: Optional[int] = None,
+        seconds: Optional[float] = None,
+    ):
+        """Construct a budget. `None` means no limit.
+
+        Args:
+            max_bytes: Maximum total size of the documents read.
+            max_references: Maximum number of referenced documents.
+            max_depth: Maximum length of the inheritance chain.
+            max_values: Maximum number of values materialized.
+            seconds: Maximum wall time.
+        """
+        self.max_bytes = max_bytes
+        self.max_references = max_references
+        self.max_depth = max_depth
+        self.max_values = max_values
+        self.seconds = seconds
+        self.bytes_read = 0
+        self.references = 0
+        self.values = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, **overrides) -> "Budget":
+        """Construct a budget using the configured limits.
+
+        Args:
+            overrides: Limits to use instead of `drytoml.settings`, as
+                in `Budget`.
+
+        Returns:
+            The budget.
+        """
+        limits = {
+            "max_bytes": settings.MAX_BYTES,
+            "max_references": settings.MAX_REFERENCES,
+            "max_depth": settings.MAX_DEPTH,
+            "max_values": settings.MAX_VALUES,
+            "seconds": settings.DEADLINE,
+        }
+        limits.update(overrides)
+        return cls(**limits)
+
+    def export(self) -> Dict[str, Optional[float]]:
+        """Describe the limits, eg to send them to another process.
+
+        Returns:
+            Keyword arguments constructing a fresh budget with the same
+                limits.
+        """
+        return {
+            "max_bytes": self.max_bytes,
+            "max_references": self.max_references,
+            "max_depth": self.max_depth,
+            "max_values": self.max_values,
+            "seconds": self.seconds,
+        }
+
+    def fresh(self) -> "Budget":
+        """Construct a budget with the same limits, and nothing spent.
+
+        Returns:
+            The new budget.
+        """
+        return type(self)(**self.export())
+
+    def __repr__(self) -> str:
+        """Show the limits and the current usage.
+
+        Returns:
+            A string of the form ``Budget(bytes=10/1000, ...)``.
+        """
+        return (
+            "Budget(bytes={}/{}, references={}/{}, values={}/{}, "
+            "max_depth={}, seconds={})".format(
+                self.bytes_read,
+                self.max_bytes,
+                self.references,
+                self.max_references,
+                self.values,
+                self.max_values,
+                self.max_depth,
+                self.seconds,
+            )
+        )
+
+    def remaining_bytes(self) -> Optional[int]:
+        """Compute how many bytes can still be read.
+
+        Returns:
+            Bytes left, or `None` if there is no limit.
+        """
+        if self.max_bytes is None:
+            return None
+        return max(0, self.max_bytes - self.bytes_read)
+
+    def check_download(self, url, size: int):
+        """Check the size of a (partial) response, before using it.
+
+        Args:
+            url: Source of the response.
+            size: Bytes received so far.
+
+        Raises:
+            BudgetExceeded: The response does not fit in the budget.
+        """
+        left = self.remaining_bytes()
+        if left is not None and size > left:
+            raise BudgetExceeded(
+                f"drytoml: {url} exceeds the remaining byte budget"
+                f" ({left} of {self.max_bytes} bytes)"
+            )
+
+    def read(self, reference, size: int):
+        """Charge a document read.
+
+        Args:
+            reference: Source of the document.
+            size: Bytes read.
+
+        Raises:
+            BudgetExceeded: Too many bytes read.
+        """
+        with self._lock:
+            self.bytes_read += size
+            total = self.bytes_read
+        if self.max_bytes is not None and total > self.max_bytes:
+            raise BudgetExceeded(
+                f"drytoml: Reading {reference} exceeds the byte budget"
+                f" ({total} > {self.max_bytes} bytes)"
+            )
+
+    def depth(self, reference, level: int):
+        """Check the depth of a document in its inheritance chain.
+
+        Args:
+            reference: The located reference.
+            level: Its depth in the inheritance chain.
+
+        Raises:
+            BudgetExceeded: Too deep.
+        """
+        if self.max_depth is not None and level > self.max_depth:
+            raise BudgetExceeded(
+                f"drytoml: {reference} exceeds the depth budget"
+                f" ({level} > {self.max_depth} levels)"
+            )
+
+    def reference(self, reference, level: int):
+        """Charge a referenced document, before fetching it.
+
+        Args:
+            reference: The located reference.
+            level: Its depth in the inheritance chain.
+
+        Raises:
+            BudgetExceeded: Too many references, or too deep.
+        """
+        self.depth(reference, level)
+        with self._lock:
+            self.references += 1
+            total = self.references
+        if self.max_references is not None and total > self.max_references:
+            raise BudgetExceeded(
+                f"drytoml: {reference} exceeds the reference budget"
+                f" ({total} > {self.max_references} references)"
+            )
+
+    def materialized(self, reference, document: Any):
+        """Charge the values of a document read or copied.
+
+        Args:
+            reference: Source of the document.
+            document: The document, or any of its values.
+
+        Raises:
+            BudgetExceeded: Too many values.
+        """
+        if self.max_values is None:
+            return
+        left = max(0, self.max_values - self.values)
+        count = count_values(document, left)
+        with self._lock:
+            self.values += count
+            total = self.values
+        if total > self.max_values:
+            raise BudgetExceeded(
+                f"drytoml: {reference} exceeds the value budget"
+                f" (more than {self.max_values} values)"
+            )
+
+
+def count_values(item: Any, limit: Optional[int] = None) -> int:
+    """Count the values of a document, including array items.
+
+    Args:
+        item: The document, or any of its values.
+        limit: Stop counting once this many values are found.
+
+    Returns:
+        Number of non-container values, at most `limit` + 1.
+    """
+    count = 0
+    pending = [item]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, dict):
+            pending.extend(value.values())
+        elif isinstance(value, list):
+            pending.extend(value)
+        else:
+            count += 1
+            if limit is not None and count > limit:
+                break
+    return count
+
+
+def active() -> Optional[Budget]:
+    """Retrieve the budget installed by `limits`, if any.
+
+    Returns:
+        The active budget, or `None`.
+    """
+    return getattr(_active, "budget", None)
+
+
+def current() -> Budget:
+    """Retrieve the budget of the resolution in progress.
+
+    Returns:
+        The active budget, or an unlimited one outside `limits`.
+    """
+    budget = active()
+    return Budget() if budget is None else budget
+
+
+def configured() -> Budget:
+    """Construct a budget for a new resolution.
+
+    Returns:
+        A fresh budget, with the limits set by `defaults` or, outside
+            it, `drytoml.settings`.
+    """
+    template = DEFAULTS
+    if template is None:
+        return Budget.from_settings()
+    return template.fresh()
+
+
+@contextmanager
+def defaults(template: Budget):
+    """Set the limits of the budgets created inside this context.
+
+    Unlike `limits`, this applies to every thread, and each resolution
+    still gets its own budget (see `configured`).
+
+    Args:
+        template: The limits. Its usage is ignored.
+
+    Yields:
+        The template.
+
+    Examples:
+        >>> with defaults(Budget.from_settings(max_depth=5)):
+        ...     Parser.from_file("pyproject.toml").parse()
+    """
+    global DEFAULTS  # noqa: W0603
+    previous = DEFAULTS
+    DEFAULTS = template
+    try:
+        yield template
+    finally:
+        DEFAULTS = previous
+
+
+@contextmanager
+def limits(budget: Optional[Budget] = None):
+    """Share a budget among the resolutions inside this context.
+
+    Nested contexts keep the outermost budget. The budget is only active
+    in the current thread: threads working for the same resolution must
+    enter `limits` with it explicitly.
+
+    Args:
+        budget: The limits. Defaults to `configured`.
+
+    Yields:
+        The active budget.
+
+    Examples:
+        >>> with limits(Budget(max_bytes=2 ** 20, max_references=50)):
+        ...     Parser.from_file("a.toml").parse()
+        ...     Parser.from_file("b.toml").parse()
+    """
+    previous = active()
+    if previous is not None:
+        yield previous
+        return
+    if budget is None:
+        budget = configured()
+    _active.budget = budget
+    try:
+        yield budget
+    finally:
+        _active.budget = None
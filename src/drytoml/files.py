@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Process-safe file operations for drytoml's cache."""
+
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict
+from typing import Optional
+from typing import Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows
+    fcntl = None
+    import msvcrt
+
+from drytoml import paths
+
+LOCKS_DIR = "locks"
+"""Name of the directory holding lock files, inside the cache."""
+
+
+class LockTimeout(TimeoutError):
+    """Unable to acquire a lock in time."""
+
+
+def _umask() -> int:
+    # the umask can only be read by changing it: do it once, at import
+    # time, when no other thread can be creating files
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+UMASK = _umask()
+"""File mode creation mask of the process, applied by `atomic_write`."""
+
+_thread_locks: Dict[str, threading.Lock] = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(name: str) -> threading.Lock:
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(name, threading.Lock())
+
+
+def _try_lock(fp) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:  # pragma: no cover - windows
+            msvcrt.locking(fp.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(fp):
+    if fcntl is not None:
+        fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+    else:  # pragma: no cover - windows
+        msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _is_current(fp, path: Path) -> bool:
+    # lock files may be removed by their holder (see `remove_lock`): a
+    # lock acquired on a removed file excludes nobody, so start over
+    try:
+        current = os.stat(str(path))
+    except FileNotFoundError:
+        return False
+    opened = os.fstat(fp.fileno())
+    return (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino)
+
+
+@contextmanager
+def locked(name: str, timeout: Optional[float] = None):
+    """Hold an exclusive lock, shared across processes and threads.
+
+    Args:
+        name: Identifier of the lock, eg a cache key.
+        timeout: Maximum seconds to wait for the lock. Wait forever if
+            `None`.
+
+    Yields:
+        Path to the lock file.
+
+    Raises:
+        LockTimeout: Unable to acquire the lock in time.
+    """
+    directory = paths.CACHE / LOCKS_DIR
+    directory.mkdir(exist_ok=True, parents=True)
+    path = directory / f"{name}.lock"
+    expires = None if timeout is None else time.monotonic() + timeout
+
+    # flock is per open file description, so threads in the same process
+    # must be serialized separately
+    thread_lock = _thread_lock(str(path))
+    if not thread_lock.acquire(timeout=-1 if timeout is None else timeout):
+        raise LockTimeout(f"drytoml: Timed out waiting for {path}")
+    try:
+        delay = 0.001
+        while True:
+            with open(path, "a+") as fp:
+                while not _try_lock(fp):
+                    if (
+                        expires is not None
+                        and time.monotonic() + delay > expires
+                    ):
+                        raise LockTimeout(
+                            f"drytoml: Timed out waiting for {path}"
+                        )
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.05)
+                if _is_current(fp, path):
+                    try:
+                        yield path
+                    finally:
+                        _unlock(fp)
+                    return
+                _unlock(fp)
+    finally:
+        thread_lock.release()
+
+
+def remove_lock(path: Path):
+    """Remove a lock file, eg once its cache entry is gone.
+
+    Must be called while holding the lock (see `locked`): processes
+    waiting for it then lock a new file instead.
+
+    Args:
+        path: The lock file, as yielded by `locked`.
+    """
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def atomic_write(path: Union[str, Path], content: Union[str, bytes]):
+    """Write a file so readers see either old or new contents, entirely.
+
+    The file gets the permissions of a regular `open`, according to the
+    umask (temporary files are private otherwise).
+
+    Args:
+        path: Destination file.
+        content: What to write.
+    """
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    mode = "wb" if isinstance(content, bytes) else "w"
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, mode) as fp:
+            fp.write(content)
+            if hasattr(os, "fchmod"):
+                os.fchmod(fp.fileno(), 0o666 & ~UMASK)
+        os.replace(tmp, str(path))
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Serialize resolved documents into formats which are cheap to load.
+
+TOML datetimes, dates and times are not supported by json nor msgpack,
+so they are tagged on dump and restored on load. Use `loads` from this
+module to get back exactly the same data as the resolved document.
+"""
+
+import json
+import pickle  # noqa: S403
+from datetime import date
+from datetime import datetime
+from datetime import time
+from typing import Any
+from typing import Union
+
+import tomlkit
+from tomlkit.toml_document import TOMLDocument
+
+FORMATS = ("toml", "json", "msgpack", "pickle")
+"""Supported output formats."""
+
+BINARY_FORMATS = ("msgpack", "pickle")
+"""Formats which produce bytes instead of text."""
+
+JSON_TAG = "__toml_type__"
+"""Key marking a tagged value in json outputs."""
+
+MSGPACK_EXT = {datetime: 1, date: 2, time: 3}
+"""Msgpack extension codes for each TOML temporal type."""
+
+
+def unwrap(item: Any) -> Any:
+    """Convert tomlkit containers and items into plain python objects.
+
+    Args:
+        item: The tomlkit object, eg a `TOMLDocument`.
+
+    Returns:
+        Nested dicts and lists, with native scalars.
+    """
+    if isinstance(item, dict):
+        return {str(key): unwrap(value) for key, value in item.items()}
+    if isinstance(item, list):
+        return [unwrap(value) for value in item]
+    if isinstance(item, bool):
+        return bool(item)
+    if isinstance(item, datetime):
+        return datetime(
+            item.year,
+            item.month,
+            item.day,
+            item.hour,
+            item.minute,
+            item.second,
+            item.microsecond,
+            item.tzinfo,
+        )
+    if isinstance(item, date):
+        return date(item.year, item.month, item.day)
+    if isinstance(item, time):
+        return time(item.hour, item.minute, item.second, item.microsecond)
+    for native in (str, int, float):
+        if isinstance(item, native):
+            return native(item)
+    return item
+
+
+def _temporal_type(value: Any):
+    # datetime is a subclass of date, so it must be checked first
+    for kind in MSGPACK_EXT:
+        if isinstance(value, kind):
+            return kind
+    return None
+
+
+def _parse_temporal(raw: str) -> Any:
+    # isoformat is valid toml, parse it as such (`fromisoformat` is not
+    # available in every supported python version)
+    return unwrap(tomlkit.parse(f"value = {raw}")["value"])
+
+
+def _json_default(value: Any) -> dict:
+    kind = _temporal_type(value)
+    if kind is None:
+        raise TypeError(f"Unable to serialize {type(value)}")
+    return {JSON_TAG: kind.__name__, "value": value.isoformat()}
+
+
+def _json_hook(dct: dict) -> Any:
+    if JSON_TAG in dct and set(dct) == {JSON_TAG, "value"}:
+        return _parse_temporal(dct["value"])
+    return dct
+
+
+def _msgpack():
+    try:
+        import msgpack  # noqa: C0415
+    except ImportError as exc:
+        raise ImportError(
+            "msgpack format requires msgpack. Run `pip install msgpack`"
+        ) from exc
+    return msgpack
+
+
+def _msgpack_default(value: Any):
+    kind = _temporal_type(value)
+    if kind is None:
+        raise TypeError(f"Unable to serialize {type(value)}")
+    return _msgpack().ExtType(
+        MSGPACK_EXT[kind],
+        value.isoformat().encode("utf-8"),
+    )
+
+
+def _msgpack_hook(code: int, data: bytes) -> Any:
+    if code in MSGPACK_EXT.values():
+        return _parse_temporal(data.decode("utf-8"))
+    return _msgpack().ExtType(code, data)
+
+
+def dumps(document: TOMLDocument, fmt: str = "toml") -> Union[str, bytes]:
+    """Serialize a resolved document.
+
+    Args:
+        document: The resolved document.
+        fmt: One of `FORMATS`.
+
+    Raises:
+        ValueError: Unknown format.
+
+    Returns:
+        The serialized document, as bytes for `BINARY_FORMATS`.
+
+    Examples:
+        >>> document = Parser.from_file("pyproject.toml").parse()
+        >>> loads(dumps(document, "json"), "json") == unwrap(document)
+        True
+    """
+    if fmt == "toml":
+        return document.as_string()
+    data = unwrap(document)
+    if fmt == "json":
+        return json.dumps(data, default=_json_default)
+    if fmt == "msgpack":
+        return _msgpack().packb(data, default=_msgpack_default)
+    if fmt == "pickle":
+        return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    raise ValueError(f"Unknown format '{fmt}'. Use one of {FORMATS}")
+
+
+def loads(data: Union[str, bytes], fmt: str) -> Any:
+    """Load a document serialized with `dumps`.
+
+    Args:
+        data: The serialized document.
+        fmt: One of `FORMATS`.
+
+    Raises:
+        ValueError: Unknown format.
+
+    Returns:
+        Plain python data, with TOML temporal types restored.
+    """
+    if fmt == "toml":
+        return tomlkit.parse(data)
+    if fmt == "json":
+        return json.loads(data, object_hook=_json_hook)
+    if fmt == "msgpack":
+        return _msgpack().unpackb(data, raw=False, ext_hook=_msgpack_hook)
+    if fmt == "pickle":
+        return pickle.loads(data)  # noqa: S301
+    raise ValueError(f"Unknown format '{fmt}'. Use one of {FORMATS}")
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""Immutable, interned representation of resolved documents.
+
+Processes holding many resolved documents (eg a daemon serving a whole
+monorepo) would otherwise keep a separate copy of every shared base. A
+frozen document is made of `FrozenDict` tables and tuples, and each
+distinct subtree is stored once per `Interner`: projects extending the
+same base reference the very same objects. Overriding a value with
+`evolve` copies only the tables along the modified path.
+"""
+
+import datetime
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any
+from typing import Iterator
+from typing import Optional
+from typing import Sequence
+from typing import Union
+
+from drytoml import settings
+from drytoml.formats import unwrap
+
+
+class FrozenDict(Mapping):
+    """Immutable, hashable mapping."""
+
+    __slots__ = ("_data", "_hash")
+
+    def __init__(self, *args, **kwargs):
+        """Construct a mapping, with the same signature as `dict`.
+
+        Args:
+            args: Positional arguments for `dict`.
+            kwargs: Keyword arguments for `dict`.
+        """
+        self._data = dict(*args, **kwargs)
+        self._hash = None
+
+    def __getitem__(self, key: str) -> Any:
+        """Retrieve a value.
+
+        Args:
+            key: The key to look for.
+
+        Returns:
+            The stored value.
+        """
+        return self._data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the keys.
+
+        Returns:
+            An iterator over the keys, in insertion order.
+        """
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        """Count the keys.
+
+        Returns:
+            Number of keys.
+        """
+        return len(self._data)
+
+    def __hash__(self) -> int:
+        """Compute (once) a hash based on the contents.
+
+        Returns:
+            The hash.
+        """
+        if self._hash is None:
+            self._hash = hash(frozenset(self._data.items()))
+        return self._hash
+
+    def __repr__(self) -> str:
+        """Represent the mapping like a dict.
+
+        Returns:
+            A string of the form ``FrozenDict({...})``.
+        """
+        return f"FrozenDict({self._data!r})"
+
+    def __reduce__(self):
+        """Support pickling.
+
+        Returns:
+            The class and its construction arguments.
+        """
+        return type(self), (self._data,)
+
+
+Frozen = Union[FrozenDict, tuple, str, int, float, bool, Any]
+
+
+class Interner:
+    """Thread-safe registry of frozen subtrees, storing each one once.
+
+    The registry is bounded: once full, the least recently used subtrees
+    are forgotten. Documents holding them are unaffected, but equal
+    subtrees frozen afterwards are stored anew.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None):
+        """Construct an empty registry.
+
+        Args:
+            maxsize: Maximum number of subtrees to keep. Defaults to
+                `drytoml.settings.INTERNER_SIZE`. Use 0 to disable
+                sharing.
+        """
+        self.maxsize = settings.INTERNER_SIZE if maxsize is None else maxsize
+        # keys hold the id of the children, which the stored subtree
+        # keeps alive (so ids can't be reused) for as long as it's kept
+        self._subtrees: "OrderedDict[tuple, Frozen]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Count the stored subtrees.
+
+        Returns:
+            Number of distinct tables and arrays.
+        """
+        return len(self._subtrees)
+
+    @staticmethod
+    def _identity(value: Frozen) -> tuple:
+        # children are already interned, so their id is canonical. Types
+        # are part of the identity, to keep eg `1` and `True` apart, and
+        # so are the representation of floats (`0.0` vs `-0.0`, `nan`)
+        # and utc offsets (the same instant, written differently)
+        if isinstance(value, (FrozenDict, tuple)):
+            return (id(value),)
+        if isinstance(value, float):
+            return (type(value), repr(value))
+        if isinstance(value, (datetime.datetime, datetime.time)):
+            return (type(value), value, value.utcoffset())
+        return (type(value), value)
+
+    def intern(self, value: Frozen) -> Frozen:
+        """Retrieve the stored copy of a subtree, storing it if new.
+
+        Args:
+            value: The subtree, whose children must be interned already.
+
+        Returns:
+            The stored subtree, equal to the received one.
+        """
+        if isinstance(value, FrozenDict):
+            items = value.items()
+        elif isinstance(value, tuple):
+            items = enumerate(value)
+        else:
+            return value
+        key = (
+            type(value),
+            tuple((name, self._identity(item)) for name, item in items),
+        )
+        with self._lock:
+            stored = self._subtrees.setdefault(key, value)
+            self._subtrees.move_to_end(key)
+            while len(self._subtrees) > self.maxsize:
+                self._subtrees.popitem(last=False)
+        return stored
+
+    def clear(self):
+        """Forget every stored subtree."""
+        with self._lock:
+            self._subtrees.clear()
+
+
+INTERNER = Interner()
+"""Default registry, shared by the whole process."""
+
+
+def freeze(item: Any, interner: Interner = INTERNER) -> Frozen:
+    """Convert a (resolved) document into its frozen representation.
+
+    Args:
+        item: The document, or any tomlkit or plain python data.
+        interner: Where to look for identical subtrees.
+
+    Returns:
+        `FrozenDict` tables and tuples with native scalars, sharing
+            identical subtrees with previously frozen documents.
+
+    Examples:
+        >>> first = freeze(Parser.from_file("a/pyproject.toml").parse())
+        >>> second = freeze(Parser.from_file("b/pyproject.toml").parse())
+        >>> first["tool"]["black"] is second["tool"]["black"]
+        True
+    """
+    if isinstance(item, dict):
+        value = FrozenDict(
+            (str(key), freeze(child, interner)) for key, child in item.items()
+        )
+    elif isinstance(item, (list, tuple)):
+        value = tuple(freeze(child, interner) for child in item)
+    else:
+        return unwrap(item)
+    return interner.intern(value)
+
+
+def thaw(item: Frozen) -> Any:
+    """Convert a frozen document into mutable, plain python data.
+
+    Args:
+        item: The frozen document.
+
+    Returns:
+        Nested dicts and lists.
+    """
+    if isinstance(item, FrozenDict):
+        return {key: thaw(value) for key, value in item.items()}
+    if isinstance(item, tuple):
+        return [thaw(value) for value in item]
+    return item
+
+
+def evolve(
+    item: FrozenDict,
+    location: Sequence[str],
+    value: Any,
+    interner: Interner = INTERNER,
+) -> FrozenDict:
+    """Override a value, copying only the tables along its location.
+
+    Args:
+        item: The frozen document.
+        location: Keys to walk to the value, eg
+            ``["tool", "black", "line-length"]``. Missing tables are
+            created.
+        value: The new value.
+        interner: Where to look for identical subtrees.
+
+    Raises:
+        ValueError: Empty location.
+
+    Returns:
+        A new frozen document, sharing every untouched subtree with
+            `item`, which is left unchanged.
+    """
+    if not location:
+        raise ValueError("Must supply at least one key")
+    key, *rest = location
+    if rest:
+        value = evolve(item.get(key, FrozenDict()), rest, value, interner)
+    else:
+        value = freeze(value, interner)
+    return interner.intern(FrozenDict({**item, key: value}))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Discover the inheritance graph of toml documents without merging."""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Union
+
+from drytoml import budget
+from drytoml.parser import DEFAULT_EXTEND_KEY
+from drytoml.parser import Parser
+from drytoml.types import GitRef
+from drytoml.types import PkgRef
+from drytoml.types import Url
+
+Reference = Union[Url, GitRef, PkgRef, Path]
+
+
+def references(
+    reference: Reference,
+    extend_key: str = DEFAULT_EXTEND_KEY,
+) -> List[Reference]:
+    """List the direct references of a document.
+
+    Remote documents are fetched (through the cache).
+
+    Args:
+        reference: The located document.
+        extend_key: The key which triggers transclusions.
+
+    Returns:
+        The located references, in order of appeareance.
+    """
+    return Parser.factory(reference, extend_key=extend_key).references()
+
+
+def dependencies(
+    roots: Iterable[Union[str, Path]],
+    extend_key: str = DEFAULT_EXTEND_KEY,
+    max_workers: int = 1,
+    visit: Callable[[Reference, str], List[Reference]] = references,
+) -> Dict[Reference, List[Reference]]:
+    """Walk the transitive references of some root documents.
+
+    Remote references are fetched (through the cache) to discover their
+    own references, but nothing gets merged. The graph is walked
+    breadth-first, visiting each level concurrently. The whole walk is
+    bounded by a single budget (see `drytoml.budget.limits`).
+
+    Args:
+        roots: Files or urls to start walking from.
+        extend_key: The key which triggers transclusions.
+        max_workers: Number of documents visited at the same time.
+        visit: Computes the direct references of a document. Defaults to
+            `references`.
+
+    Raises:
+        BudgetExceeded: The graph is deeper than the budget allows.
+
+    Returns:
+        Reference -> direct references mapping, for every reachable
+            reference (including the roots), in discovery order.
+    """
+    graph: Dict[Reference, List[Reference]] = {}
+    pending = [
+        Parser.locate(str(root))
+        if any(kind.validate(root) for kind in (Url, GitRef, PkgRef))
+        else Path(root).resolve()
+        for root in roots
+    ]
+    depth = 0
+    with budget.limits() as limits, ThreadPoolExecutor(max_workers) as pool:
+
+        def run(reference: Reference) -> List[Reference]:
+            # budgets are per thread: share the walk's with the pool
+            with budget.limits(limits):
+                return visit(reference, extend_key)
+
+        while pending:
+            level = [
+                reference
+                for reference in dict.fromkeys(pending)
+                if reference not in graph
+            ]
+            for reference in level:
+                limits.depth(reference, depth)
+            found = pool.map(run, level)
+            pending = []
+            for reference, direct in zip(level, found):
+                graph[reference] = direct
+                pending.extend(direct)
+            depth += 1
+    return graph
+
+
+def remote(graph: Dict[Reference, List[Reference]]) -> List[Url]:
+    """Filter the urls from an inheritance graph.
+
+    Args:
+        graph: As returned by `dependencies`.
+
+    Returns:
+        Every url in the graph.
+    """
+    return [reference for reference in graph if isinstance(reference, Url)]
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""Metadata index for drytoml's cache.
+
+The index lives next to the cached files, and maps each cache key (the
+sha256 of the url) to the url it holds, its size, when it was fetched,
+when it was last used, and how many times it was served from cache.
+
+Fetches are written right away, but cache hits are kept in memory and
+written in batches (see `flush`), so serving an entry costs no more
+than reading it.
+"""
+
+import atexit
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+from drytoml import logger
+from drytoml import paths
+from drytoml.files import atomic_write
+from drytoml.files import locked
+
+INDEX_NAME = "index.json"
+"""Name of the index file, inside `drytoml.paths.CACHE`."""
+
+PENDING_HITS: Dict[str, dict] = {}
+"""Cache hits not written into the index yet, by cache key."""
+
+_pending_lock = threading.Lock()
+
+
+class CacheIndex:
+    """Read and update the metadata of drytoml's cache entries."""
+
+    def __init__(self, entries: Optional[Dict[str, dict]] = None):
+        """Construct an index from its entries.
+
+        Args:
+            entries: Mapping of cache key -> metadata.
+        """
+        self.entries = entries or {}
+
+    @staticmethod
+    def location():
+        """Compute the location of the index file.
+
+        Returns:
+            Path to the index file.
+        """
+        return paths.CACHE / INDEX_NAME
+
+    @classmethod
+    def _read(cls) -> "CacheIndex":
+        try:
+            with open(cls.location()) as fp:
+                return cls(json.load(fp))
+        except (OSError, ValueError):
+            return cls()
+
+    @classmethod
+    def load(cls) -> "CacheIndex":
+        """Read the index from drytoml's cache.
+
+        Returns:
+            The stored index, or an empty one if missing or unreadable,
+                including the hits not flushed yet.
+        """
+        index = cls._read()
+        index.record_hits(_pending_hits(clear=False))
+        return index
+
+    def save(self):
+        """Write the index into drytoml's cache."""
+        atomic_write(
+            self.location(),
+            json.dumps(self.entries, indent=2, sort_keys=True),
+        )
+
+    @classmethod
+    @contextmanager
+    def updating(cls):
+        """Load the index, and save it back after modifications.
+
+        The index is locked for the duration of the context, so
+        concurrent processes do not lose each other's updates. Pending
+        hits are written too.
+
+        Yields:
+            The loaded index.
+        """
+        with locked(INDEX_NAME):
+            index = cls._read()
+            index.record_hits(_pending_hits(clear=True))
+            yield index
+            index.save()
+
+    def record_fetch(self, key: str, url: str, size: int):
+        """Register a freshly fetched cache entry.
+
+        Args:
+            key: Name of the cache file.
+            url: Source of the cached contents.
+            size: Size of the cached contents, in bytes.
+        """
+        now = time.time()
+        previous = self.entries.get(key, {})
+        self.entries[key] = {
+            "url": url,
+            "size": size,
+            "fetched": now,
+            "accessed": now,
+            "hits": previous.get("hits", 0),
+        }
+
+    def record_hit(
+        self,
+        key: str,
+        url: str,
+        size: int,
+        hits: int = 1,
+        accessed: Optional[float] = None,
+    ):
+        """Register a cache entry being served.
+
+        Args:
+            key: Name of the cache file.
+            url: Source of the cached contents.
+            size: Size of the cached contents, in bytes.
+            hits: Number of times it was served.
+            accessed: When it was last served. Defaults to now.
+        """
+        entry = self.entries.setdefault(
+            key,
+            {"url": url, "size": size, "fetched": None, "hits": 0},
+        )
+        entry["accessed"] = accessed or time.time()
+        entry["hits"] = entry.get("hits", 0) + hits
+
+    def record_hits(self, hits: Dict[str, dict]):
+        """Register several cache hits, as recorded by `record_hit`.
+
+        Hits of entries missing from the index are dropped: they were
+        removed (eg by `gc` in another process) after being served.
+
+        Args:
+            hits: Mapping of cache key -> `record_hit` kwargs.
+        """
+        for key, hit in hits.items():
+            if key in self.entries:
+                self.record_hit(key, **hit)
+
+    def remove(self, key: str) -> Optional[dict]:
+        """Forget a cache entry.
+
+        Args:
+            key: Name of the cache file.
+
+        Returns:
+            The removed metadata, if any.
+        """
+        return self.entries.pop(key, None)
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        """Iterate over the indexed entries.
+
+        Yields:
+            Tuples of (cache key, metadata).
+        """
+        yield from self.entries.items()
+
+
+def record_fetch(key: str, url: str, size: int):
+    """Register a fetch in the stored index.
+
+    Args:
+        key: Name of the cache file.
+        url: Source of the cached contents.
+        size: Size of the cached contents, in bytes.
+
+    .. seealso:: `CacheIndex.record_fetch`
+    """
+    with CacheIndex.updating() as index:
+        index.record_fetch(key, url, size)
+
+
+def record_hit(key: str, url: str, size: int):
+    """Register a cache hit, in memory until the next `flush`.
+
+    Args:
+        key: Name of the cache file.
+        url: Source of the cached contents.
+        size: Size of the cached contents, in bytes.
+
+    .. seealso:: `CacheIndex.record_hit`
+    """
+    with _pending_lock:
+        hit = PENDING_HITS.setdefault(
+            key, {"url": url, "size": size, "hits": 0}
+        )
+        hit["hits"] += 1
+        hit["accessed"] = time.time()
+
+
+def _pending_hits(clear: bool) -> Dict[str, dict]:
+    with _pending_lock:
+        hits = {key: dict(hit) for key, hit in PENDING_HITS.items()}
+        if clear:
+            PENDING_HITS.clear()
+    return hits
+
+
+def flush():
+    """Write the pending cache hits into the stored index."""
+    if not PENDING_HITS:
+        return
+    try:
+        with CacheIndex.updating():
+            pass
+    except OSError as exc:
+        logger.debug("drytoml-cache: Unable to update the index: %s", exc)
+
+
+atexit.register(flush)
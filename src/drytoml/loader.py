@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""In-process memoization of resolved documents.
+
+Long-running processes (plugin systems, test runners, language servers)
+tend to resolve the same file over and over. `load` keeps the resolved
+documents in a bounded LRU, and validates each entry on every call by
+stat-ing the files involved in its resolution: remote bases whose cache
+entry expired (see `drytoml.settings.CACHE_TTL`) are fetched again.
+"""
+
+from pathlib import Path
+from typing import Union
+
+from tomlkit.toml_document import TOMLDocument
+
+from drytoml import settings
+from drytoml.memo import ResolvedCache
+from drytoml.parser import DEFAULT_EXTEND_KEY
+from drytoml.resolver import Resolver
+
+RESOLVED = ResolvedCache(settings.LOAD_CACHE_SIZE)
+"""Documents resolved by `load` in the current process."""
+
+RESOLVER = Resolver(cache=RESOLVED)
+"""Resolver used by `load`, safe to call from several threads."""
+
+
+def load(
+    path: Union[str, Path] = "pyproject.toml",
+    key: str = DEFAULT_EXTEND_KEY,
+) -> TOMLDocument:
+    """Resolve a toml file, reusing previous results when possible.
+
+    Args:
+        path: TOML file to transclude values.
+        key: Name to look for inside the file to activate interpolation.
+
+    Returns:
+        A copy of the resolved document: callers are free to modify it.
+
+    Examples:
+        >>> import drytoml
+        >>> black = drytoml.load("pyproject.toml")["tool"]["black"]
+    """
+    return RESOLVER.resolve(Path(path), extend_key=key)
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""Memoization of resolved documents, validated by stat-ing their sources.
+
+.. seealso::
+
+   * `drytoml.loader`: Memoization of whole resolutions.
+   * `drytoml.merge.LAYERS`: Memoization of intermediate layers.
+   * `drytoml.resolver.Resolver`: Thread-safe, de-duplicated resolution.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from tomlkit.toml_document import TOMLDocument
+
+from drytoml.types import GitRef
+from drytoml.types import PkgRef
+from drytoml.types import Url
+from drytoml.utils import DeadlineExceeded
+from drytoml.utils import cache_path
+from drytoml.utils import git_revision
+from drytoml.utils import is_stale
+from drytoml.utils import package_archive
+from drytoml.utils import package_file
+from drytoml.utils import remaining
+
+Fingerprint = Tuple[Tuple[str, Optional[tuple]], ...]
+
+
+def stat_signature(
+    reference: Union[str, Path, Url, GitRef, PkgRef],
+) -> Optional[tuple]:
+    """Compute a cheap signature for the contents of a reference.
+
+    Urls are represented by their entry in drytoml's cache, and whether
+    it expired: stale entries are fetched again, even if untouched. Git
+    references are represented by the commit they point to, and package
+    references by the installed file, or the archive containing it (eg
+    a zip).
+
+    Args:
+        reference: The file, url, git or package reference to check.
+
+    Returns:
+        Modification time (ns) and size for files, urls and packages
+            (plus the expiration for urls), the commit for git
+            references, or `None` if missing.
+    """
+    if GitRef.validate(reference):
+        try:
+            return (git_revision(GitRef(reference)),)
+        except OSError:
+            return None
+    expiration: tuple = ()
+    if PkgRef.validate(reference):
+        path = package_file(reference) or package_archive(reference)
+        if path is None:
+            return None
+    elif Url.validate(reference):
+        path = cache_path(reference)
+        expiration = (is_stale(reference),)
+    else:
+        path = Path(reference)
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size) + expiration
+
+
+def now() -> int:
+    """Compute the current time, comparable with `stat_signature`.
+
+    Returns:
+        Nanoseconds since the epoch.
+    """
+    return int(time.time() * 1e9)
+
+
+def locate(reference: str) -> Union[Url, GitRef, PkgRef, Path]:
+    """Convert a stringified reference back into its type.
+
+    Args:
+        reference: As stored by `fingerprint`.
+
+    Returns:
+        The url, git or package reference, or path.
+    """
+    for kind in (Url, GitRef, PkgRef):
+        if kind.validate(reference):
+            return kind(reference)
+    return Path(reference)
+
+
+def fingerprint(
+    references: Iterable[Union[str, Path, Url, GitRef]],
+) -> Fingerprint:
+    """Compute the signatures of several references.
+
+    Args:
+        references: Files or urls to check.
+
+    Returns:
+        Sorted (reference, signature) pairs.
+    """
+    return tuple(
+        sorted(
+            (str(reference), stat_signature(reference))
+            for reference in set(map(str, references))
+        )
+    )
+
+
+class ResolvedCache:
+    """Thread-safe LRU of resolved documents, validated by stat."""
+
+    def __init__(self, maxsize: int):
+        """Construct an empty cache.
+
+        Args:
+            maxsize: Maximum number of documents to keep. Use 0 to
+                disable memoization.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, Tuple[Fingerprint, TOMLDocument]]"
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Count the stored documents.
+
+        Returns:
+            Number of entries.
+        """
+        return len(self._entries)
+
+    def get(self, key: tuple) -> Optional[Tuple[TOMLDocument, List]]:
+        """Retrieve a document, if none of its sources changed.
+
+        Args:
+            key: Identifier of the resolution.
+
+        Returns:
+            The stored document (not a copy) and the references of its
+                sources, or `None`.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            stored, document = entry
+            references = [reference for reference, __ in stored]
+            if fingerprint(references) == stored:
+                with self._lock:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                return document, [locate(ref) for ref in references]
+        with self._lock:
+            self._entries.pop(key, None)
+            self.misses += 1
+        return None
+
+    def put(
+        self,
+        key: tuple,
+        document: TOMLDocument,
+        references: Iterable[Union[str, Path, Url, GitRef]],
+        started: int,
+    ):
+        """Store a document.
+
+        Args:
+            key: Identifier of the resolution.
+            document: The resolved document.
+            references: The document sources.
+            started: When the resolution started, as returned by `now`.
+                Local sources modified after this might not match the
+                document, so it is not stored. Remote references are
+                stamped by their cache entry, written during the
+                resolution.
+        """
+        if self.maxsize <= 0:
+            return
+        stamp = fingerprint(references)
+        if not all(
+            sig is None
+            or not isinstance(locate(reference), Path)
+            or sig[0] < started
+            for reference, sig in stamp
+        ):
+            return
+        with self._lock:
+            self._entries[key] = (stamp, document)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Forget every stored document."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class Flight:
+    """A computation in progress, awaited by other threads."""
+
+    def __init__(self):
+        """Register the current thread as the owner of the computation."""
+        self.owner = threading.get_ident()
+        self.waiters = 0
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+    def wait(self) -> Any:
+        """Wait for the computation to finish.
+
+        Raises:
+            DeadlineExceeded: The current deadline expired while waiting.
+
+        Returns:
+            The result of the computation, or raises its exception.
+        """
+        # waiting forever could deadlock on circular transclusions
+        # resolved from different threads
+        if not self.done.wait(remaining()):
+            raise DeadlineExceeded("drytoml: Timed out waiting for a result")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """Coalesce concurrent computations of the same key.
+
+    The first thread asking for a key (the leader) runs the computation,
+    and every thread asking for the same key meanwhile waits for, and
+    shares, its result or exception.
+    """
+
+    def __init__(self):
+        """Construct an empty registry of computations in progress."""
+        self._flights: Dict[Any, Flight] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key: Any) -> Tuple[Flight, bool]:
+        """Register a computation, unless it is already in progress.
+
+        Leaders must call `finish` once done, even if they fail.
+
+        Args:
+            key: Identifier of the computation.
+
+        Raises:
+            RecursionError: The current thread is already computing
+                `key`, eg because of circular transclusions.
+
+        Returns:
+            The computation, and whether the current thread leads it.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight()
+                return flight, True
+            if flight.owner == threading.get_ident():
+                raise RecursionError(f"drytoml: Circular resolution of {key}")
+            flight.waiters += 1
+            return flight, False
+
+    def finish(
+        self,
+        key: Any,
+        result: Any = None,
+        error: Optional[BaseException] = None,
+        share: Optional[Callable[[Any], Any]] = None,
+    ):
+        """Publish the outcome of a computation, waking up its waiters.
+
+        Args:
+            key: Identifier of the computation.
+            result: The result, if successful.
+            error: The exception, if failed.
+            share: If set, waiters get `share(result)` instead, eg a copy
+                when the leader is going to modify the result. Only
+                called if there are waiters.
+        """
+        with self._lock:
+            flight = self._flights.pop(key)
+        if share is not None and flight.waiters and error is None:
+            result = share(result)
+        flight.result = result
+        flight.error = error
+        flight.done.set()
+
+    def do(self, key: Any, func: Callable[[], Any]) -> Any:
+        """Run a computation, unless the same one is already in progress.
+
+        Args:
+            key: Identifier of the computation.
+            func: The computation.
+
+        Raises:
+            RecursionError: The computation requires itself, eg because
+                of circular transclusions.
+            DeadlineExceeded: The current deadline expired while waiting
+                for another thread.
+
+        Returns:
+            The result of the computation, shared between all threads.
+        """
+        flight, leader = self.claim(key)
+        if not leader:
+            return flight.wait()
+
+        try:
+            result = func()
+        except BaseException as exc:
+            self.finish(key, error=exc)
+            raise
+        self.finish(key, result)
+        return result
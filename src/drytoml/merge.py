@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 """Utilities and logic for handling inter-toml merges."""
 
+import copy
+import functools
 from datetime import date
 from datetime import datetime
 from datetime import time
 from typing import Dict
+from typing import Hashable
 from typing import List
+from typing import Tuple
 from typing import Union
 
 from tomlkit.container import Container
@@ -25,7 +29,14 @@ from tomlkit.items import Table
 from tomlkit.items import Time
 from tomlkit.toml_document import TOMLDocument
 
+from drytoml import budget
+from drytoml import logger
+from drytoml import settings
 from drytoml.locate import deep_del
+from drytoml.memo import ResolvedCache
+from drytoml.memo import SingleFlight
+from drytoml.memo import now
+from drytoml.provenance import Provenance
 
 RAW_ITEMS_TOMLKIT = (
     Integer,
@@ -51,13 +62,107 @@ RAW_ITEMS = (
     *RAW_ITEMS_NATIVE,
 )
 
+LAYERS = ResolvedCache(settings.LAYER_CACHE_SIZE)
+"""Resolved intermediate documents (a base, with its own transclusions
+already merged) and their provenance (if recorded, see
+`drytoml.parser.Parser.parse`), reused across merges while their sources
+are unchanged.
+Editing the leaf document then only costs merging it onto cached bases.
+"""
 
-def deep_merge(current: Item, incoming: Item) -> Item:
+FLIGHTS = SingleFlight()
+"""Layers being resolved, shared by concurrent resolutions."""
+
+Layer = Tuple[Tuple[TOMLDocument, Provenance], list]
+
+
+def _copy_layer(layer: Layer) -> Layer:
+    (document, provenance), dependencies = layer
+    return (copy.deepcopy(document), provenance), dependencies
+
+
+def publish(
+    key: Tuple[str, str, bool],
+    layer: Layer,
+    started: int,
+    store: bool = True,
+):
+    """Share a freshly resolved layer with other resolutions.
+
+    Merging modifies the merged documents, so the resolution which
+    produced the layer keeps it, and `LAYERS` and the resolutions
+    waiting for it (see `FLIGHTS`) get a copy. Nothing is copied when
+    the layer is not stored and nobody is waiting.
+
+    Args:
+        key: Identifier of the layer, see `TomlMerger.layer_key`.
+        layer: The resolved document and its provenance, and the
+            references of its sources.
+        started: When the resolution started, see `ResolvedCache.put`.
+        store: Whether to memoize the layer in `LAYERS` (unless
+            memoization is disabled).
+    """
+    if not store or LAYERS.maxsize <= 0:
+        FLIGHTS.finish(key, layer, share=_copy_layer)
+        return
+    shared = _copy_layer(layer)
+    stored, dependencies = shared
+    LAYERS.put(key, stored, dependencies, started)
+    FLIGHTS.finish(key, shared)
+
+
+def parse_merge_keys(raw: str) -> Dict[Tuple[str, ...], str]:
+    """Parse keyed arrays of tables in the `DRYTOML_MERGE_KEYS` format.
+
+    Args:
+        raw: Whitespace-separated `location=field` pairs, where the
+            location is a dotted key.
+
+    Raises:
+        ValueError: A pair does not contain a field.
+
+    Returns:
+        Mapping of location (as a tuple of keys) -> key field.
+
+    Examples:
+        >>> parse_merge_keys("tool.mypy.overrides=module")
+        {('tool', 'mypy', 'overrides'): 'module'}
+    """
+    keys = {}
+    for pair in raw.split():
+        location, sep, field = pair.partition("=")
+        if not sep or not location or not field:
+            raise ValueError(f"Invalid merge key '{pair}'")
+        keys[tuple(location.split("."))] = field
+    return keys
+
+
+@functools.lru_cache(maxsize=None)
+def merge_keys() -> Dict[Tuple[str, ...], str]:
+    """Load the configured keyed arrays of tables.
+
+    The result is computed once per process: call
+    `merge_keys.cache_clear()` after changing the configuration.
+
+    Returns:
+        Mapping of location -> key field, from
+            `drytoml.settings.MERGE_KEYS`.
+    """
+    return parse_merge_keys(settings.MERGE_KEYS)
+
+
+def deep_merge(
+    current: Item,
+    incoming: Item,
+    location: Tuple[str, ...] = (),
+) -> Item:
     """Merge two items using a type-dependent strategy.
 
     Args:
         current: Item to merge into.
         incoming: Item to merge from.
+        location: Keys leading to the items, used to find keyed arrays
+            of tables (see `merge_keys`).
 
     Raises:
         NotImplementedError: Unable to merge received current and
@@ -70,6 +175,9 @@ def deep_merge(current: Item, incoming: Item) -> Item:
 
     if isinstance(current, list):
         if isinstance(incoming, list):
+            field = merge_keys().get(location)
+            if field is not None and isinstance(current, AoT):
+                return keyed_extend(current, incoming, field)
             return deep_extend(current, incoming)
 
     if isinstance(current, (Table, TOMLDocument, OutOfOrderTableProxy)):
@@ -81,7 +189,9 @@ def deep_merge(current: Item, incoming: Item) -> Item:
                     # emulate incoming container skeleton
                     current.append(key, incoming[key])
                     continue
-                current[key] = deep_merge(current[key], incoming[key])
+                current[key] = deep_merge(
+                    current[key], incoming[key], (*location, str(key))
+                )
             return current
 
     if isinstance(current, RAW_ITEMS):
@@ -91,10 +201,48 @@ def deep_merge(current: Item, incoming: Item) -> Item:
     raise NotImplementedError
 
 
+def deep_update(
+    current: Item,
+    incoming: Item,
+    location: Tuple[str, ...] = (),
+) -> Item:
+    """Merge two items like `deep_merge`, but `incoming` takes precedence.
+
+    The result holds the same values as ``deep_merge(incoming, current)``,
+    but only the keys of `incoming` are walked: merging a small document
+    onto a big one (eg each link of an inheritance chain onto the bases
+    accumulated so far) costs the size of the small one. Keys only found
+    in `incoming` come last, after the ones of `current`.
+
+    Args:
+        current: Item to merge into.
+        incoming: Item to merge from, whose values win.
+        location: Keys leading to the items, see `deep_merge`.
+
+    Returns:
+        The current Item, after merging in-place, or `incoming` if they
+            are not both tables.
+    """
+    tables = (Table, TOMLDocument, OutOfOrderTableProxy)
+    if not (isinstance(current, tables) and isinstance(incoming, tables)):
+        return deep_merge(incoming, current, location)
+
+    for key in list(incoming.keys()):
+        if key not in current:
+            current.append(key, incoming[key])
+            continue
+        merged = deep_update(current[key], incoming[key], (*location, key))
+        # tomlkit pads every table assigned, even to itself
+        if merged is not current[key]:
+            current[key] = merged
+    return current
+
+
 def merge_targeted(
     document: Container,
     incoming: Container,
     breadcrumbs: List[Union[str, int]],
+    accumulate: bool = False,
 ) -> TOMLDocument:
     """Merge specific path contents from an incoming contianer into another.
 
@@ -102,12 +250,19 @@ def merge_targeted(
         document: The container to store the merge result.
         incoming: The source of the incoming data.
         breadcrumbs: Location of the incoming contend.
+        accumulate: Merge `document` onto `incoming` instead (values
+            from `document` still win, see `deep_update`), which only
+            costs the size of `document`. Both must be owned by the
+            caller.
 
     Returns:
-        The `document`, after merging in-place.
+        The `document`, after merging in-place, or `incoming` if
+            accumulating onto it at the document root.
     """
 
     if not breadcrumbs:
+        if accumulate:
+            return deep_update(incoming, document)
         return deep_merge(document, incoming)
 
     location = document
@@ -121,10 +276,17 @@ def merge_targeted(
             location[key] = type(incoming_data)()
         location = location[key]
 
+    path = tuple(str(key) for key in breadcrumbs)
     if final not in location:
         location[final] = incoming_data[final]
+    elif accumulate:
+        location[final] = deep_update(
+            incoming_data[final], location[final], path
+        )
     else:
-        location[final] = deep_merge(location[final], incoming_data[final])
+        location[final] = deep_merge(
+            location[final], incoming_data[final], path
+        )
 
     return document
 
@@ -143,7 +305,51 @@ def deep_extend(
         The recevied container, modified in-place.
 
     """
-    current.extend(incoming)
+    # tomlkit containers track their items separately: `list.extend`
+    # would bypass them, losing the items on copy or serialization
+    for item in incoming:
+        current.append(item)
+    return current
+
+
+def _index_key(value: Item) -> Hashable:
+    if isinstance(value, list):
+        return tuple(_index_key(item) for item in value)
+    return value
+
+
+def keyed_extend(current: AoT, incoming: AoT, field: str) -> AoT:
+    """Merge two arrays of tables, matching their entries by a field.
+
+    Entries are matched through a hash index, so merging stays linear.
+    Matching entries are deep-merged (values from `current` win), the
+    rest are appended, as in `deep_extend`. Entries without the field
+    are never matched. Eg with `tool.mypy.overrides=module`, a base's
+    `requests.*` override is folded into the document's own one,
+    instead of adding a second `[[tool.mypy.overrides]]` block.
+
+    Args:
+        current: Array of tables to merge into (in-place).
+        incoming: Array of tables to merge from.
+        field: Name of the key identifying an entry, eg `module` for
+            `[[tool.mypy.overrides]]`.
+
+    Returns:
+        The received array, modified in-place.
+    """
+    index = {}
+    for entry in current:
+        if field in entry:
+            index.setdefault(_index_key(entry[field]), entry)
+    for entry in incoming:
+        key = _index_key(entry[field]) if field in entry else None
+        match = index.get(key) if key is not None else None
+        if match is None:
+            current.append(entry)
+            if key is not None:
+                index[key] = current[-1]
+        else:
+            deep_merge(match, entry)
     return current
 
 
@@ -162,9 +368,19 @@ class TomlMerger:
             breadcrumbs: Location of the parent container for the
                 incoming value merge.
         """
-        incoming_parser = self.build_subparser(value)
-        incoming = incoming_parser.parse()
-        merge_targeted(self.container, incoming, breadcrumbs)
+        incoming, dependencies, provenance = self.resolve(value)
+        self.parser.dependencies.extend(dependencies)
+        if self.parser.tracking:
+            self.parser.provenance.merge(provenance, breadcrumbs)
+        # `incoming` is ours to modify: in a chain, keep merging onto the
+        # bases instead of copying them into every link. The document
+        # being resolved keeps its own layout (and comments)
+        self.container = merge_targeted(
+            self.container,
+            incoming,
+            breadcrumbs,
+            accumulate=self.parser.level > 0,
+        )
 
     def merge_list_like(
         self,
@@ -239,12 +455,94 @@ class TomlMerger:
             The instantiated child parser.
         """
 
-        return type(self.parser).factory(
+        parser = type(self.parser).factory(
             value,
             self.parser.extend_key,
             self.parser.reference,
             level=self.parser.level + 1,
         )
+        parser.tracking = self.parser.tracking
+        return parser
+
+    def resolve(self, value: Item) -> Tuple[TOMLDocument, list, Provenance]:
+        """Resolve a referenced layer.
+
+        Layers are taken from the parser (see `drytoml.worklist`) or
+        `LAYERS` if possible, and resolved on the spot otherwise.
+        Concurrent resolutions of the same layer (eg from a thread pool)
+        are coalesced, so it is only fetched and parsed once.
+
+        Layers are only copied when shared: the first use of a layer
+        owned by this resolution gets the layer itself. Copied values
+        are charged to the budget (see `drytoml.budget`).
+
+        Args:
+            value: The reference to resolve.
+
+        Raises:
+            BudgetExceeded: Too many values copied.
+
+        Returns:
+            A resolved document which can be merged (and thus modified)
+                freely, the references of its sources, and the origin of
+                its values.
+        """
+        key = self.layer_key(value)
+        entry = self.parser.layers.get(key)
+        if entry is not None:
+            layer, owned = entry
+            if owned:
+                self.parser.layers[key] = (layer, False)
+        else:
+            owned = False
+            layer = LAYERS.get(key)
+            if layer is not None:
+                logger.info(
+                    "%s: Reusing resolved layer %s", self.parser, key[0]
+                )
+            else:
+                flight, owned = FLIGHTS.claim(key)
+                if owned:
+                    layer = self._resolve_layer(value, key)
+                else:
+                    layer = flight.wait()
+        (document, provenance), dependencies = layer
+        if not owned:
+            document = copy.deepcopy(document)
+            budget.current().materialized(key[0], document)
+        return document, dependencies, provenance
+
+    def layer_key(self, value: Item) -> Tuple[str, str, bool]:
+        """Identify a referenced layer.
+
+        Args:
+            value: The reference.
+
+        Returns:
+            Key of the layer in `LAYERS`: its location, extend key, and
+                whether its provenance is recorded.
+        """
+        parser_class = type(self.parser)
+        return (
+            str(parser_class.locate(str(value), self.parser.reference)),
+            self.parser.extend_key,
+            self.parser.tracking,
+        )
+
+    def _resolve_layer(self, value: Item, key: tuple) -> Layer:
+        started = now()
+        try:
+            incoming_parser = self.build_subparser(value)
+            incoming = incoming_parser.parse()
+        except BaseException as exc:
+            FLIGHTS.finish(key, error=exc)
+            raise
+        layer = (
+            (incoming, incoming_parser.provenance),
+            incoming_parser.dependencies,
+        )
+        publish(key, layer, started)
+        return layer
 
     def __call__(
         self,
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""Cache and fetch metrics, persisted across drytoml invocations.
+
+Metrics are accumulated in memory during an invocation, and merged into
+a json file inside drytoml's cache when the process exits. Optionally,
+they can also be exported as a prometheus node-exporter textfile.
+
+.. seealso::
+
+   * `drytoml.settings.METRICS_TEXTFILE`
+   * `drytoml.app.cache.Cache.stats`
+"""
+
+import atexit
+import bisect
+import json
+import threading
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Union
+from urllib.parse import urlparse
+
+from drytoml import logger
+from drytoml import paths
+from drytoml import settings
+from drytoml.files import atomic_write
+from drytoml.files import locked
+
+METRICS_NAME = "metrics.json"
+"""Name of the metrics file, inside `drytoml.paths.CACHE`."""
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+"""Upper bounds (in seconds) of the latency histograms."""
+
+COUNTERS = {
+    "hits": "Remote references served from cache.",
+    "misses": "Remote references not found in cache.",
+    "revalidations": "Expired cache entries fetched again.",
+    "stale": "Expired cache entries used because fetching failed.",
+    "negative_hits": "Requests skipped because the url recently failed.",
+    "failures": "Remote references which could not be fetched.",
+    "retries": "Fetch attempts retried after a transient error.",
+    "bytes_fetched": "Bytes downloaded from remote references.",
+    "proxy_fallbacks": "Fetches done directly because the proxy failed.",
+}
+"""Known counters, and their description."""
+
+HISTOGRAMS = {
+    "fetch_seconds": "Latency of each fetch attempt.",
+}
+"""Known histograms, and their description."""
+
+
+def host_of(url: str) -> str:
+    """Extract the host used to label metrics for an url.
+
+    Args:
+        url: The url being fetched.
+
+    Returns:
+        The network location of the url.
+
+    Examples:
+        >>> host_of("https://raw.githubusercontent.com/org/repo/main/a.toml")
+        'raw.githubusercontent.com'
+    """
+    return urlparse(str(url)).netloc or "unknown"
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Compute a percentile (nearest rank) of some samples.
+
+    Args:
+        values: The samples, in any order.
+        percent: Between 0 and 1, eg 0.95 for the 95th percentile.
+
+    Returns:
+        The sample at that rank.
+
+    Examples:
+        >>> percentile([3, 1, 2], 0.5)
+        2
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent))]
+
+
+class Metrics:
+    """Counters and histograms, labeled by host."""
+
+    def __init__(
+        self,
+        counters: Optional[Dict[str, Dict[str, float]]] = None,
+        histograms: Optional[Dict[str, Dict[str, dict]]] = None,
+    ):
+        """Construct a metrics container.
+
+        Args:
+            counters: Mapping of name -> host -> value.
+            histograms: Mapping of name -> host -> histogram, where each
+                histogram contains `buckets` (non-cumulative counts, one
+                per `BUCKETS` element plus the overflow), `sum`, and
+                `count`.
+        """
+        self.counters = counters or {}
+        self.histograms = histograms or {}
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        """Check if any metric was recorded.
+
+        Returns:
+            `True` iff there are counters or histograms.
+        """
+        return bool(self.counters or self.histograms)
+
+    def inc(self, name: str, host: str, value: float = 1):
+        """Increase a counter.
+
+        Args:
+            name: Name of the counter.
+            host: Label for the counter.
+            value: Amount to increase.
+        """
+        with self._lock:
+            hosts = self.counters.setdefault(name, {})
+            hosts[host] = hosts.get(host, 0) + value
+
+    def observe(self, name: str, host: str, value: float):
+        """Record a value into a histogram.
+
+        Args:
+            name: Name of the histogram.
+            host: Label for the histogram.
+            value: Observed value.
+        """
+        with self._lock:
+            histogram = self._histogram(name, host)
+            histogram["buckets"][bisect.bisect_left(BUCKETS, value)] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def _histogram(self, name, host):
+        return self.histograms.setdefault(name, {}).setdefault(
+            host,
+            {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0},
+        )
+
+    def merge(self, other: "Metrics"):
+        """Accumulate another container's metrics into this one.
+
+        Args:
+            other: Metrics to add.
+        """
+        for name, hosts in other.counters.items():
+            for host, value in hosts.items():
+                self.inc(name, host, value)
+        for name, hosts in other.histograms.items():
+            for host, incoming in hosts.items():
+                with self._lock:
+                    histogram = self._histogram(name, host)
+                    histogram["buckets"] = [
+                        current + new
+                        for current, new in zip(
+                            histogram["buckets"], incoming["buckets"]
+                        )
+                    ]
+                    histogram["sum"] += incoming["sum"]
+                    histogram["count"] += incoming["count"]
+
+    def as_dict(self) -> dict:
+        """Serialize metrics.
+
+        Returns:
+            Json-compatible representation of the metrics.
+        """
+        return {"counters": self.counters, "histograms": self.histograms}
+
+    @staticmethod
+    def location() -> Path:
+        """Compute the location of the persisted metrics.
+
+        Returns:
+            Path to the metrics file.
+        """
+        return paths.CACHE / METRICS_NAME
+
+    @classmethod
+    def load(cls) -> "Metrics":
+        """Read persisted metrics.
+
+        Returns:
+            The stored metrics, or an empty container.
+        """
+        try:
+            with open(cls.location()) as fp:
+                return cls(**json.load(fp))
+        except (OSError, ValueError, TypeError):
+            return cls()
+
+    def save(self):
+        """Persist metrics into drytoml's cache."""
+        atomic_write(
+            self.location(),
+            json.dumps(self.as_dict(), indent=2, sort_keys=True),
+        )
+
+    def prometheus(self) -> str:
+        """Render metrics using prometheus' text exposition format.
+
+        Returns:
+            Metrics, ready to be written as a node-exporter textfile.
+        """
+        lines = []
+        for name, hosts in sorted(self.counters.items()):
+            metric = f"drytoml_cache_{name}_total"
+            lines.append(f"# HELP {metric} {COUNTERS.get(name, name)}")
+            lines.append(f"# TYPE {metric} counter")
+            for host, value in sorted(hosts.items()):
+                lines.append(f'{metric}{{host="{host}"}} {value}')
+        for name, hosts in sorted(self.histograms.items()):
+            metric = f"drytoml_{name}"
+            lines.append(f"# HELP {metric} {HISTOGRAMS.get(name, name)}")
+            lines.append(f"# TYPE {metric} histogram")
+            for host, histogram in sorted(hosts.items()):
+                cumulative = 0
+                bounds = [*map(str, BUCKETS), "+Inf"]
+                for bound, count in zip(bounds, histogram["buckets"]):
+                    cumulative += count
+                    lines.append(
+                        f'{metric}_bucket{{host="{host}",le="{bound}"}} '
+                        f"{cumulative}"
+                    )
+                lines.append(f'{metric}_sum{{host="{host}"}} {histogram["sum"]}')
+                lines.append(
+                    f'{metric}_count{{host="{host}"}} {histogram["count"]}'
+                )
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: Union[str, Path]):
+        """Write prometheus metrics atomically, as node-exporter expects.
+
+        Args:
+            path: Destination, usually a `.prom` file inside the
+                node-exporter textfile collector directory.
+        """
+        atomic_write(path, self.prometheus())
+
+
+METRICS = Metrics()
+"""Metrics recorded during the current invocation."""
+
+
+def flush():
+    """Merge this invocation's metrics into the persisted ones."""
+    if not METRICS:
+        return
+    try:
+        with locked(METRICS_NAME):
+            persisted = Metrics.load()
+            persisted.merge(METRICS)
+            persisted.save()
+        if settings.METRICS_TEXTFILE:
+            persisted.write_textfile(settings.METRICS_TEXTFILE)
+    except OSError as exc:
+        logger.debug("drytoml-metrics: Unable to persist metrics: %s", exc)
+    METRICS.counters.clear()
+    METRICS.histograms.clear()
+
+
+atexit.register(flush)
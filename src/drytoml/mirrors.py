@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Rewrite remote references to local mirrors.
+
+Mirrors map url prefixes to local directories or other servers, so
+that environments with a vendored copy of the referenced repositories
+(eg CI) can resolve documents without network access, and without
+changing the committed files. Rules are read from
+`drytoml.settings.MIRRORS`, and from a toml file inside
+`drytoml.paths.CONFIG`, eg::
+
+    [mirrors]
+    "https://raw.githubusercontent.com/org/style/main/" = "/vendor/style/"
+    "https://example.com/configs/" = "http://127.0.0.1:8000/configs/"
+    "https://example.org/style/main/" = "git+file:///srv/style.git#main:"
+
+When several prefixes match, the longest one wins.
+"""
+
+import functools
+from pathlib import Path
+from typing import Dict
+from typing import Union
+
+import tomlkit
+
+from drytoml import logger
+from drytoml import paths
+from drytoml import settings
+from drytoml.types import GitRef
+from drytoml.types import Url
+
+MIRRORS_NAME = "mirrors.toml"
+"""Name of the mirrors file, inside `drytoml.paths.CONFIG`."""
+
+
+def parse_rules(raw: str) -> Dict[str, str]:
+    """Parse mirror rules in the `DRYTOML_MIRRORS` format.
+
+    Args:
+        raw: Whitespace-separated `prefix=target` pairs.
+
+    Raises:
+        ValueError: A rule does not contain a target.
+
+    Returns:
+        Mapping of url prefix -> target.
+
+    Examples:
+        >>> parse_rules("https://example.com/=/vendor/example/")
+        {'https://example.com/': '/vendor/example/'}
+    """
+    rules = {}
+    for rule in raw.split():
+        prefix, sep, target = rule.partition("=")
+        if not sep or not prefix or not target:
+            raise ValueError(f"Invalid mirror rule '{rule}'")
+        rules[prefix] = target
+    return rules
+
+
+@functools.lru_cache(maxsize=None)
+def rules() -> Dict[str, str]:
+    """Load the configured mirror rules.
+
+    Rules from `drytoml.settings.MIRRORS` take precedence over the ones
+    in the mirrors file. The result is computed once per process: call
+    `rules.cache_clear()` after changing the configuration.
+
+    Returns:
+        Mapping of url prefix -> target.
+    """
+    result = {}
+    path = paths.CONFIG / MIRRORS_NAME
+    if path.exists():
+        with open(path) as fp:
+            table = tomlkit.parse(fp.read()).get("mirrors", {})
+        result.update({str(k): str(v) for k, v in table.items()})
+    result.update(parse_rules(settings.MIRRORS))
+    return result
+
+
+def rewrite(url: Union[str, Url]) -> Union[Url, GitRef, Path]:
+    """Apply the configured mirror rules to an url.
+
+    Args:
+        url: The remote reference.
+
+    Returns:
+        The mirrored url, git reference or local path, or the received
+            url if no rule matches.
+
+    Examples:
+        With `DRYTOML_MIRRORS="https://example.com/=/vendor/example/"`:
+        >>> rewrite("https://example.com/python/black.toml")
+        PosixPath('/vendor/example/python/black.toml')
+    """
+    matches = [prefix for prefix in rules() if str(url).startswith(prefix)]
+    if not matches:
+        return Url(url)
+    prefix = max(matches, key=len)
+    target = rules()[prefix] + str(url)[len(prefix) :]
+    logger.debug("drytoml-mirrors: Rewriting %s into %s", url, target)
+    if Url.validate(target):
+        return Url(target)
+    if GitRef.validate(target):
+        return GitRef(target)
+    return Path(target).expanduser().resolve()
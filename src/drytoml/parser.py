@@ -1,23 +1,58 @@
 # -*- coding: utf-8 -*-
 """Additional Source to transclude tomlkit with URL and files."""
 
+import logging
+import os
+import posixpath
 from pathlib import Path
 from textwrap import dedent as _
+from typing import List
 from typing import Optional
 from typing import Union
 
 from tomlkit.parser import Parser as BaseParser
 from tomlkit.toml_document import TOMLDocument
 
+from drytoml import budget
 from drytoml import logger
+from drytoml import mirrors
+from drytoml import worklist
 from drytoml.locate import deep_find
 from drytoml.merge import TomlMerger
+from drytoml.profiling import phase
+from drytoml.profiling import step
+from drytoml.provenance import Provenance
+from drytoml.types import GitRef
+from drytoml.types import PkgRef
 from drytoml.types import Url
+from drytoml.utils import deadline
+from drytoml.utils import git_show
+from drytoml.utils import package_read
 from drytoml.utils import request
 
 DEFAULT_EXTEND_KEY = "__extends"
 
 
+def requires_transclusion(raw: str, extend_key=DEFAULT_EXTEND_KEY) -> bool:
+    """Check cheaply if a document might require transclusions.
+
+    The raw text is scanned without parsing it. False positives (eg the
+    key inside a comment or a string) only cost a regular parse.
+
+    Args:
+        raw: Raw toml content.
+        extend_key: key to look for to init transclusion.
+
+    Returns:
+        `False` iff the document can be used as-is.
+
+    Examples:
+        >>> requires_transclusion('[tool.black]\\nline-length = 79\\n')
+        False
+    """
+    return extend_key in raw
+
+
 class Parser(BaseParser):
     """Extend tomlkit parser to allow transclusion."""
 
@@ -37,11 +72,31 @@ class Parser(BaseParser):
                 (eg url, file, etc).
             level: Number of parent documents previously parsed to
                 instantiate this.
+
+        Attributes:
+            dependencies: References of every document involved in the
+                resolution, including this one (unless parsed from
+                string). Complete after `parse`.
+            provenance: Origin of every value in the resolved document,
+                see `drytoml.provenance`. Complete after
+                `parse(provenance=True)`, empty otherwise.
+            tracking: Whether `provenance` is recorded. Inherited by the
+                parsers of the referenced documents.
+            layers: Resolved references, by `drytoml.merge.TomlMerger`
+                key, and whether they can be modified without copying.
+                Populated by `drytoml.worklist` before merging.
+            size: Bytes of the raw content, charged to the current
+                budget (see `drytoml.budget`) when parsed.
         """
         self.extend_key = extend_key
         self.reference = reference or Path.cwd()
         self.from_string = not reference
         self.level = level
+        self.dependencies = [] if self.from_string else [self.reference]
+        self.provenance = Provenance()
+        self.tracking = False
+        self.layers = {}
+        self.size = len(string.encode("utf-8"))
         super().__init__(string)
 
     def __repr__(self) -> str:
@@ -79,11 +134,17 @@ class Parser(BaseParser):
             extend_key: kwarg to construct the parser.
             level: kwarg to construct the parser.
 
+        Raises:
+            BudgetExceeded: The file does not fit in the byte budget (see
+                `drytoml.budget`). Its size is checked before reading it.
+
         Returns:
             Parser instantiated from received path.
 
         """
-        with open(path) as fp:
+        with step("fetch"), open(path) as fp:
+            size = os.fstat(fp.fileno()).st_size
+            budget.current().check_download(path, size)
             raw = fp.read()
         return cls(raw, extend_key=extend_key, reference=path, level=level)
 
@@ -99,9 +160,44 @@ class Parser(BaseParser):
         Returns:
             Parser instantiated from received url.
         """
-        raw = request(url)
+        with step("fetch"):
+            raw = request(url)
         return cls(raw, extend_key=extend_key, reference=url, level=level)
 
+    @classmethod
+    def from_git(cls, ref, extend_key=DEFAULT_EXTEND_KEY, level=0):
+        """Instantiate a parser from a file inside a local git repository.
+
+        Args:
+            ref: Git reference of the form
+                ``git+file:///path/to/repo.git#<revision>:<path>``.
+            extend_key: kwarg to construct the parser.
+            level: kwarg to construct the parser.
+
+        Returns:
+            Parser instantiated from received git reference.
+        """
+        with step("fetch"):
+            raw = git_show(ref)
+        return cls(raw, extend_key=extend_key, reference=ref, level=level)
+
+    @classmethod
+    def from_package(cls, ref, extend_key=DEFAULT_EXTEND_KEY, level=0):
+        """Instantiate a parser from a data file of an installed package.
+
+        Args:
+            ref: Package reference of the form
+                ``pkg://<package>/<path>``.
+            extend_key: kwarg to construct the parser.
+            level: kwarg to construct the parser.
+
+        Returns:
+            Parser instantiated from received package reference.
+        """
+        with step("fetch"):
+            raw = package_read(ref)
+        return cls(raw, extend_key=extend_key, reference=ref, level=level)
+
     @classmethod
     def factory(
         cls,
@@ -110,10 +206,11 @@ class Parser(BaseParser):
         parent_reference: Optional[Union[str, Path, Url]] = None,
         level=0,
     ):
-        """Instantiate a parser from url, string, or path.
+        """Instantiate a parser from url, git/package reference, or path.
 
         Args:
-            reference: Existing file/url/path with the toml contents.
+            reference: Existing file/url/git reference/package
+                reference/path with the toml contents.
             extend_key: kwarg to construct the parser.
             parent_reference: Used to parse relative paths.
             level: kwarg to construct the parser.
@@ -124,22 +221,110 @@ class Parser(BaseParser):
         Raises:
             ValueError: Attempted to intantiate a parser with a relative
                 path as reference, without a parent reference.
+            BudgetExceeded: Too many references, or too deep an
+                inheritance chain (see `drytoml.budget`).
         """
 
-        if Url.validate(reference):
+        located = cls.locate(reference, parent_reference)
+        budget.current().reference(located, level)
+        if isinstance(located, Url):
             return cls.from_url(
-                reference,
+                located,
                 extend_key=extend_key,
                 level=level,
             )
+        if isinstance(located, GitRef):
+            return cls.from_git(
+                located,
+                extend_key=extend_key,
+                level=level,
+            )
+        if isinstance(located, PkgRef):
+            return cls.from_package(
+                located,
+                extend_key=extend_key,
+                level=level,
+            )
+
+        return cls.from_file(located, extend_key=extend_key, level=level)
+
+    @staticmethod
+    def locate(
+        reference: Union[str, Url, Path],
+        parent_reference: Optional[Union[str, Path, Url]] = None,
+    ) -> Union[Url, GitRef, PkgRef, Path]:
+        """Compute the absolute location of a reference.
+
+        Args:
+            reference: Existing file/url/git reference/package
+                reference/path with the toml contents.
+            parent_reference: Used to parse relative paths. Relative
+                paths inside a git reference point to the same revision
+                of the same repository, and relative paths inside a
+                package reference to the same package.
+
+        Returns:
+            The url, the git or package reference, or the absolute path,
+                for the reference. Urls are rewritten according to the
+                configured mirrors (see `drytoml.mirrors`).
+
+        Raises:
+            ValueError: Received a relative path as reference, without a
+                parent reference.
+        """
+        if Url.validate(reference):
+            return mirrors.rewrite(reference)
+        if GitRef.validate(reference):
+            return GitRef(reference)
+        if PkgRef.validate(reference):
+            return PkgRef(reference)
 
         path = Path(reference)
         if not path.is_absolute():
             if not parent_reference:
                 raise ValueError("Must supply absolute path or parent")
-            path = (parent_reference.parent / path).resolve()
+            if GitRef.validate(parent_reference):
+                parent = GitRef(parent_reference)
+                inner = posixpath.join(posixpath.dirname(parent.path), path)
+                return parent.at(parent.rev, posixpath.normpath(inner))
+            if PkgRef.validate(parent_reference):
+                parent = PkgRef(parent_reference)
+                inner = posixpath.join(posixpath.dirname(parent.path), path)
+                return parent.at(posixpath.normpath(inner))
+            path = (Path(parent_reference).parent / path).resolve()
+        return path
+
+    def references(
+        self,
+        document: Optional[TOMLDocument] = None,
+    ) -> List[Union[Url, GitRef, PkgRef, Path]]:
+        """List the references required by this document.
 
-        return cls.from_file(path, extend_key=extend_key, level=level)
+        The document is parsed without transcluding anything, so this
+        is cheap and does not trigger any fetch.
+
+        Args:
+            document: The document, as returned by `parse_raw`. Parsed
+                from the source if not set.
+
+        Returns:
+            The located references, in order of appeareance.
+        """
+        if document is None:
+            document = super().parse()
+        found = []
+        with step("find"):
+            located = list(deep_find(document, self.extend_key))
+        pending = [value for __, value in located]
+        while pending:
+            value = pending.pop(0)
+            if isinstance(value, str):
+                found.append(self.locate(str(value), self.reference))
+            elif isinstance(value, list):
+                pending[:0] = value
+            elif isinstance(value, dict):
+                pending[:0] = value.values()
+        return found
 
     @property
     def _log_indent(self):
@@ -154,27 +339,85 @@ class Parser(BaseParser):
 {"="*30}{self} CONTENTS END HERE{"="*30}"""
         ).replace("\n", f"\n{self._log_indent}")
 
-    def parse(self) -> TOMLDocument:
-        """Parse recursively until no transclusions are required.
+    def parse(self, provenance: bool = False) -> TOMLDocument:
+        """Parse until no transclusions are required.
+
+        References are resolved by `drytoml.worklist`, without
+        recursion. The whole resolution, including child documents, is
+        bounded by a fresh budget (see `drytoml.budget.configured`), or
+        by the active one, and reported as the `resolve` phase when
+        profiling.
+
+        Args:
+            provenance: Record the origin of every value in
+                `self.provenance`, eg to explain them. Off by default,
+                as walking every document is expensive.
 
         Returns:
             The parsed, transcluded document.
         """
-        document = super().parse()
+        self.tracking = self.tracking or provenance
+        if self.level:
+            return worklist.resolve(self)
+        with phase("resolve"), budget.limits() as limits:
+            with deadline(limits.seconds):
+                return worklist.resolve(self, limits=limits)
+
+    def parse_raw(self) -> TOMLDocument:
+        """Parse the source, without transcluding anything.
+
+        Raises:
+            BudgetExceeded: Too many bytes read, or values parsed (see
+                `drytoml.budget`).
+
+        Returns:
+            The parsed document, which may contain the extend key.
+        """
+        limits = budget.current()
+        limits.read(self.reference, self.size)
+        with step("parse"):
+            document = super().parse()
+        limits.materialized(self.reference, document)
+        if self.tracking:
+            self.provenance = Provenance.from_document(
+                document,
+                "(string)" if self.from_string else self.reference,
+                self.extend_key,
+            )
+        return document
+
+    def merge_layers(self, document: TOMLDocument) -> TOMLDocument:
+        """Transclude the references of a document.
+
+        Args:
+            document: The document, as returned by `parse_raw`. Its
+                references must be resolved already, in `self.layers`.
+
+        Returns:
+            The transcluded document: `document` itself, or (for layers
+                of another document) the bases it was merged onto.
+        """
         logger.info("%s: Parsing started", self)
-        logger.debug(
-            "%s: Source contents:\n\n%s", self, self._log_document(document)
-        )
+        # serializing the document is expensive, avoid it unless shown
+        verbose = logger.isEnabledFor(logging.DEBUG)
+        if verbose:
+            logger.debug(
+                "%s: Source contents:\n\n%s",
+                self,
+                self._log_document(document),
+            )
 
-        while True:
+        # layers are resolved already, so merging them never brings new
+        # references: a single pass finds every location
+        with step("find"):
             base_key_locations = sorted(
                 deep_find(document, self.extend_key),
                 key=lambda path_ct: path_ct[0],
             )
 
-            if not base_key_locations:
-                logger.debug("%s: No %s found", self, self.extend_key)
-                break
+        if not base_key_locations:
+            logger.debug("%s: No %s found", self, self.extend_key)
+        else:
             logger.info(
                 "%s: Found '%s': at %s",
                 self,
@@ -185,15 +428,19 @@ class Parser(BaseParser):
                 ],
             )
 
-            for breadcrumbs, value in base_key_locations:
+        for breadcrumbs, value in base_key_locations:
+            if verbose:
                 logger.debug(
                     "%s: Before merging %s contents:\n\n%s",
                     self,
                     breadcrumbs,
                     self._log_document(document),
                 )
+            with step("merge"):
                 merge = TomlMerger(document, self)
                 merge(value, breadcrumbs, delete_dangling=True)
+                document = merge.container
+            if verbose:
                 logger.debug(
                     "%s: After merging %s contents:\n\n%s",
                     self,
@@ -202,9 +449,10 @@ class Parser(BaseParser):
                 )
 
         logger.info("%s: Parsing finished", self)
-        logger.debug(
-            "%s: Final contents:\n\n%s",
-            self,
-            self._log_document(document),
-        )
+        if verbose:
+            logger.debug(
+                "%s: Final contents:\n\n%s",
+                self,
+                self._log_document(document),
+            )
         return document
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""Opt-in profiling of a whole drytoml invocation.
+
+When enabled (see `drytoml.settings.PROFILE`), the invocation runs under
+`cProfile`, while a background thread samples the stacks to build a
+flamegraph-ready collapsed-stack file. Threads started meanwhile (eg the
+pool merging layers, see `drytoml.worklist`) are profiled and sampled
+too. Time is split in phases (eg drytoml's resolution vs the wrapped
+tool), so the report shows where a slow run spends its time.
+
+Resolutions are further split in steps (eg fetch, parse, merge), which
+are recorded by an active `Stopwatch`, from any thread (see
+`drytoml.app.bench`).
+
+Outputs, for a given `path`:
+
+* `path`: pstats dump, for `python -m pstats` or snakeviz.
+* `path.collapsed`: collapsed stacks, for `flamegraph.pl` or speedscope.
+* `path.phases.json`: wall time spent in each phase.
+"""
+
+import cProfile
+import json
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Union
+
+from drytoml import logger
+
+DEFAULT_PHASE = "drytoml"
+"""Name of the phase for anything outside an explicit `phase`."""
+
+
+class Profiler:
+    """Profile the current process, splitting time by phase."""
+
+    def __init__(self, path: Union[str, Path], interval: float = 0.001):
+        """Construct a profiler.
+
+        Args:
+            path: Destination of the pstats dump. Other outputs are
+                stored next to it, using it as prefix.
+            interval: Seconds between stack samples.
+        """
+        self.path = Path(path)
+        self.interval = interval
+        self.phases: Dict[str, float] = {}
+        self.samples: Counter = Counter()
+        self._stack: List[str] = [DEFAULT_PHASE]
+        self._profile = cProfile.Profile()
+        self._thread_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.thread_id = threading.get_ident()
+        self._sampler = threading.Thread(
+            target=self._sample,
+            name="drytoml-profiler",
+            daemon=True,
+        )
+
+    @contextmanager
+    def phase(self, name: str):
+        """Attribute the time spent inside the context to a phase.
+
+        Args:
+            name: Name of the phase.
+
+        Yields:
+            Nothing, just runs the context.
+        """
+        self._stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0) + elapsed
+            self._stack.pop()
+
+    def _sample(self):
+        sampler = threading.get_ident()
+        while not self._done.wait(self.interval):
+            frames = sys._current_frames()  # noqa: W0212
+            for thread_id, frame in frames.items():
+                if thread_id != sampler:
+                    self._record(frame)
+
+    def _record(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(
+                "{} ({}:{})".format(
+                    code.co_name,
+                    Path(code.co_filename).name,
+                    code.co_firstlineno,
+                ).replace(";", ":")
+            )
+            frame = frame.f_back
+        # other threads are attributed to the phase of the main thread,
+        # which is waiting for them
+        stack.append(self._stack[-1])
+        self.samples[";".join(reversed(stack))] += 1
+
+    def _profile_thread(self, *args):
+        # installed by `threading.setprofile`: runs once, on the first
+        # event of every new thread, and replaces itself with cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # pragma: no cover - single profiler (3.12+)
+            sys.setprofile(None)
+            return
+        with self._lock:
+            self._thread_profiles.append(profile)
+
+    def start(self):
+        """Start profiling."""
+        self._start = time.perf_counter()
+        self._sampler.start()
+        threading.setprofile(self._profile_thread)
+        self._profile.enable()
+
+    def stop(self):
+        """Stop profiling and write the reports."""
+        self._profile.disable()
+        threading.setprofile(None)
+        self._done.set()
+        self._sampler.join()
+        total = time.perf_counter() - self._start
+        phases = {
+            DEFAULT_PHASE: total - sum(self.phases.values()),
+            **self.phases,
+        }
+
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        stats = pstats.Stats(self._profile)
+        with self._lock:
+            for profile in self._thread_profiles:
+                stats.add(profile)
+        stats.dump_stats(str(self.path))
+        with open(f"{self.path}.collapsed", "w") as fp:
+            for stack, count in sorted(self.samples.items()):
+                fp.write(f"{stack} {count}\n")
+        with open(f"{self.path}.phases.json", "w") as fp:
+            json.dump({"total": total, "phases": phases}, fp, indent=2)
+
+        logger.info(
+            "drytoml-profile: %.3fs total (%s). Reports at %s[.collapsed]",
+            total,
+            ", ".join(f"{name}: {secs:.3f}s" for name, secs in phases.items()),
+            self.path,
+        )
+
+
+PROFILER: Optional[Profiler] = None
+"""The active profiler, if any."""
+
+
+@contextmanager
+def profiled(path: Optional[Union[str, Path]]):
+    """Profile the code inside the context, if a path is received.
+
+    Args:
+        path: Destination of the pstats dump. If empty, do not profile.
+
+    Yields:
+        The active profiler, or `None`.
+    """
+    global PROFILER  # noqa: W0603
+
+    if not path:
+        yield None
+        return
+
+    PROFILER = Profiler(path)
+    PROFILER.start()
+    try:
+        yield PROFILER
+    finally:
+        PROFILER.stop()
+        PROFILER = None
+
+
+@contextmanager
+def phase(name: str):
+    """Attribute the time spent inside the context to a phase.
+
+    This is a no-op unless profiling is enabled.
+
+    Args:
+        name: Name of the phase, eg `resolve` or `tool`.
+
+    Yields:
+        Nothing, just runs the context.
+    """
+    if PROFILER is None or threading.get_ident() != PROFILER.thread_id:
+        yield
+        return
+    with PROFILER.phase(name):
+        yield
+
+
+class Stopwatch:
+    """Thread-safe accumulator of the time spent in each step."""
+
+    def __init__(self):
+        """Construct an empty stopwatch."""
+        self.steps: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        """Attribute time to a step.
+
+        Args:
+            name: Name of the step.
+            seconds: Time spent.
+        """
+        with self._lock:
+            self.steps[name] = self.steps.get(name, 0) + seconds
+
+
+STOPWATCH: Optional[Stopwatch] = None
+"""The active stopwatch, if any."""
+
+
+@contextmanager
+def timed():
+    """Record the time spent in each step inside the context.
+
+    Yields:
+        The active stopwatch. Steps from concurrent threads are added
+            up, so they may exceed the wall time.
+    """
+    global STOPWATCH  # noqa: W0603
+
+    STOPWATCH = Stopwatch()
+    try:
+        yield STOPWATCH
+    finally:
+        STOPWATCH = None
+
+
+@contextmanager
+def step(name: str):
+    """Attribute the time spent inside the context to a step.
+
+    This is a no-op unless a stopwatch is active (see `timed`).
+
+    Args:
+        name: Name of the step, eg `fetch` or `merge`.
+
+    Yields:
+        Nothing, just runs the context.
+    """
+    stopwatch = STOPWATCH
+    if stopwatch is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stopwatch.add(name, time.perf_counter() - start)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""Track which document supplied each key of a resolved document.
+
+Every parser records the keys of its own source, and merges the records
+of the layers it transcludes using the same precedence as
+`drytoml.merge.deep_merge`: the first value wins, later ones are
+shadowed, and arrays accumulate every contribution. Only leaves (values
+which are not tables) are tracked, so the records stay small.
+"""
+
+import json
+import re
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+import tomlkit
+
+from drytoml.formats import unwrap
+
+KeyPath = Tuple[str, ...]
+
+BARE_KEY = re.compile(r"[A-Za-z0-9_-]+")
+"""Keys which can be written without quotes."""
+
+
+class Origin(NamedTuple):
+    """A value supplied by a specific document."""
+
+    reference: str
+    """The document which contains the value."""
+
+    level: int
+    """Transclusion depth of the document: 0 for the resolved one."""
+
+    value: Any
+    """The supplied value, as plain python data."""
+
+    used: bool = True
+    """Whether the value is part of the resolved document."""
+
+
+def leaves(
+    container: dict,
+    extend_key: str,
+    prefix: KeyPath = (),
+) -> Iterator[Tuple[KeyPath, Any]]:
+    """Walk the non-table values of a document.
+
+    Args:
+        container: Where to look for values.
+        extend_key: Name of the transclusion key, which is skipped.
+        prefix: Location of the container.
+
+    Yields:
+        Tuples of (location, value).
+    """
+    for key, value in container.items():
+        key = str(key)
+        if key == extend_key:
+            continue
+        if isinstance(value, dict):
+            yield from leaves(value, extend_key, (*prefix, key))
+        else:
+            yield (*prefix, key), value
+
+
+def split(key: Union[str, KeyPath]) -> KeyPath:
+    """Convert a dotted key into a location.
+
+    Dotted keys use the toml syntax, so parts may be quoted, eg
+    ``tool."a.b".c`` is ``("tool", "a.b", "c")``.
+
+    Args:
+        key: Dotted key, eg ``tool.black.line-length``, or a location.
+
+    Raises:
+        ValueError: The dotted key is not valid toml.
+
+    Returns:
+        The location, eg ``("tool", "black", "line-length")``.
+    """
+    if not isinstance(key, str):
+        return tuple(key)
+    if not key.strip():
+        return ()
+    if "\n" in key:
+        raise ValueError(f"Invalid key: {key!r}")
+
+    # parse it as a table header, which tomlkit splits into nested tables
+    node = tomlkit.parse(f"[{key}]")
+    location = []
+    while node:
+        if not isinstance(node, Mapping) or len(node) != 1:
+            raise ValueError(f"Invalid key: {key!r}")
+        ((part, node),) = node.items()
+        location.append(str(part))
+    return tuple(location)
+
+
+def dotted(location: KeyPath) -> str:
+    """Convert a location into a dotted key, the inverse of `split`.
+
+    Args:
+        location: Keys to join, eg ``("tool", "a.b", "c")``.
+
+    Returns:
+        The dotted key, quoting parts when needed, eg ``tool."a.b".c``.
+    """
+    return ".".join(
+        part if BARE_KEY.fullmatch(part) else json.dumps(part)
+        for part in location
+    )
+
+
+class Provenance:
+    """Map each location of a resolved document to its origins."""
+
+    def __init__(self, origins: Optional[Dict[KeyPath, List[Origin]]] = None):
+        """Construct the records.
+
+        Args:
+            origins: Mapping of location -> origins. The ones used come
+                first, in order of precedence, followed by the shadowed
+                ones.
+        """
+        self.origins = origins or {}
+
+    @classmethod
+    def from_document(
+        cls,
+        document: dict,
+        reference: str,
+        extend_key: str,
+    ) -> "Provenance":
+        """Record the values of a document, before any transclusion.
+
+        Args:
+            document: The parsed document.
+            reference: Where the document comes from.
+            extend_key: Name of the transclusion key, which is skipped.
+
+        Returns:
+            The records, attributing every value to `reference`.
+        """
+        return cls(
+            {
+                location: [Origin(str(reference), 0, unwrap(value))]
+                for location, value in leaves(document, extend_key)
+            }
+        )
+
+    def merge(self, incoming: "Provenance", breadcrumbs: List):
+        """Add the records of a layer transcluded into this document.
+
+        Args:
+            incoming: Records of the (resolved) transcluded layer.
+            breadcrumbs: Location of the transclusion.
+        """
+        # arrays are leaves, so transclusions inside them are attributed
+        # to the whole array
+        prefix = []
+        for crumb in breadcrumbs:
+            if not isinstance(crumb, str):
+                break
+            prefix.append(str(crumb))
+        prefix = tuple(prefix)
+
+        for location, origins in incoming.origins.items():
+            if location[: len(prefix)] != prefix:
+                continue
+            deeper = [
+                origin._replace(level=origin.level + 1) for origin in origins
+            ]
+            current = self.origins.get(location)
+            if not current:
+                self.origins[location] = deeper
+            elif isinstance(current[0].value, list):
+                used = sum(origin.used for origin in current)
+                current[used:used] = [o for o in deeper if o.used]
+                current.extend(o for o in deeper if not o.used)
+            else:
+                current.extend(o._replace(used=False) for o in deeper)
+
+    def lookup(self, key: Union[str, KeyPath]) -> Dict[KeyPath, List[Origin]]:
+        """Find the origins of a key, or of every key inside a table.
+
+        Args:
+            key: Dotted key (eg ``tool.black.line-length``) or location.
+
+        Returns:
+            Mapping of location -> origins, for every tracked location
+                equal to or inside `key`.
+
+        Examples:
+            >>> parser = Parser.from_file("pyproject.toml")
+            >>> document = parser.parse()
+            >>> parser.provenance.lookup("tool.black.line-length")
+            {('tool', 'black', 'line-length'): [Origin(reference='...',
+            level=1, value=100, used=True)]}
+        """
+        location = split(key)
+        return {
+            found: origins
+            for found, origins in self.origins.items()
+            if found[: len(location)] == location
+        }
+
+    def explain(self, key: Union[str, KeyPath]) -> str:
+        """Describe where a key comes from, in a human-friendly way.
+
+        Args:
+            key: Dotted key (eg ``tool.black.line-length``) or location.
+
+        Returns:
+            One paragraph per location: the origins of the resolved
+                value, followed by the shadowed ones.
+        """
+        found = self.lookup(key)
+        if not found:
+            return f"{key}: not found"
+        paragraphs = []
+        for location, origins in sorted(found.items()):
+            lines = [dotted(location)]
+            for origin in origins:
+                lines.append(
+                    "  {} {!r} from {} (level {})".format(
+                        "uses" if origin.used else "shadows",
+                        origin.value,
+                        origin.reference,
+                        origin.level,
+                    )
+                )
+            paragraphs.append("\n".join(lines))
+        return "\n".join(paragraphs)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Resolve many documents concurrently, sharing work between threads.
+
+Parsers hold per-resolution state, so they can not be shared. A
+`Resolver` can: every call builds its own parsers, while resolved
+documents are memoized (see `drytoml.memo.ResolvedCache`), and
+concurrent resolutions of the same document are coalesced (see
+`drytoml.memo.SingleFlight`). Shared bases are also coalesced, through
+`drytoml.merge.LAYERS`, and fetched once thanks to the cache locks.
+
+Resolvers can also return frozen documents (see `drytoml.frozen`),
+which share identical subtrees, to hold many of them in memory.
+"""
+
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from tomlkit.toml_document import TOMLDocument
+
+from drytoml import settings
+from drytoml.frozen import INTERNER
+from drytoml.frozen import FrozenDict
+from drytoml.frozen import Interner
+from drytoml.frozen import freeze
+from drytoml.memo import ResolvedCache
+from drytoml.memo import SingleFlight
+from drytoml.memo import now
+from drytoml.parser import DEFAULT_EXTEND_KEY
+from drytoml.parser import Parser
+from drytoml.types import GitRef
+from drytoml.types import PkgRef
+from drytoml.types import Url
+
+Reference = Union[str, Path, Url, GitRef, PkgRef]
+
+
+class Resolver:
+    """Thread-safe resolution of documents, with de-duplication."""
+
+    def __init__(
+        self,
+        extend_key: str = DEFAULT_EXTEND_KEY,
+        cache: Optional[ResolvedCache] = None,
+        interner: Optional[Interner] = None,
+    ):
+        """Construct a resolver, which can be shared between threads.
+
+        Args:
+            extend_key: Name to look for inside the documents to activate
+                interpolation.
+            cache: Where to memoize resolved documents. Defaults to a
+                new cache of `drytoml.settings.LOAD_CACHE_SIZE` entries.
+            interner: Where to store the subtrees of frozen documents.
+                Defaults to `drytoml.frozen.INTERNER`.
+        """
+        self.extend_key = extend_key
+        if cache is None:
+            cache = ResolvedCache(settings.LOAD_CACHE_SIZE)
+        self.cache = cache
+        self.interner = INTERNER if interner is None else interner
+        self.flights = SingleFlight()
+
+    @staticmethod
+    def locate(reference: Reference) -> Union[Url, GitRef, PkgRef, Path]:
+        """Compute the absolute location of a root document.
+
+        Args:
+            reference: Existing file/url/git reference/package reference
+                with the toml contents. Relative paths start from the
+                working directory.
+
+        Returns:
+            The url, the git or package reference, or the absolute path.
+        """
+        if any(kind.validate(reference) for kind in (Url, GitRef, PkgRef)):
+            return Parser.locate(str(reference))
+        return Path(reference).resolve()
+
+    def resolve(
+        self,
+        reference: Reference,
+        extend_key: Optional[str] = None,
+        frozen: bool = False,
+    ) -> Union[TOMLDocument, FrozenDict]:
+        """Resolve a document, reusing previous or in-progress results.
+
+        Args:
+            reference: Existing file/url/git reference with the toml
+                contents.
+            extend_key: Overrides the resolver's `extend_key`.
+            frozen: Return an immutable document, sharing its subtrees
+                with every other frozen document of this resolver.
+
+        Returns:
+            The frozen document, or a copy of the resolved document:
+                callers are free to modify it.
+        """
+        located = self.locate(reference)
+        key = (str(located), extend_key or self.extend_key)
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = self.flights.do(key, lambda: self._resolve(located, key))
+        if frozen:
+            return freeze(entry[0], self.interner)
+        return copy.deepcopy(entry[0])
+
+    def _resolve(self, located, key: Tuple[str, str]):
+        started = now()
+        parser = Parser.factory(located, extend_key=key[1])
+        document = parser.parse()
+        self.cache.put(key, document, parser.dependencies, started)
+        return document, parser.dependencies
+
+    def resolve_all(
+        self,
+        references: Iterable[Reference],
+        max_workers: Optional[int] = None,
+        frozen: bool = False,
+    ) -> Dict[Reference, Union[TOMLDocument, FrozenDict]]:
+        """Resolve several documents using a thread pool.
+
+        Args:
+            references: Documents to resolve.
+            max_workers: Size of the thread pool. Defaults to
+                `ThreadPoolExecutor`'s default.
+            frozen: Return immutable documents, see `resolve`.
+
+        Returns:
+            Reference -> resolved document mapping, in the received
+                order. Errors are raised after every resolution ends.
+
+        Examples:
+            >>> resolver = Resolver()
+            >>> documents = resolver.resolve_all(
+            ...     f"{repo}/pyproject.toml" for repo in repositories
+            ... )
+        """
+        references = list(references)
+        with ThreadPoolExecutor(max_workers) as pool:
+            documents = list(
+                pool.map(
+                    lambda reference: self.resolve(reference, frozen=frozen),
+                    references,
+                )
+            )
+        return dict(zip(references, documents))
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Share a machine's drytoml cache with other machines, over HTTP.
+
+A cache server fetches remote references on behalf of its clients,
+through its own cache: entries older than its ttl are revalidated
+against the upstream, and failures follow the usual negative caching
+and stale fallback settings. Clients use it by setting
+`drytoml.settings.PROXY`, and fetch directly if it is unavailable (but
+not when it relays an upstream error, which is final).
+
+Endpoints:
+
+* ``GET /fetch?url=<upstream url>``: The upstream contents. Upstream
+  HTTP errors are relayed with their status, marked with
+  `drytoml.utils.RELAYED_HEADER`, other failures return 502. Only the
+  urls matching the server's allow-list can be requested.
+* ``GET /healthz``: Liveness probe.
+"""
+
+from fnmatch import fnmatchcase
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Sequence
+from typing import Tuple
+from urllib.error import HTTPError
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+from drytoml import logger
+from drytoml.types import Url
+from drytoml.utils import PROXY_PATH
+from drytoml.utils import RELAYED_HEADER
+from drytoml.utils import request
+
+
+class CacheHandler(BaseHTTPRequestHandler):
+    """Serve remote references from drytoml's cache."""
+
+    server: "CacheServer"
+
+    def do_GET(self):  # noqa: N802
+        """Answer a GET request."""
+        parsed = urlparse(self.path)
+        if parsed.path == "/healthz":
+            return self.respond(200, "ok")
+        if parsed.path != PROXY_PATH:
+            return self.respond(404, "Not found")
+
+        url = parse_qs(parsed.query).get("url", [""])[0]
+        if not Url.validate(url):
+            return self.respond(400, "Missing or invalid url")
+        if not any(fnmatchcase(url, pattern) for pattern in self.server.allow):
+            return self.respond(403, "Url not allowed")
+
+        try:
+            return self.respond(200, request(url))
+        except HTTPError as exc:
+            return self.respond(exc.code, str(exc), relayed=True)
+        except (OSError, ValueError) as exc:
+            return self.respond(502, str(exc))
+
+    def respond(self, status: int, body: str, relayed: bool = False):
+        """Send a plain text response.
+
+        Args:
+            status: HTTP status code.
+            body: Response contents.
+            relayed: Whether the status was answered by the upstream.
+        """
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        if relayed:
+            self.send_header(RELAYED_HEADER, "1")
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):  # noqa: A002
+        """Log requests through drytoml's logger.
+
+        Args:
+            format: Message format.
+            args: Message arguments.
+        """
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+class CacheServer(ThreadingMixIn, HTTPServer):
+    """Multi-threaded HTTP server for drytoml's cache."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        allow: Sequence[str] = (),
+    ):
+        """Bind the server.
+
+        Args:
+            address: Host and port to listen on. Use port 0 to pick a
+                free one.
+            allow: Glob patterns of the upstream urls which can be
+                requested through the server. Nothing is allowed by
+                default: the server would be an open proxy otherwise.
+        """
+        super().__init__(address, CacheHandler)
+        self.allow = tuple(allow)
+
+    @property
+    def url(self) -> str:
+        """Compute the url clients should use as proxy.
+
+        Returns:
+            Base url of the server.
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
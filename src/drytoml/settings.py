@@ -0,0 +1,192 @@
+"""Runtime settings for drytoml, configurable through env vars."""
+
+import os
+from typing import Optional
+
+
+def env_float(name: str, default: Optional[float]) -> Optional[float]:
+    """Retreive a float from an env var, with a fallback value.
+
+    Args:
+        name: Name of the environment variable.
+        default: Value to use if the env var is not set or empty.
+
+    Returns:
+        Resulting value. Non-positive values are interpreted as `None`,
+        meaning "no limit".
+
+    Examples:
+
+        For an exising env var, eg `DRYTOML_TIMEOUT=2.5`:
+        >>> env_float("DRYTOML_TIMEOUT", 10)
+        2.5
+
+        For an env var not present:
+        >>> env_float("DRYTOML_NOT_SET", 10)
+        10
+    """
+    raw = os.environ.get(name, "")
+    if not raw:
+        return default
+    value = float(raw)
+    return value if value > 0 else None
+
+
+def env_int(name: str, default: Optional[int]) -> Optional[int]:
+    """Retreive an integer from an env var, with a fallback value.
+
+    Args:
+        name: Name of the environment variable.
+        default: Value to use if the env var is not set or empty.
+
+    Returns:
+        Resulting value. Non-positive values are interpreted as `None`,
+        meaning "no limit".
+    """
+    value = env_float(name, default)
+    return None if value is None else int(value)
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """Retreive a boolean from an env var.
+
+    Args:
+        name: Name of the environment variable.
+        default: Value to use if the env var is not set.
+
+    Returns:
+        `True` iff the env var contains a truthy string.
+    """
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    return raw.lower() in {"1", "t", "true", "y", "yes", "on"}
+
+
+TIMEOUT = env_float("DRYTOML_TIMEOUT", 10)
+"""Seconds to wait for a single remote request before giving up.
+It can be overriden by changing the DRYTOML_TIMEOUT env var.
+"""
+
+RETRIES = int(env_float("DRYTOML_RETRIES", 2) or 0)
+"""Number of additional attempts for a failed remote request.
+It can be overriden by changing the DRYTOML_RETRIES env var.
+"""
+
+BACKOFF = env_float("DRYTOML_BACKOFF", 0.5)
+"""Base delay (in seconds) for the jittered exponential backoff.
+It can be overriden by changing the DRYTOML_BACKOFF env var.
+"""
+
+DEADLINE = env_float("DRYTOML_DEADLINE", 60)
+"""Maximum seconds allowed to resolve a document, including all fetches.
+It can be overriden by changing the DRYTOML_DEADLINE env var, or the
+`--deadline` flag.
+"""
+
+CACHE_TTL = env_float("DRYTOML_CACHE_TTL", None)
+"""Seconds after which a cached remote reference is fetched again.
+By default, cached entries never expire. It can be overriden by
+changing the DRYTOML_CACHE_TTL env var.
+"""
+
+NEGATIVE_TTL = env_float("DRYTOML_NEGATIVE_TTL", 60)
+"""Seconds during which a failed url is not requested again.
+It can be overriden by changing the DRYTOML_NEGATIVE_TTL env var.
+"""
+
+STALE_FALLBACK = env_flag("DRYTOML_STALE_FALLBACK")
+"""Use the last good cached copy when fetching a remote reference fails.
+It can be enabled by setting the DRYTOML_STALE_FALLBACK env var.
+"""
+
+OFFLINE = env_flag("DRYTOML_OFFLINE")
+"""Never fetch remote references: use cached entries, even if expired,
+and fail for anything not cached.
+It can be enabled by setting the DRYTOML_OFFLINE env var.
+"""
+
+METRICS_TEXTFILE = os.environ.get("DRYTOML_METRICS_TEXTFILE", "")
+"""If set, export cache metrics to this prometheus textfile on exit.
+It can be set with the DRYTOML_METRICS_TEXTFILE env var.
+"""
+
+PROFILE = os.environ.get("DRYTOML_PROFILE", "")
+"""If set, profile the whole invocation and write the reports here.
+It can be set with the DRYTOML_PROFILE env var, or the `--profile` flag.
+"""
+
+LOAD_CACHE_SIZE = int(env_float("DRYTOML_LOAD_CACHE_SIZE", 128) or 0)
+"""Maximum number of resolved documents kept in memory by `drytoml.load`.
+It can be overriden by changing the DRYTOML_LOAD_CACHE_SIZE env var.
+"""
+
+LAYER_CACHE_SIZE = int(env_float("DRYTOML_LAYER_CACHE_SIZE", 256) or 0)
+"""Maximum number of intermediate layers (a base, with its own
+transclusions already merged) kept in memory for reuse.
+It can be overriden by changing the DRYTOML_LAYER_CACHE_SIZE env var.
+"""
+
+INTERNER_SIZE = int(env_float("DRYTOML_INTERNER_SIZE", 65536) or 0)
+"""Maximum number of distinct frozen subtrees (tables and arrays) kept by
+`drytoml.frozen.INTERNER`. The least recently used ones are forgotten
+first: documents holding them stay valid, but stop being shared.
+It can be overriden by changing the DRYTOML_INTERNER_SIZE env var.
+"""
+
+MIRRORS = os.environ.get("DRYTOML_MIRRORS", "")
+"""Whitespace-separated `prefix=target` url rewrites, applied before the
+rules in `drytoml.mirrors.MIRRORS_NAME`.
+It can be set with the DRYTOML_MIRRORS env var.
+"""
+
+MERGE_KEYS = os.environ.get("DRYTOML_MERGE_KEYS", "")
+"""Whitespace-separated `location=field` pairs, declaring the arrays of
+tables merged by key instead of concatenated, eg
+`tool.mypy.overrides=module` (see `drytoml.merge.keyed_extend`).
+It can be set with the DRYTOML_MERGE_KEYS env var.
+"""
+
+PROXY = os.environ.get("DRYTOML_PROXY", "")
+"""If set, fetch remote references through this drytoml cache server
+(see `drytoml.server`), eg `http://cache-node:8765`. Remote references
+are fetched directly if the server is unavailable.
+It can be set with the DRYTOML_PROXY env var.
+"""
+
+ZYGOTE = os.environ.get("DRYTOML_ZYGOTE", "")
+"""If set, run wrapped tools inside the zygote listening on this unix
+socket (see `drytoml.app.zygote`), eg `/tmp/drytoml.sock`. Tools run
+in-process if the zygote is unavailable.
+It can be set with the DRYTOML_ZYGOTE env var.
+"""
+
+WORKERS = int(env_float("DRYTOML_WORKERS", 8) or 1)
+"""Maximum number of references fetched or merged at the same time.
+It can be overriden by changing the DRYTOML_WORKERS env var.
+"""
+
+MAX_BYTES = env_int("DRYTOML_MAX_BYTES", 64 * 2 ** 20)
+"""Maximum total bytes of the documents read to resolve a document.
+It can be overriden by changing the DRYTOML_MAX_BYTES env var, or the
+`--max-bytes` flag.
+"""
+
+MAX_REFERENCES = env_int("DRYTOML_MAX_REFERENCES", 1000)
+"""Maximum number of documents referenced while resolving a document.
+It can be overriden by changing the DRYTOML_MAX_REFERENCES env var, or
+the `--max-references` flag.
+"""
+
+MAX_DEPTH = env_int("DRYTOML_MAX_DEPTH", 1000)
+"""Maximum length of an inheritance chain.
+It can be overriden by changing the DRYTOML_MAX_DEPTH env var, or the
+`--max-depth` flag.
+"""
+
+MAX_VALUES = env_int("DRYTOML_MAX_VALUES", 10 ** 6)
+"""Maximum number of values (including array items) read or copied by a
+resolution (see `drytoml.budget`).
+It can be overriden by changing the DRYTOML_MAX_VALUES env var, or the
+`--max-values` flag.
+"""
@@ -44,3 +44,131 @@ class Url(str):
             `True` iff validation succeeds.
         """
         return cls.URL_VALIDATOR.match(str(maybe_url)) is not None
+
+
+class GitRef(str):
+    """Avoid instantiation for non-compliant git reference strings.
+
+    Git references point to a file at a specific revision of a local
+    repository (usually a bare mirror), using the form
+    ``git+file:///path/to/repo.git#<revision>:<path/inside/repo>``.
+    """
+
+    GIT_VALIDATOR = re.compile(
+        r"^git\+file://(?P<repo>/[^#]+)#(?P<rev>[^:]+):(?P<path>.+)$"
+    )
+    """Git reference validator."""
+
+    IMMUTABLE = re.compile(r"^[0-9a-f]{40}$")
+    """Full commit sha, which always points to the same contents."""
+
+    def __init__(self, string):
+        """Validate string as git reference before instantiating.
+
+        Args:
+            string: Git reference to validate
+
+        Raises:
+            ValueError: The received string is not a valid git reference.
+        """
+        match = self.GIT_VALIDATOR.match(str(string))
+        if not match:
+            raise ValueError("Not a valid git reference")
+        self.repo = match["repo"]
+        self.rev = match["rev"]
+        self.path = match["path"]
+        super().__init__()
+
+    @classmethod
+    def validate(
+        cls,
+        maybe_ref,
+    ) -> bool:
+        """Validate git reference string.
+
+        Args:
+            maybe_ref: Reference to validate.
+
+        Returns:
+            `True` iff validation succeeds.
+        """
+        return cls.GIT_VALIDATOR.match(str(maybe_ref)) is not None
+
+    @property
+    def immutable(self) -> bool:
+        """Check if the revision is a full commit sha.
+
+        Returns:
+            `True` iff the contents can never change.
+        """
+        return self.IMMUTABLE.match(self.rev) is not None
+
+    def at(self, rev: str, path: str = "") -> "GitRef":
+        """Point to another revision or file in the same repository.
+
+        Args:
+            rev: The new revision.
+            path: The new path inside the repository. Defaults to the
+                current one.
+
+        Returns:
+            The new reference.
+        """
+        return GitRef(f"git+file://{self.repo}#{rev}:{path or self.path}")
+
+
+class PkgRef(str):
+    """Avoid instantiation for non-compliant package reference strings.
+
+    Package references point to a data file inside an installed python
+    package, using the form ``pkg://<package>/<path/inside/package>``,
+    eg ``pkg://our_styleguide/pyproject.toml``.
+    """
+
+    PKG_VALIDATOR = re.compile(
+        r"^pkg://(?P<package>[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*)/(?P<path>.+)$"
+    )
+    """Package reference validator."""
+
+    def __init__(self, string):
+        """Validate string as package reference before instantiating.
+
+        Args:
+            string: Package reference to validate
+
+        Raises:
+            ValueError: The received string is not a valid package
+                reference.
+        """
+        match = self.PKG_VALIDATOR.match(str(string))
+        if not match:
+            raise ValueError("Not a valid package reference")
+        self.package = match["package"]
+        self.path = match["path"]
+        super().__init__()
+
+    @classmethod
+    def validate(
+        cls,
+        maybe_ref,
+    ) -> bool:
+        """Validate package reference string.
+
+        Args:
+            maybe_ref: Reference to validate.
+
+        Returns:
+            `True` iff validation succeeds.
+        """
+        return cls.PKG_VALIDATOR.match(str(maybe_ref)) is not None
+
+    def at(self, path: str) -> "PkgRef":
+        """Point to another file in the same package.
+
+        Args:
+            path: The new path inside the package.
+
+        Returns:
+            The new reference.
+        """
+        return PkgRef(f"pkg://{self.package}/{path}")
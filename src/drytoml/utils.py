@@ -3,17 +3,160 @@
 
 import functools
 import hashlib
+import importlib.util
+import pkgutil
+import random
+import subprocess as sp  # noqa: S404
+import threading
+import time
+import urllib.error
+import urllib.parse
 import urllib.request
+from contextlib import contextmanager
 from logging import root as logger
+from pathlib import Path
+from pathlib import PurePosixPath
+from pathlib import PureWindowsPath
+from typing import List
+from typing import Optional
 from typing import Union
 
-from drytoml.paths import CACHE
+try:
+    from importlib.resources import files as resource_files
+except ImportError:  # pragma: no cover - python < 3.9
+    resource_files = None
+
+from drytoml import budget
+from drytoml import index
+from drytoml import paths
+from drytoml import settings
+from drytoml.files import LockTimeout
+from drytoml.files import atomic_write
+from drytoml.files import locked
+from drytoml.metrics import METRICS
+from drytoml.metrics import host_of
+from drytoml.types import GitRef
+from drytoml.types import PkgRef
 from drytoml.types import Url
 
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+"""HTTP status codes which are worth retrying."""
+
+PROXY_PATH = "/fetch"
+"""Endpoint of drytoml cache servers, receiving the url as query."""
+
+RELAYED_HEADER = "X-Drytoml-Relayed"
+"""Set by drytoml cache servers on errors answered by the upstream, as
+opposed to errors of the server itself (eg a forbidden url)."""
+
+_deadline = threading.local()
+
+
+class DeadlineExceeded(TimeoutError):
+    """The time budget to resolve a document was exhausted."""
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Bound the total time spent fetching inside this context.
+
+    Nested deadlines never extend an outer one: the earliest expiry
+    wins.
+
+    Args:
+        seconds: Time budget for the context. If `None`, do not add any
+            restriction.
+
+    Yields:
+        The absolute expiry (as in `time.monotonic`), or `None` if
+            there is no deadline in place.
+
+    Examples:
+        >>> with deadline(30):
+        ...     Parser.from_file("pyproject.toml").parse()
+    """
+    previous = getattr(_deadline, "expires", None)
+    expires = previous
+    if seconds is not None:
+        candidate = time.monotonic() + seconds
+        expires = candidate if previous is None else min(previous, candidate)
+    _deadline.expires = expires
+    try:
+        yield expires
+    finally:
+        _deadline.expires = previous
+
+
+def remaining(default: Optional[float] = None) -> Optional[float]:
+    """Compute the time left before the current deadline expires.
+
+    Args:
+        default: Upper bound for the result, eg a per-request timeout.
+
+    Raises:
+        DeadlineExceeded: The deadline has already expired.
+
+    Returns:
+        Seconds left, capped by `default`. `None` if there is no
+            deadline nor default.
+    """
+    expires = getattr(_deadline, "expires", None)
+    if expires is None:
+        return default
+    left = expires - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("drytoml: Resolution deadline exceeded")
+    return left if default is None else min(left, default)
+
+
+def cache_path(url: Union[str, Url]) -> Path:
+    """Compute the location of a cached url.
+
+    Args:
+        url: The cached url.
+
+    Returns:
+        Path to the file inside drytoml's cache.
+    """
+    key = hashlib.sha256(url.encode("utf8")).hexdigest()
+    return paths.CACHE / key
+
+
+def _is_fresh(path: Path, ttl: Optional[float]) -> bool:
+    if not path.exists():
+        return False
+    if ttl is None:
+        return True
+    return time.time() - path.stat().st_mtime < ttl
+
+
+def is_stale(url: Union[str, Url]) -> bool:
+    """Check whether the cache entry of a url is missing or expired.
+
+    Args:
+        url: The cached url.
+
+    Returns:
+        Whether `cached` would fetch the url again (unless offline).
+    """
+    ttl = None if settings.OFFLINE else settings.CACHE_TTL
+    return not _is_fresh(cache_path(url), ttl)
+
 
 def cached(func):
     """Store output in drytoml's cache to use it on subsequent calls.
 
+    Entries are written atomically, while holding a per-entry lock
+    shared across processes: concurrent callers missing the same entry
+    wait for the first fetch and reuse its result.
+
+    Failed calls are remembered for `drytoml.settings.NEGATIVE_TTL`
+    seconds, to avoid hammering unreachable urls. If
+    `drytoml.settings.STALE_FALLBACK` is set, an expired cache entry is
+    used when the call fails. If `drytoml.settings.OFFLINE` is set,
+    the function is never called: cache entries are used regardless of
+    their age.
+
     Args:
         func: Function to decorate.
 
@@ -23,49 +166,496 @@ def cached(func):
     .. seealso::
 
        * `drytoml.paths.CACHE`
+       * `drytoml.settings`
+       * `drytoml.index`
        * `drytoml.app.cache`
     """
 
     @functools.wraps(func)
     def _wrapped(url: Url, *a, **kw):
-        key = hashlib.sha256(url.encode("utf8")).hexdigest()
-        path = CACHE / key
-        if path.exists():
-            logger.debug(
-                "drytoml-cache: Using cached version of %s at %s",
-                url,
-                path,
-            )
-            with open(path) as fp:
-                return fp.read()
+        path = cache_path(url)
+        if _is_fresh(path, None if settings.OFFLINE else settings.CACHE_TTL):
+            return _serve(path, url)
+        if settings.OFFLINE:
+            raise urllib.error.URLError(f"{url} is not cached (offline)")
 
-        result = func(url, *a, **kw)
-        logger.debug("Caching %s into %s", url, path)
-        CACHE.mkdir(exist_ok=True, parents=True)
-        with open(path, "w") as fp:
-            fp.write(result)
-        return result
+        try:
+            with locked(path.name, timeout=remaining()):
+                # another process might have fetched it while we waited
+                if _is_fresh(path, settings.CACHE_TTL):
+                    return _serve(path, url)
+                return _refresh(path, url, func, *a, **kw)
+        except LockTimeout as exc:
+            raise DeadlineExceeded(
+                f"drytoml: Resolution deadline exceeded waiting for {url}"
+            ) from exc
 
     return _wrapped
 
 
+def _serve(path: Path, url: Url, stale: bool = False) -> str:
+    """Read a cache entry, registering its usage.
+
+    Args:
+        path: Location of the cache entry.
+        url: Source of the cached contents.
+        stale: Whether the entry is being used after a failed refresh.
+
+    Returns:
+        Cached contents.
+    """
+    METRICS.inc("stale" if stale else "hits", host_of(url))
+    logger.debug(
+        "drytoml-cache: Using %scached version of %s at %s",
+        "stale " if stale else "",
+        url,
+        path,
+    )
+    with open(path) as fp:
+        result = fp.read()
+    index.record_hit(path.name, url, len(result.encode("utf-8")))
+    return result
+
+
+def _refresh(path: Path, url: Url, func, *a, **kw) -> str:
+    """Call a function to (re)populate a cache entry.
+
+    Must be called while holding the entry's lock.
+
+    Args:
+        path: Location of the cache entry.
+        url: Source of the contents.
+        func: Function which retrieves the contents.
+        a: Additional args for `func`.
+        kw: Additional kwargs for `func`.
+
+    Raises:
+        URLError: The url failed recently.
+
+    Returns:
+        Fresh contents, or stale ones if allowed by settings.
+    """
+    failed = path.with_suffix(".failed")
+    host = host_of(url)
+    METRICS.inc("revalidations" if path.exists() else "misses", host)
+    try:
+        if _is_fresh(failed, settings.NEGATIVE_TTL):
+            METRICS.inc("negative_hits", host)
+            with open(failed) as fp:
+                reason = fp.read()
+            raise urllib.error.URLError(
+                f"{url} recently failed ({reason}), not retrying"
+            )
+        result = func(url, *a, **kw)
+    except OSError as exc:
+        METRICS.inc("failures", host)
+        if not isinstance(exc, DeadlineExceeded) and not _is_fresh(
+            failed, settings.NEGATIVE_TTL
+        ):
+            logger.debug("drytoml-cache: Remembering failure for %s", url)
+            atomic_write(failed, str(exc))
+        if settings.STALE_FALLBACK and path.exists():
+            logger.warning("drytoml-cache: Unable to fetch %s (%s)", url, exc)
+            return _serve(path, url, stale=True)
+        raise
+
+    logger.debug("Caching %s into %s", url, path)
+    atomic_write(path, result)
+    index.record_fetch(path.name, url, len(result.encode("utf-8")))
+    if failed.exists():
+        failed.unlink()
+    return result
+
+
+def _backoff(attempt: int) -> float:
+    """Compute a jittered exponential delay for a retry attempt.
+
+    Args:
+        attempt: Zero-based index of the failed attempt.
+
+    Returns:
+        Seconds to wait before the next attempt.
+    """
+    base = (settings.BACKOFF or 0) * 2 ** attempt
+    return random.uniform(0, base)  # noqa: S311
+
+
+def _fetch(
+    request_: urllib.request.Request,
+    timeout: Optional[float],
+    host: str,
+) -> bytes:
+    """Perform a single GET, recording its latency.
+
+    The body is read up to the bytes left in the current budget (see
+    `drytoml.budget`), so oversized responses are never buffered whole.
+
+    Args:
+        request_: The request to perform.
+        timeout: Seconds to wait for the response.
+        host: Label for the latency metric.
+
+    Returns:
+        Raw response body.
+    """
+    start = time.monotonic()
+    limits = budget.current()
+    left = limits.remaining_bytes()
+    try:
+        with urllib.request.urlopen(  # noqa: S310
+            request_,
+            timeout=timeout,
+        ) as response:
+            if left is None:
+                return response.read()
+            raw = response.read(left + 1)
+            limits.check_download(request_.full_url, len(raw))
+            return raw
+    finally:
+        METRICS.observe("fetch_seconds", host, time.monotonic() - start)
+
+
+def proxied(url: Union[str, Url], proxy: str) -> str:
+    """Compute the location of an url inside a drytoml cache server.
+
+    Args:
+        url: The upstream url.
+        proxy: Base url of the cache server.
+
+    Returns:
+        The url to request from the cache server.
+
+    Examples:
+        >>> proxied("https://example.com/a.toml", "http://cache:8765")
+        'http://cache:8765/fetch?url=https%3A%2F%2Fexample.com%2Fa.toml'
+    """
+    query = urllib.parse.urlencode({"url": str(url)})
+    return f"{proxy.rstrip('/')}{PROXY_PATH}?{query}"
+
+
+def _request_proxy(
+    url: Union[str, Url],
+    timeout: Optional[float],
+) -> Optional[str]:
+    """Fetch an url through the configured cache server.
+
+    Args:
+        url: The upstream url.
+        timeout: Seconds to wait for the response.
+
+    Raises:
+        HTTPError: The upstream answered with an error, relayed by the
+            server (see `RELAYED_HEADER`). The server already retried
+            it, so it is final: fetching directly would only add load.
+        DeadlineExceeded: The resolution deadline expired.
+
+    Returns:
+        Decoded content, or `None` if the server is unavailable or
+            refuses the url.
+    """
+    host = host_of(url)
+    try:
+        raw = _fetch(
+            urllib.request.Request(proxied(url, settings.PROXY)),
+            remaining(timeout),
+            host,
+        )
+    except urllib.error.HTTPError as exc:
+        if exc.headers.get(RELAYED_HEADER):
+            raise
+        error = exc
+    except DeadlineExceeded:
+        raise
+    except OSError as exc:
+        error = exc
+    else:
+        METRICS.inc("bytes_fetched", host, len(raw))
+        return raw.decode("utf-8")
+
+    METRICS.inc("proxy_fallbacks", host)
+    logger.warning(
+        "drytoml: Unable to fetch %s through %s (%s). Fetching directly",
+        url,
+        settings.PROXY,
+        error,
+    )
+    return None
+
+
 @cached
 def request(
     url: Union[str, Url],
+    timeout: Optional[float] = None,
+    retries: Optional[int] = None,
 ) -> str:
     """Request a `url` using a GET.
 
+    Transient errors (connection problems, timeouts, and retryable
+    status codes) are retried with a jittered exponential backoff. Every
+    attempt, and every wait between them, is bounded by the current
+    `deadline`. If `drytoml.settings.PROXY` is set, the url is requested
+    through that cache server first.
+
     Args:
         url: The URL to GET.
+        timeout: Seconds to wait for each attempt. Defaults to
+            `drytoml.settings.TIMEOUT`.
+        retries: Additional attempts after the first failure. Defaults
+            to `drytoml.settings.RETRIES`.
+
+    Raises:
+        HTTPError: Non-retryable status code, or retries exhausted.
+        URLError: Unable to reach the server after all retries.
+        DeadlineExceeded: The resolution deadline expired.
+        BudgetExceeded: The response exceeds the byte budget.
 
     Returns:
         Decoded content.
     """
+    timeout = settings.TIMEOUT if timeout is None else timeout
+    retries = settings.RETRIES if retries is None else retries
+
+    if settings.PROXY:
+        result = _request_proxy(url, timeout)
+        if result is not None:
+            return result
 
     request_ = urllib.request.Request(Url(url))
     # avoid server-side caching
     request_.add_header("Pragma", "no-cache")
     request_.add_header("User-Agent", "Mozilla/5.0")
-    with urllib.request.urlopen(request_) as response:  # noqa: S310
-        contents = response.read().decode("utf-8")
-    return contents
+
+    host = host_of(url)
+    attempt = 0
+    while True:
+        try:
+            raw = _fetch(request_, remaining(timeout), host)
+            METRICS.inc("bytes_fetched", host, len(raw))
+            return raw.decode("utf-8")
+        except urllib.error.HTTPError as exc:
+            if exc.code not in RETRYABLE_STATUS or attempt >= retries:
+                raise
+            error = exc
+        except OSError as exc:
+            if isinstance(exc, DeadlineExceeded) or attempt >= retries:
+                raise
+            error = exc
+
+        METRICS.inc("retries", host)
+        delay = _backoff(attempt)
+        left = remaining()
+        if left is not None and delay >= left:
+            raise DeadlineExceeded(
+                f"drytoml: Resolution deadline exceeded fetching {url}"
+            ) from error
+        logger.debug(
+            "drytoml: Attempt %s for %s failed (%s). Retrying in %.2fs",
+            attempt + 1,
+            url,
+            error,
+            delay,
+        )
+        time.sleep(delay)
+        attempt += 1
+
+
+def _git(repo: str, *args: str) -> str:
+    """Run a git command inside a local repository.
+
+    Args:
+        repo: Location of the repository (bare or not).
+        args: Git sub-command and its arguments.
+
+    Raises:
+        FileNotFoundError: Git is unavailable, or the command failed,
+            eg because the revision or the file does not exist.
+        DeadlineExceeded: The command outlived the current deadline.
+
+    Returns:
+        The command output.
+    """
+    try:
+        completed = sp.run(  # noqa: S603, S607
+            ["git", "-C", repo, *args],
+            stdout=sp.PIPE,
+            stderr=sp.PIPE,
+            check=True,
+            timeout=remaining(),
+        )
+    except sp.TimeoutExpired as exc:
+        raise DeadlineExceeded(
+            f"drytoml: Resolution deadline exceeded running git {args[0]}"
+        ) from exc
+    except OSError as exc:
+        raise FileNotFoundError(f"Unable to run git: {exc}") from exc
+    except sp.CalledProcessError as exc:
+        raise FileNotFoundError(
+            "git {}: {}".format(
+                " ".join(args),
+                exc.stderr.decode("utf-8", "replace").strip(),
+            )
+        ) from exc
+    return completed.stdout.decode("utf-8")
+
+
+def git_revision(ref: GitRef) -> str:
+    """Resolve the commit a git reference points to.
+
+    Args:
+        ref: The git reference.
+
+    Returns:
+        The full commit sha.
+    """
+    if ref.immutable:
+        return ref.rev
+    return _git(
+        ref.repo,
+        "rev-parse",
+        "--verify",
+        "--quiet",
+        f"{ref.rev}^{{commit}}",
+    ).strip()
+
+
+def git_show(ref: Union[str, GitRef]) -> str:
+    """Read a file from a local git repository, at a specific revision.
+
+    Contents are cached by commit sha, which never change: only mutable
+    revisions (eg branches or tags) require a local `git rev-parse` on
+    subsequent calls, and nothing ever touches the network.
+
+    Args:
+        ref: The git reference, eg
+            ``git+file:///srv/mirrors/styleguide.git#main:pyproject.toml``.
+
+    Raises:
+        DeadlineExceeded: The current deadline expired, eg while another
+            process held the cache entry.
+
+    Returns:
+        The file contents.
+    """
+    ref = GitRef(ref)
+    pinned = ref.at(git_revision(ref))
+    path = cache_path(pinned)
+    if path.exists():
+        return _serve(path, pinned)
+
+    try:
+        with locked(path.name, timeout=remaining()):
+            if path.exists():
+                return _serve(path, pinned)
+            logger.debug("Caching %s into %s", pinned, path)
+            result = _git(ref.repo, "show", f"{pinned.rev}:{ref.path}")
+            atomic_write(path, result)
+            index.record_fetch(
+                path.name, pinned, len(result.encode("utf-8"))
+            )
+    except LockTimeout as exc:
+        raise DeadlineExceeded(
+            f"drytoml: Resolution deadline exceeded waiting for {pinned}"
+        ) from exc
+    return result
+
+
+def _resource_parts(ref: PkgRef) -> List[str]:
+    """Split the path of a package reference, checking it stays inside.
+
+    Args:
+        ref: The package reference.
+
+    Raises:
+        ValueError: The path is absolute, or leaves the package.
+
+    Returns:
+        The components of the path.
+    """
+    parts = ref.path.split("/")
+    if (
+        PurePosixPath(ref.path).is_absolute()
+        or PureWindowsPath(ref.path).anchor
+        or any(part == ".." or "\\" in part for part in parts)
+    ):
+        raise ValueError(f"drytoml: {ref} points outside its package")
+    return parts
+
+
+def package_file(ref: Union[str, PkgRef]) -> Optional[Path]:
+    """Locate a package data file in the filesystem, without reading it.
+
+    Args:
+        ref: The package reference.
+
+    Returns:
+        Path to the file, or `None` if the package can not be found, is
+            not installed as regular files (eg inside a zip), or the
+            path leaves the package.
+    """
+    ref = PkgRef(ref)
+    try:
+        parts = _resource_parts(ref)
+        spec = importlib.util.find_spec(ref.package)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    for location in spec.submodule_search_locations:
+        path = Path(location, *parts)
+        if path.exists():
+            return path
+    return None
+
+
+def package_archive(ref: Union[str, PkgRef]) -> Optional[Path]:
+    """Locate the archive a package is imported from, eg a zip.
+
+    Args:
+        ref: The package reference.
+
+    Returns:
+        Path to the archive, or `None` if the package can not be found
+            or is not imported from an archive.
+    """
+    try:
+        spec = importlib.util.find_spec(PkgRef(ref).package)
+    except (ImportError, ValueError):
+        return None
+    archive = getattr(spec and spec.loader, "archive", None)
+    return Path(archive) if archive else None
+
+
+def package_read(ref: Union[str, PkgRef]) -> str:
+    """Read a data file from an installed python package.
+
+    Files are read through `importlib.resources`, falling back to
+    `pkgutil` in older pythons: packages installed as zips work too, and
+    nothing touches the network nor drytoml's cache.
+
+    Args:
+        ref: The package reference, eg
+            ``pkg://our_styleguide/pyproject.toml``.
+
+    Raises:
+        FileNotFoundError: The package is not installed, or does not
+            contain the file.
+        ValueError: The path is absolute, or leaves the package (eg
+            through ``..``).
+
+    Returns:
+        The file contents.
+    """
+    ref = PkgRef(ref)
+    parts = _resource_parts(ref)
+    try:
+        if resource_files is None:
+            data = pkgutil.get_data(ref.package, "/".join(parts))
+            if data is None:
+                raise FileNotFoundError(ref.path)
+            return data.decode("utf-8")
+        resource = resource_files(ref.package).joinpath(*parts)
+        return resource.read_text(encoding="utf-8")
+    except (ImportError, OSError) as exc:
+        raise FileNotFoundError(
+            f"drytoml: Unable to read {ref}: {exc}"
+        ) from exc
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""Resolve transclusions with an explicit worklist, without recursion.
+
+Resolving a document happens in two phases:
+
+1. Discovery: documents are read and scanned for references
+   breadth-first, fetching each level concurrently. Every layer is a
+   single node, no matter how many documents reference it, and layers
+   available in `drytoml.merge.LAYERS` (or being resolved by another
+   thread, see `drytoml.merge.FLIGHTS`) are not walked again.
+2. Merge: layers are merged in topological order, leaves first. Every
+   layer whose references are all resolved can be merged, so
+   independent branches are merged concurrently. Layers are merged
+   onto the (already merged) layers they reference, so each link of an
+   inheritance chain costs its own size, not the size of its bases.
+
+The depth of the inheritance chain is thus only limited by the budget
+(see `drytoml.budget`), not by python's recursion limit.
+"""
+
+from collections import Counter
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from tomlkit.toml_document import TOMLDocument
+
+from drytoml import budget
+from drytoml import settings
+from drytoml.memo import Flight
+from drytoml.memo import now
+from drytoml.merge import FLIGHTS
+from drytoml.merge import LAYERS
+from drytoml.merge import publish
+from drytoml.utils import deadline
+from drytoml.utils import remaining
+
+Key = Tuple[str, str, bool]
+
+
+class _Node:
+    """A document taking part in a resolution."""
+
+    def __init__(self, key: Optional[Key], parser=None):
+        self.key = key
+        self.parser = parser
+        self.started = now()
+        self.document: Optional[TOMLDocument] = None
+        self.children: List[Key] = []
+
+
+def _bounded(func: Callable, limits: budget.Budget) -> Callable:
+    """Propagate the current deadline and a budget into pool threads.
+
+    Args:
+        func: Function to run in another thread.
+        limits: Budget of the resolution.
+
+    Returns:
+        The function, running under the current deadline and `limits`.
+    """
+    left = remaining()
+
+    def run(*args):
+        with deadline(left), budget.limits(limits):
+            return func(*args)
+
+    return run
+
+
+class Worklist:
+    """State of a single resolution."""
+
+    def __init__(
+        self,
+        root,
+        max_workers: Optional[int] = None,
+        limits: Optional[budget.Budget] = None,
+    ):
+        """Prepare the resolution of a document.
+
+        Args:
+            root: Parser of the document to resolve.
+            max_workers: Maximum number of documents fetched or merged
+                at the same time. Defaults to `drytoml.settings.WORKERS`.
+            limits: Budget of the resolution, also used by the pool
+                threads. Defaults to the current one.
+        """
+        self.root = _Node(None, root)
+        self.extend_key = root.extend_key
+        self.max_workers = max_workers or settings.WORKERS
+        self.limits = budget.current() if limits is None else limits
+        self.nodes: Dict[Key, _Node] = {}
+        self.resolved: Dict[Key, tuple] = {}
+        self.waiting: Dict[Key, Flight] = {}
+        self.owned: List[Key] = []
+        self.uses: Counter = Counter()
+
+    def run(self) -> TOMLDocument:
+        """Resolve the document.
+
+        Raises:
+            BaseException: Any error resolving a layer is shared with
+                the threads waiting for it, and raised.
+
+        Returns:
+            The resolved document.
+        """
+        try:
+            with ThreadPoolExecutor(self.max_workers) as pool:
+                self.discover(pool)
+                self.merge(pool)
+        except BaseException as exc:
+            for key in self.owned:
+                if key not in self.resolved:
+                    FLIGHTS.finish(key, error=exc)
+            raise
+        return self.root.document
+
+    def _map(self, pool, func, items: list):
+        if len(items) <= 1:
+            return [func(item) for item in items]
+        return list(pool.map(_bounded(func, self.limits), items))
+
+    def _scan(self, node: _Node) -> list:
+        node.document = node.parser.parse_raw()
+        return node.parser.references(node.document)
+
+    def _instantiate(self, item: tuple):
+        node, reference, parent = item
+        node.parser = type(parent).factory(
+            reference,
+            extend_key=self.extend_key,
+            parent_reference=parent.reference,
+            level=parent.level + 1,
+        )
+        node.parser.tracking = parent.tracking
+
+    def discover(self, pool: ThreadPoolExecutor):
+        """Read every document, walking references breadth-first.
+
+        Args:
+            pool: Where to fetch documents concurrently.
+        """
+        tracking = self.root.parser.tracking
+        frontier = [self.root]
+        while frontier:
+            found = self._map(pool, self._scan, frontier)
+            created = []
+            for node, references in zip(frontier, found):
+                for reference in references:
+                    key = (str(reference), self.extend_key, tracking)
+                    self.uses[key] += 1
+                    if key not in node.children:
+                        node.children.append(key)
+                    if (
+                        key in self.nodes
+                        or key in self.resolved
+                        or key in self.waiting
+                    ):
+                        continue
+                    cached = LAYERS.get(key)
+                    if cached is not None:
+                        self.resolved[key] = cached
+                        continue
+                    flight, leader = FLIGHTS.claim(key)
+                    if not leader:
+                        self.waiting[key] = flight
+                        continue
+                    self.owned.append(key)
+                    self.nodes[key] = _Node(key)
+                    created.append((self.nodes[key], reference, node.parser))
+            self._map(pool, self._instantiate, created)
+            frontier = [node for node, __, __ in created]
+
+    def _merge_node(self, node: _Node):
+        parser = node.parser
+        for key in node.children:
+            if key not in self.resolved:
+                self.resolved[key] = self.waiting[key].wait()
+            # a layer merged here, and used once, can be modified in
+            # place, the rest are copied when merged (modifying a layer
+            # while another merge copies it would corrupt the copy)
+            owned = key in self.nodes and self.uses[key] == 1
+            parser.layers[key] = (self.resolved[key], owned)
+        document = node.document = parser.merge_layers(node.document)
+        if node.key is None:
+            return
+        result = ((document, parser.provenance), parser.dependencies)
+        # storing a layer costs a copy: keep the ones a later resolution
+        # can start from (referenced by the root, or shared), instead of
+        # every link of a (possibly very long) inheritance chain
+        store = node.key in self.root.children or self.uses[node.key] > 1
+        publish(node.key, result, node.started, store)
+        self.resolved[node.key] = result
+
+    def merge(self, pool: ThreadPoolExecutor):
+        """Merge every document, after the documents it references.
+
+        Args:
+            pool: Where to merge independent documents concurrently.
+
+        Raises:
+            RecursionError: Circular transclusions.
+        """
+        everything = [self.root, *self.nodes.values()]
+        if len(everything) == 1:
+            self._merge_node(self.root)
+            return
+
+        missing = {}
+        parents = defaultdict(list)
+        for node in everything:
+            internal = [key for key in node.children if key in self.nodes]
+            missing[id(node)] = len(internal)
+            for key in internal:
+                parents[key].append(node)
+
+        ready = [node for node in everything if not missing[id(node)]]
+        running = {}
+        merged = 0
+        while ready or running:
+            for node in ready:
+                future = pool.submit(
+                    _bounded(self._merge_node, self.limits), node
+                )
+                running[future] = node
+            ready = []
+            done, __ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                future.result()
+                merged += 1
+                for parent in parents[node.key]:
+                    missing[id(parent)] -= 1
+                    if not missing[id(parent)]:
+                        ready.append(parent)
+
+        if merged < len(everything):
+            cycle = sorted(
+                key[0] for key in self.nodes if key not in self.resolved
+            )
+            raise RecursionError(f"drytoml: Circular transclusion of {cycle}")
+
+
+def resolve(
+    root,
+    max_workers: Optional[int] = None,
+    limits: Optional[budget.Budget] = None,
+) -> TOMLDocument:
+    """Resolve the transclusions of a document.
+
+    Args:
+        root: Parser of the document to resolve.
+        max_workers: Maximum number of documents fetched or merged at
+            the same time. Defaults to `drytoml.settings.WORKERS`.
+        limits: Budget of the resolution. Defaults to the current one.
+
+    Returns:
+        The resolved document.
+    """
+    return Worklist(root, max_workers, limits).run()
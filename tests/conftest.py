@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+
+from drytoml import merge
+from drytoml import paths
+from drytoml.index import PENDING_HITS
+from drytoml.metrics import METRICS
+
+
+@pytest.fixture(autouse=True)
+def _empty_layers():
+    merge.LAYERS.clear()
+    yield
+    merge.LAYERS.clear()
+
+
+@pytest.fixture(name="cache_dir")
+def cache_dir_fixture(tmp_path, monkeypatch):
+    cache = tmp_path / "cache"
+    monkeypatch.setattr(paths, "CACHE", cache)
+    METRICS.counters.clear()
+    METRICS.histograms.clear()
+    PENDING_HITS.clear()
+    return cache
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Routes(dict):
+    """Map request paths to `(status, body[, delay])` and count the hits.
+
+    Extra response headers can be set by path, in `headers`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.hits = Counter()
+        self.headers = {}
+
+
+@pytest.fixture(name="server")
+def server_fixture():
+    routes = Routes()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            routes.hits[self.path] += 1
+            status, body, *delay = routes.get(self.path, (404, "not found"))
+            if delay:
+                time.sleep(*delay)
+            payload = body.encode("utf-8")
+            self.send_response(status)
+            for name, value in routes.headers.get(self.path, {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(
+        target=httpd.serve_forever, args=(0.01,), daemon=True
+    )
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_port}"
+    httpd.routes = routes
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
@@ -0,0 +1,55 @@
+import json
+import urllib.error
+
+import pytest
+
+from drytoml import settings
+from drytoml.app.bench import bench
+from drytoml.utils import request
+
+
+@pytest.fixture(name="project")
+def project_fixture(tmp_path, server):
+    server.routes["/base.toml"] = (200, "[tool.black]\nline-length = 79\n")
+    path = tmp_path / "pyproject.toml"
+    path.write_text(f'__extends = "{server.url}/base.toml"\n')
+    return path
+
+
+def test_bench(project, server, cache_dir):
+    report = json.loads(bench(str(project), runs=3))
+
+    assert list(report["conditions"]) == ["cold", "warm", "offline"]
+    for condition in report["conditions"].values():
+        assert condition["references"] == 2
+        assert condition["peak_memory"] > 0
+        total = condition["total"]
+        assert total["min"] <= total["p50"] <= total["p99"] <= total["max"]
+        assert {"fetch", "parse", "find", "merge", "serialize"} <= set(
+            condition["steps"]
+        )
+    # cold runs fetch every time (one more for the memory run), the
+    # first warm run populates the cache for the rest
+    assert server.routes.hits["/base.toml"] == 5
+    assert not settings.OFFLINE
+
+
+def test_bench_output(project, cache_dir, tmp_path):
+    output = tmp_path / "report.json"
+
+    assert (
+        bench(str(project), runs=1, conditions="warm", output=output) is None
+    )
+    assert list(json.loads(output.read_text())["conditions"]) == ["warm"]
+
+
+def test_offline_uses_cache_only(server, cache_dir, monkeypatch):
+    server.routes["/a.toml"] = (200, "a = 1\n")
+    monkeypatch.setattr(settings, "CACHE_TTL", 0.001)
+    request(f"{server.url}/a.toml")
+    monkeypatch.setattr(settings, "OFFLINE", True)
+
+    assert request(f"{server.url}/a.toml") == "a = 1\n"
+    with pytest.raises(urllib.error.URLError, match="offline"):
+        request(f"{server.url}/b.toml")
+    assert server.routes.hits == {"/a.toml": 1}
@@ -0,0 +1,131 @@
+import pytest
+
+from drytoml import app
+from drytoml import merge
+from drytoml.budget import Budget
+from drytoml.budget import BudgetExceeded
+from drytoml.budget import defaults
+from drytoml.budget import limits
+from drytoml.graph import dependencies
+from drytoml.parser import Parser
+from drytoml.utils import cache_path
+
+
+def chain(tmp_path, depth):
+    for level in range(depth):
+        extends = (
+            f'__extends = "{level + 1}.toml"\n' if level < depth - 1 else ""
+        )
+        (tmp_path / f"{level}.toml").write_text(f"{extends}x{level} = 1\n")
+    return Parser.from_file(tmp_path / "0.toml")
+
+
+def test_depth(tmp_path):
+    with limits(Budget(max_depth=3)):
+        with pytest.raises(BudgetExceeded, match="depth"):
+            chain(tmp_path, 5).parse()
+        assert len(chain(tmp_path, 4).parse()) == 4
+
+
+def test_references(tmp_path):
+    with limits(Budget(max_references=3)) as budget:
+        with pytest.raises(BudgetExceeded, match="reference budget"):
+            chain(tmp_path, 5).parse()
+    assert budget.references == 4
+
+
+def test_bytes(tmp_path):
+    parser = chain(tmp_path, 3)
+    with limits(Budget(max_bytes=2 * parser.size)):
+        with pytest.raises(BudgetExceeded, match="byte budget"):
+            parser.parse()
+
+
+def test_local_read_is_bounded(tmp_path):
+    big = tmp_path / "big.toml"
+    big.write_text("x = '{}'\n".format("a" * 10000))
+    parser = Parser(f'__extends = "{big}"\n')
+
+    # checked before reading, as downloads are
+    with limits(Budget(max_bytes=1000)):
+        with pytest.raises(BudgetExceeded, match="remaining byte budget"):
+            parser.parse()
+
+
+def test_download_is_bounded(server, cache_dir):
+    server.routes["/big.toml"] = (200, "x = '{}'\n".format("a" * 10000))
+    parser = Parser(f'__extends = "{server.url}/big.toml"\n')
+
+    with limits(Budget(max_bytes=1000)):
+        with pytest.raises(BudgetExceeded, match="remaining byte budget"):
+            parser.parse()
+    assert not cache_path(f"{server.url}/big.toml").exists()
+
+
+def test_values(tmp_path):
+    # every level doubles the array
+    (tmp_path / "0.toml").write_text("items = [1, 2]\n")
+    for level in range(1, 12):
+        (tmp_path / f"{level}.toml").write_text(
+            f'__extends = ["{level - 1}.toml", "{level - 1}.toml"]\n'
+        )
+
+    with limits(Budget(max_values=1000)):
+        with pytest.raises(BudgetExceeded, match="value budget"):
+            Parser.from_file(tmp_path / "11.toml").parse()
+
+
+def test_shadowed_values_are_not_counted(tmp_path):
+    # every level overrides the same values
+    values = "".join(f"x{index} = 1\n" for index in range(50))
+    (tmp_path / "0.toml").write_text(values)
+    for level in range(1, 40):
+        (tmp_path / f"{level}.toml").write_text(
+            f'__extends = "{level - 1}.toml"\n{values}'
+        )
+
+    # the values read, and the references
+    with limits(Budget(max_values=40 * 50 + 39)) as budget:
+        assert len(Parser.from_file(tmp_path / "39.toml").parse()) == 50
+    assert budget.values == 40 * 50 + 39
+
+
+def test_outermost_budget_wins():
+    outer = Budget(max_depth=1)
+    with limits(outer), limits(Budget(max_depth=5)) as inner:
+        assert inner is outer
+
+
+def test_each_resolution_gets_a_fresh_budget(tmp_path, monkeypatch):
+    # every resolution references the whole chain again
+    monkeypatch.setattr(merge.LAYERS, "maxsize", 0)
+
+    with defaults(Budget(max_references=5)):
+        for __ in range(10):
+            assert len(chain(tmp_path, 4).parse()) == 4
+        with pytest.raises(BudgetExceeded, match="reference budget"):
+            chain(tmp_path, 7).parse()
+
+
+def test_graph_walk_is_bounded(tmp_path):
+    roots = []
+    for name in "abcd":
+        (tmp_path / f"{name}.toml").write_text(f"{name} = 1\n")
+        roots.append(tmp_path / f"{name}.toml")
+
+    assert len(dependencies(roots, max_workers=4)) == 4
+    with defaults(Budget(max_references=3)):
+        with pytest.raises(BudgetExceeded, match="reference budget"):
+            dependencies(roots, max_workers=4)
+    with defaults(Budget(max_depth=2)):
+        with pytest.raises(BudgetExceeded, match="depth"):
+            dependencies([chain(tmp_path, 5).reference])
+
+
+def test_setup_limits():
+    budget, argv = app.setup_limits(
+        ["dry", "--max-depth", "3", "--max-bytes=0", "black", "--max-depth"]
+    )
+    assert argv == ["dry", "black", "--max-depth"]
+    assert budget.max_depth == 3
+    assert budget.max_bytes is None
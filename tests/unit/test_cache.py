@@ -0,0 +1,256 @@
+import io
+import json
+import tarfile
+
+import pytest
+
+from drytoml import index
+from drytoml import utils
+from drytoml.app import cache
+from drytoml.app.cache import Cache
+from drytoml.graph import dependencies
+from drytoml.index import CacheIndex
+
+
+@pytest.fixture(name="populated")
+def populated_fixture(cache_dir, server):
+    server.routes["/small.toml"] = (200, "a = 1\n")
+    server.routes["/big.toml"] = (200, "b = 2\n" * 100)
+    small = f"{server.url}/small.toml"
+    big = f"{server.url}/big.toml"
+    utils.request(small)
+    utils.request(big)
+    utils.request(big)
+    return small, big
+
+
+def test_index_records_fetches_and_hits(populated):
+    small, big = populated
+    entries = {entry["url"]: entry for __, entry in CacheIndex.load().items()}
+
+    assert entries[small]["size"] == 6
+    assert entries[small]["hits"] == 0
+    assert entries[big]["size"] == 600
+    assert entries[big]["hits"] == 1
+
+
+def test_hits_are_written_in_batches(populated):
+    small, __ = populated
+    stored = CacheIndex.location().read_text()
+
+    utils.request(small)
+    utils.request(small)
+    assert CacheIndex.location().read_text() == stored
+    assert CacheIndex.load().entries[utils.cache_path(small).name]["hits"] == 2
+
+    index.flush()
+    assert not index.PENDING_HITS
+    entries = {entry["url"]: entry for __, entry in CacheIndex.load().items()}
+    assert entries[small]["hits"] == 2
+    assert entries[small]["fetched"]
+
+
+def test_pending_hits_do_not_restore_removed_entries(populated):
+    small, __ = populated
+    key = utils.cache_path(small).name
+    utils.request(small)
+
+    # another process removes the entry before this one flushes
+    stored = CacheIndex._read()  # noqa: W0212
+    stored.remove(key)
+    stored.save()
+    index.flush()
+
+    assert key not in CacheIndex.load().entries
+    assert not index.PENDING_HITS
+
+
+def test_show_filter_sort_json(populated):
+    small, big = populated
+
+    data = json.loads(Cache.show(sort="size", output="json"))
+    assert [entry["url"] for entry in data["entries"]] == [big, small]
+    assert data["total"] == 606
+
+    info = Cache.show(pattern="*small*")
+    assert list(info) == [small, "__total__"]
+
+
+def test_clear_by_url(populated):
+    small, big = populated
+
+    info = Cache.clear(force=True, name=small)
+
+    assert list(info) == [big, "__total__"]
+    assert not utils.cache_path(small).exists()
+    assert utils.cache_path(big).exists()
+
+
+def test_clear_by_pattern(populated):
+    small, big = populated
+
+    info = Cache.clear(force=True, pattern="*big*")
+
+    assert list(info) == [small, "__total__"]
+
+
+def test_stats(populated, tmp_path):
+    small, __ = populated
+    textfile = tmp_path / "drytoml.prom"
+
+    data = json.loads(Cache.stats(output="json", prometheus=str(textfile)))
+
+    host = small.split("/")[2]
+    assert data["counters"]["hits"][host] == 1
+    assert data["counters"]["misses"][host] == 2
+    assert data["histograms"]["fetch_seconds"][host]["count"] == 2
+    assert f'drytoml_cache_hits_total{{host="{host}"}} 1' in textfile.read_text()
+
+    info = Cache.stats(reset=True)
+    assert "1 hits, 2 misses" in info[host]
+    assert Cache.stats() is None
+
+
+@pytest.fixture(name="project")
+def project_fixture(tmp_path, server):
+    server.routes["/base.toml"] = (200, f'__extends = "{server.url}/root.toml"\n')
+    server.routes["/root.toml"] = (200, "[tool.black]\nline-length = 79\n")
+    server.routes["/unrelated.toml"] = (200, "x = 1\n")
+    local = tmp_path / "local.toml"
+    local.write_text(f'__extends = "{server.url}/base.toml"\n')
+    pyproject = tmp_path / "pyproject.toml"
+    pyproject.write_text('[tool.black]\n__extends = "local.toml"\n')
+    return pyproject
+
+
+def test_pack_unpack(cache_dir, server, project, tmp_path):
+    utils.request(f"{server.url}/unrelated.toml")
+    bundle = tmp_path / "bundle.tar.gz"
+
+    packed = Cache.pack(str(project), output=str(bundle))
+
+    assert set(packed) == {f"{server.url}/base.toml", f"{server.url}/root.toml"}
+
+    Cache.clear(force=True)
+    assert Cache.unpack(str(bundle)) == packed
+    urls = {entry["url"] for __, entry in CacheIndex.load().items()}
+    assert urls == set(packed)
+    assert utils.request(f"{server.url}/root.toml").startswith("[tool.black]")
+    assert server.routes.hits["/root.toml"] == 1
+
+
+def test_unpack_rejects_corrupted(cache_dir, server, project, tmp_path):
+    bundle = tmp_path / "bundle.tar.gz"
+    Cache.pack(str(project), output=str(bundle))
+    tampered = tmp_path / "tampered.tar.gz"
+    with tarfile.open(bundle) as src, tarfile.open(tampered, "w:gz") as dst:
+        for member in src.getmembers():
+            data = src.extractfile(member).read()
+            if member.name.startswith("entries/"):
+                data = b"tampered"
+                member.size = len(data)
+            dst.addfile(member, io.BytesIO(data))
+
+    Cache.clear(force=True)
+    with pytest.raises(ValueError, match="Corrupted"):
+        Cache.unpack(str(tampered))
+    assert not list(cache_dir.glob("*"))
+
+
+def test_unpack_rejects_malformed_manifest(cache_dir, tmp_path):
+    bundle = tmp_path / "bundle.tar.gz"
+    manifest = json.dumps({"version": 1, "entries": {"abc": {}}}).encode()
+    with tarfile.open(bundle, "w:gz") as dst:
+        info = tarfile.TarInfo("manifest.json")
+        info.size = len(manifest)
+        dst.addfile(info, io.BytesIO(manifest))
+
+    with pytest.raises(ValueError, match="Unexpected entry abc"):
+        Cache.unpack(str(bundle))
+    assert not list(cache_dir.glob("*"))
+
+
+def test_unpack_recomputes_metadata(cache_dir, server, project, tmp_path):
+    bundle = tmp_path / "bundle.tar.gz"
+    Cache.pack(str(project), output=str(bundle))
+    with tarfile.open(bundle) as src:
+        manifest = json.load(src.extractfile("manifest.json"))
+    for entry in manifest["entries"].values():
+        assert {"fetched", "hits"}.isdisjoint(entry)
+
+    Cache.clear(force=True)
+    Cache.unpack(str(bundle))
+    for __, entry in CacheIndex.load().items():
+        assert entry["fetched"] and entry["hits"] == 0
+
+
+def test_pack_reports_missing(
+    cache_dir, server, project, tmp_path, monkeypatch
+):
+    errors = []
+    def collected_meanwhile(*args):
+        found = dependencies(*args)
+        utils.cache_path(f"{server.url}/base.toml").unlink()
+        return found
+
+    monkeypatch.setattr(cache, "dependencies", collected_meanwhile)
+    monkeypatch.setattr(
+        cache.logger, "error", lambda msg, *args: errors.append(msg % args)
+    )
+
+    with pytest.raises(SystemExit):
+        Cache.pack(str(project), output=str(tmp_path / "bundle.tar.gz"))
+    assert f"{server.url}/base.toml" in errors[0]
+    assert f"{server.url}/root.toml" not in errors[0]
+    assert not (tmp_path / "bundle.tar.gz").exists()
+
+
+def test_warm(cache_dir, server, project, tmp_path):
+    (tmp_path / "plain.toml").write_text("[tool.black]\nline-length = 79\n")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "broken.toml").write_text(
+        f'__extends = ["{server.url}/root.toml", "{server.url}/missing.toml"]'
+    )
+    (tmp_path / ".hidden").mkdir()
+    (tmp_path / ".hidden" / "pyproject.toml").write_text(
+        f'__extends = "{server.url}/unrelated.toml"\n'
+    )
+
+    data = json.loads(Cache.warm(str(tmp_path), output="json"))
+
+    assert data["files"] == 4
+    assert data["roots"] == 3
+    assert data["remote"] == 3
+    assert (data["fetched"], data["cached"], data["failed"]) == (2, 0, 1)
+    assert list(data["errors"]) == [f"{server.url}/missing.toml"]
+    assert utils.cache_path(f"{server.url}/root.toml").exists()
+    assert server.routes.hits["/root.toml"] == 1
+    assert server.routes.hits["/unrelated.toml"] == 0
+
+    again = Cache.warm(str(tmp_path))
+    assert again["cached"] == 2
+    assert server.routes.hits["/root.toml"] == 1
+
+
+def test_gc(cache_dir, server, project):
+    utils.request(f"{server.url}/unrelated.toml")
+    unrelated = utils.cache_path(f"{server.url}/unrelated.toml")
+    utils.cache_path("https://example.com/failed.toml").with_suffix(
+        ".failed"
+    ).write_text("")
+
+    preview = Cache.gc(str(project), dry_run=True)
+    assert preview["evicted"] == 1
+    assert unrelated.exists()
+
+    result = Cache.gc(str(project))
+
+    assert (result["kept"], result["evicted"]) == (2, 1)
+    assert not unrelated.exists()
+    assert not list(cache_dir.glob("*.failed"))
+    locks = {path.stem for path in (cache_dir / "locks").glob("*.lock")}
+    assert unrelated.name not in locks
+    assert utils.cache_path(f"{server.url}/root.toml").name in locks
+    urls = {entry["url"] for __, entry in CacheIndex.load().items()}
+    assert urls == {f"{server.url}/base.toml", f"{server.url}/root.toml"}
+    assert server.routes.hits["/root.toml"] == 1
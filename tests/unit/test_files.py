@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+from drytoml import files
+from drytoml import utils
+
+
+def test_atomic_write_leaves_no_temporaries(tmp_path):
+    target = tmp_path / "entry"
+    files.atomic_write(target, "old")
+    files.atomic_write(target, b"new")
+
+    assert target.read_text() == "new"
+    assert [path.name for path in tmp_path.iterdir()] == ["entry"]
+
+
+@pytest.mark.skipif(not hasattr(os, "fchmod"), reason="posix permissions")
+def test_atomic_write_follows_umask(tmp_path, monkeypatch):
+    monkeypatch.setattr(files, "UMASK", 0o022)
+    target = tmp_path / "entry"
+    files.atomic_write(target, "contents")
+
+    assert target.stat().st_mode & 0o777 == 0o644
+
+
+def test_locked_timeout(cache_dir):
+    acquired = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with files.locked("key"):
+            acquired.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    acquired.wait()
+    try:
+        with pytest.raises(files.LockTimeout):
+            with files.locked("key", timeout=0.05):
+                pass
+    finally:
+        release.set()
+        thread.join()
+
+
+def _hold_and_remove(acquired, release):
+    with files.locked("key") as lock:
+        acquired.set()
+        release.wait()
+        files.remove_lock(lock)
+
+
+@pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(),
+    reason="requires fork",
+)
+def test_locked_survives_removed_lock_files(cache_dir):
+    context = multiprocessing.get_context("fork")
+    acquired, release = context.Event(), context.Event()
+    holder = context.Process(target=_hold_and_remove, args=(acquired, release))
+    holder.start()
+    acquired.wait(10)
+    timer = threading.Timer(0.1, release.set)
+    timer.start()
+    try:
+        with files.locked("key", timeout=10) as lock:
+            assert lock.exists()
+    finally:
+        timer.cancel()
+        release.set()
+        holder.join(10)
+
+
+def _fetch(url, results):
+    results.put(utils.request(url))
+
+
+@pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(),
+    reason="requires fork",
+)
+def test_concurrent_processes_fetch_once(cache_dir, server):
+    server.routes["/slow.toml"] = (200, "a = 1\n", 0.2)
+    url = f"{server.url}/slow.toml"
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+
+    workers = [
+        context.Process(target=_fetch, args=(url, results)) for _ in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert [results.get() for _ in workers] == ["a = 1\n"] * 4
+    assert server.routes.hits["/slow.toml"] == 1
@@ -0,0 +1,67 @@
+from datetime import date
+from datetime import datetime
+from datetime import time
+
+import pytest
+from tests.paths import FIXTURES
+
+from drytoml import formats
+from drytoml.app.export import export
+from drytoml.parser import Parser
+
+EXAMPLE = FIXTURES / "example.toml"
+
+
+@pytest.fixture(name="document")
+def document_fixture():
+    return Parser.from_file(EXAMPLE).parse()
+
+
+@pytest.mark.parametrize("fmt", ["json", "msgpack", "pickle"])
+def test_roundtrip(document, fmt):
+    if fmt == "msgpack":
+        pytest.importorskip("msgpack")
+
+    data = formats.loads(formats.dumps(document, fmt), fmt)
+
+    assert data == formats.unwrap(document)
+    assert type(data["datetime"]["key1"]) is datetime
+    assert data["datetime"]["key1"].tzinfo is not None
+    assert type(data["datetime"]["key4"]) is date
+    assert data["products"][0] == {"name": "Hammer", "sku": 738594937}
+
+
+def test_unwrap_temporal_types():
+    document = Parser("a = 07:32:00\nb = 1979-05-27T07:32:00").parse()
+
+    data = formats.unwrap(document)
+
+    assert type(data["a"]) is time
+    assert data["b"] == datetime(1979, 5, 27, 7, 32)
+    assert data["b"].tzinfo is None
+
+
+def test_export_formats(tmp_path):
+    output = tmp_path / "example.pickle"
+
+    assert export(str(EXAMPLE), output=str(output), format="pickle") is None
+
+    loaded = formats.loads(output.read_bytes(), "pickle")
+    assert loaded == formats.loads(export(str(EXAMPLE), format="json"), "json")
+
+
+def test_unknown_format(document):
+    with pytest.raises(ValueError, match="Unknown format"):
+        formats.dumps(document, "yaml")
+
+
+def test_temporal_roundtrip():
+    document = Parser(
+        "a = 07:32:00.999999\nb = 1979-05-27T07:32:00.5-07:00\nc = 1979-05-27"
+    ).parse()
+
+    data = formats.loads(formats.dumps(document, "json"), "json")
+
+    assert data == formats.unwrap(document)
+    assert type(data["a"]) is time
+    assert data["b"].utcoffset().total_seconds() == -7 * 3600
@@ -0,0 +1,116 @@
+import datetime
+import math
+import pickle
+
+import pytest
+
+from drytoml.frozen import FrozenDict
+from drytoml.frozen import Interner
+from drytoml.frozen import evolve
+from drytoml.frozen import freeze
+from drytoml.frozen import thaw
+from drytoml.resolver import Resolver
+
+
+@pytest.fixture(name="projects")
+def projects_fixture(tmp_path):
+    (tmp_path / "base.toml").write_text(
+        "[tool.black]\nline-length = 79\ntarget-version = ['py38']\n"
+        "[tool.isort]\nprofile = 'black'\n"
+    )
+    projects = []
+    for name in ("a", "b"):
+        project = tmp_path / f"{name}.toml"
+        project.write_text(
+            f'__extends = "base.toml"\n[project]\nname = "{name}"\n'
+        )
+        projects.append(project)
+    return projects
+
+
+def test_identical_subtrees_are_shared(projects):
+    resolver = Resolver(interner=Interner())
+
+    first, second = resolver.resolve_all(projects, frozen=True).values()
+
+    assert first["project"] != second["project"]
+    assert first["tool"] is second["tool"]
+    assert first["tool"]["black"]["target-version"] == ("py38",)
+
+
+def test_types_are_not_conflated():
+    interner = Interner()
+
+    numeric = freeze({"a": 1}, interner)
+    boolean = freeze({"a": True}, interner)
+
+    assert boolean["a"] is True
+    assert numeric["a"] == 1 and numeric["a"] is not True
+    assert len(interner) == 2
+
+
+def test_equal_but_distinct_values_are_not_conflated():
+    interner = Interner()
+    utc = datetime.timezone.utc
+    east = datetime.timezone(datetime.timedelta(hours=2))
+    instant = datetime.datetime(2021, 1, 1, 12, tzinfo=utc)
+
+    first = freeze({"a": 0.0, "b": instant}, interner)
+    second = freeze({"a": -0.0, "b": instant.astimezone(east)}, interner)
+
+    assert math.copysign(1, second["a"]) == -1
+    assert second["b"].utcoffset() == datetime.timedelta(hours=2)
+    assert first["b"].utcoffset() == datetime.timedelta(0)
+
+
+def test_nan_is_interned():
+    interner = Interner()
+
+    first = freeze({"a": float("nan")}, interner)
+    second = freeze({"a": float("nan")}, interner)
+
+    assert first["a"] is second["a"]
+
+
+def test_interner_is_bounded():
+    interner = Interner(maxsize=2)
+
+    first = freeze({"a": [1]}, interner)
+    freeze({"b": [2]}, interner)
+
+    assert len(interner) == 2
+    assert freeze({"a": [1]}, interner) == first
+    assert freeze({"a": [1]}, interner)["a"] is not first["a"]
+
+
+def test_frozen_is_immutable():
+    document = freeze({"tool": {"black": {"line-length": 79}}}, Interner())
+
+    with pytest.raises(TypeError):
+        document["tool"] = {}
+    assert isinstance(hash(document), int)
+
+
+def test_evolve_copies_on_write():
+    interner = Interner()
+    document = freeze(
+        {"tool": {"black": {"line-length": 79}, "isort": {"profile": "a"}}},
+        interner,
+    )
+
+    changed = evolve(document, ["tool", "black", "line-length"], 100, interner)
+
+    assert document["tool"]["black"]["line-length"] == 79
+    assert changed["tool"]["black"]["line-length"] == 100
+    assert changed["tool"]["isort"] is document["tool"]["isort"]
+    assert evolve(changed, ["tool", "black", "line-length"], 79, interner) is (
+        document
+    )
+
+
+def test_thaw_and_pickle():
+    document = freeze({"a": [1, {"b": "c"}]}, Interner())
+
+    assert thaw(document) == {"a": [1, {"b": "c"}]}
+    assert pickle.loads(pickle.dumps(document)) == document
+    assert isinstance(pickle.loads(pickle.dumps(document)), FrozenDict)
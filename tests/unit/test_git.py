@@ -0,0 +1,151 @@
+import shutil
+import subprocess as sp
+import threading
+
+import pytest
+
+from drytoml import loader
+from drytoml.parser import Parser
+from drytoml.types import GitRef
+from drytoml.files import locked
+from drytoml.utils import DeadlineExceeded
+from drytoml.utils import cache_path
+from drytoml.utils import deadline
+from drytoml.utils import git_show
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("git") is None,
+    reason="git is not installed",
+)
+
+
+def git(repo, *args):
+    return (
+        sp.run(
+            ["git", "-C", str(repo), *args],
+            check=True,
+            stdout=sp.PIPE,
+        )
+        .stdout.decode()
+        .strip()
+    )
+
+
+def commit(repo, files):
+    for name, content in files.items():
+        path = repo / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    git(repo, "add", "-A")
+    git(
+        repo,
+        "-c",
+        "user.name=drytoml",
+        "-c",
+        "user.email=drytoml@example.com",
+        "commit",
+        "-qm",
+        "update",
+    )
+    return git(repo, "rev-parse", "HEAD")
+
+
+@pytest.fixture(name="repo")
+def repo_fixture(tmp_path, cache_dir):
+    repo = tmp_path / "styleguide"
+    repo.mkdir()
+    git(repo, "init", "-q", "-b", "main")
+    return repo
+
+
+def test_git_ref_parts():
+    ref = GitRef("git+file:///srv/style.git#v1.0:python/black.toml")
+
+    assert (ref.repo, ref.rev, ref.path) == (
+        "/srv/style.git",
+        "v1.0",
+        "python/black.toml",
+    )
+    assert not ref.immutable
+    assert ref.at("a" * 40).immutable
+    assert not GitRef.validate("https://example.com/black.toml")
+
+
+def test_git_show_pinned_is_cached_forever(repo, cache_dir):
+    sha = commit(repo, {"black.toml": "line-length = 79\n"})
+    ref = f"git+file://{repo}#{sha}:black.toml"
+
+    assert git_show(ref) == "line-length = 79\n"
+    shutil.rmtree(repo)
+    assert git_show(ref) == "line-length = 79\n"
+
+
+def test_git_show_waits_within_deadline(repo, cache_dir):
+    sha = commit(repo, {"black.toml": "line-length = 79\n"})
+    ref = GitRef(f"git+file://{repo}#{sha}:black.toml")
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with locked(cache_path(ref).name):
+            held.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait(5)
+    try:
+        with deadline(0.2), pytest.raises(DeadlineExceeded):
+            git_show(ref)
+    finally:
+        release.set()
+        thread.join()
+    assert git_show(ref) == "line-length = 79\n"
+
+
+def test_git_show_follows_branches(repo):
+    commit(repo, {"black.toml": "line-length = 79\n"})
+    ref = f"git+file://{repo}#main:black.toml"
+    assert git_show(ref) == "line-length = 79\n"
+
+    commit(repo, {"black.toml": "line-length = 100\n"})
+    assert git_show(ref) == "line-length = 100\n"
+
+
+def test_git_show_missing_file(repo):
+    commit(repo, {"black.toml": ""})
+
+    with pytest.raises(FileNotFoundError):
+        git_show(f"git+file://{repo}#main:missing.toml")
+
+
+def test_relative_references_stay_in_revision(repo, tmp_path):
+    sha = commit(
+        repo,
+        {
+            "base.toml": "[tool.black]\nline-length = 79\n",
+            "python/black.toml": '__extends = "../base.toml"\n',
+        },
+    )
+    commit(repo, {"base.toml": "[tool.black]\nline-length = 100\n"})
+    child = tmp_path / "pyproject.toml"
+    child.write_text(
+        f'__extends = "git+file://{repo}#{sha}:python/black.toml"\n'
+    )
+
+    document = Parser.from_file(child).parse()
+
+    assert document["tool"]["black"]["line-length"] == 79
+
+
+def test_load_revalidates_branches(repo, tmp_path):
+    loader.RESOLVED.clear()
+    commit(repo, {"base.toml": "[tool.black]\nline-length = 79\n"})
+    child = tmp_path / "pyproject.toml"
+    child.write_text(f'__extends = "git+file://{repo}#main:base.toml"\n')
+    assert loader.load(child)["tool"]["black"]["line-length"] == 79
+
+    commit(repo, {"base.toml": "[tool.black]\nline-length = 100\n"})
+
+    assert loader.load(child)["tool"]["black"]["line-length"] == 100
+    loader.RESOLVED.clear()
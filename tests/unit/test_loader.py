@@ -0,0 +1,79 @@
+import os
+import time
+
+import pytest
+
+import drytoml
+from drytoml import loader
+from drytoml import settings
+
+
+@pytest.fixture(autouse=True)
+def _empty_cache():
+    loader.RESOLVED.clear()
+    yield
+    loader.RESOLVED.clear()
+
+
+@pytest.fixture(name="child")
+def child_fixture(tmp_path):
+    (tmp_path / "base.toml").write_text("[tool.black]\nline-length = 79\n")
+    child = tmp_path / "child.toml"
+    child.write_text('[tool.black]\n__extends = "base.toml"\n')
+    return child
+
+
+def touch(path, content):
+    stat = path.stat()
+    path.write_text(content)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_load_memoizes(child):
+    first = drytoml.load(child)
+    second = drytoml.load(str(child))
+
+    assert first == second
+    assert first is not second
+    assert loader.RESOLVED.hits == 1
+    assert loader.RESOLVED.misses == 1
+
+
+def test_load_returns_copies(child):
+    drytoml.load(child)["tool"]["black"]["line-length"] = 100
+
+    assert drytoml.load(child)["tool"]["black"]["line-length"] == 79
+
+
+def test_load_invalidates_on_base_change(child, tmp_path):
+    drytoml.load(child)
+    touch(tmp_path / "base.toml", "[tool.black]\nline-length = 88\n")
+
+    assert drytoml.load(child)["tool"]["black"]["line-length"] == 88
+    assert loader.RESOLVED.misses == 2
+
+
+def test_load_invalidates_on_url_expiry(
+    tmp_path, cache_dir, server, monkeypatch
+):
+    server.routes["/base.toml"] = (200, "[tool.black]\nline-length = 79\n")
+    child = tmp_path / "child.toml"
+    child.write_text(f'__extends = "{server.url}/base.toml"\n')
+    drytoml.load(child)
+    assert drytoml.load(child)["tool"]["black"]["line-length"] == 79
+
+    server.routes["/base.toml"] = (200, "[tool.black]\nline-length = 100\n")
+    monkeypatch.setattr(settings, "CACHE_TTL", 0.01)
+    time.sleep(0.02)
+
+    assert drytoml.load(child)["tool"]["black"]["line-length"] == 100
+    assert loader.RESOLVED.hits == 1
+
+
+def test_load_lru_bound(tmp_path, monkeypatch):
+    monkeypatch.setattr(loader.RESOLVED, "maxsize", 2)
+    for name in "abc":
+        (tmp_path / f"{name}.toml").write_text(f"{name} = 1\n")
+        drytoml.load(tmp_path / f"{name}.toml")
+
+    assert len(loader.RESOLVED) == 2
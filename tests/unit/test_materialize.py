@@ -0,0 +1,103 @@
+import configparser
+import os
+
+import pytest
+import tomlkit
+
+from drytoml.app.materialize import STAMP_NAME
+from drytoml.app.materialize import materialize
+from drytoml.app.materialize import stale
+
+
+@pytest.fixture(name="project")
+def project_fixture(tmp_path):
+    (tmp_path / "base.toml").write_text(
+        "[tool.black]\nline-length = 79\n"
+        '[tool.isort]\nprofile = "black"\nknown_first_party = ["a", "b"]\n'
+        "[tool.pylint.MASTER]\njobs = 2\n"
+        '[tool.pylint.messages_control]\ndisable = ["C0111", "R0903"]\n'
+        '[tool.flake8]\nmax-line-length = 79\nignore = ["E203"]\n'
+    )
+    (tmp_path / "setup.cfg").write_text("[metadata]\nname = example\n")
+    path = tmp_path / "pyproject.toml"
+    path.write_text('__extends = "base.toml"\n[tool.black]\ntarget = 1\n')
+    return path
+
+
+def read_ini(path):
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(path)
+    return config
+
+
+def test_materialize(project):
+    directory = project.parent
+
+    assert materialize(str(project)) == {
+        "black.toml": "written",
+        ".isort.cfg": "written",
+        ".pylintrc": "written",
+        "setup.cfg": "written",
+    }
+
+    black = tomlkit.parse((directory / "black.toml").read_text())
+    assert black == {"tool": {"black": {"line-length": 79, "target": 1}}}
+    isort = read_ini(directory / ".isort.cfg")
+    assert isort["settings"]["known_first_party"] == "a,b"
+    pylint = read_ini(directory / ".pylintrc")
+    assert pylint["MASTER"]["jobs"] == "2"
+    assert pylint["messages_control"]["disable"] == "C0111,R0903"
+    setup = read_ini(directory / "setup.cfg")
+    assert setup["metadata"]["name"] == "example"
+    assert setup["flake8"]["ignore"] == "E203"
+
+    assert not stale(directory / STAMP_NAME)
+    assert materialize(str(project), tools="black")["black.toml"] == (
+        "unchanged"
+    )
+
+
+def test_flake8_keeps_the_rest_of_setup_cfg(project):
+    setup = project.parent / "setup.cfg"
+    setup.write_text(
+        "# packaging\n"
+        "[metadata]\nname = example  ; inline\n\n"
+        "[flake8]\nmax-line-length = 100\n\n"
+        "# sorting\n[isort]\nprofile=black\n"
+    )
+
+    materialize(str(project), tools="flake8")
+
+    assert setup.read_text() == (
+        "# packaging\n"
+        "[metadata]\nname = example  ; inline\n\n"
+        "[flake8]\nmax-line-length = 79\nignore = E203\n\n"
+        "# sorting\n[isort]\nprofile=black\n"
+    )
+    assert materialize(str(project), tools="flake8") == {
+        "setup.cfg": "unchanged"
+    }
+
+
+def test_check(project):
+    directory = project.parent
+    with pytest.raises(SystemExit):
+        materialize(str(project), check=True)
+
+    materialize(str(project), tools="black,isort")
+    assert materialize(str(project), check=True) == "up to date"
+
+    (directory / ".isort.cfg").write_text("[settings]\n")
+    assert stale(directory / STAMP_NAME) == [".isort.cfg was modified"]
+
+    materialize(str(project), tools="black,isort")
+    base = directory / "base.toml"
+    stat = base.stat()
+    base.write_text("[tool.black]\nline-length = 100\n")
+    os.utime(base, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert stale(directory / STAMP_NAME) == [f"{base} changed"]
+
+
+def test_unknown_tool(project):
+    with pytest.raises(ValueError, match="Unknown tools"):
+        materialize(str(project), tools="yapf")
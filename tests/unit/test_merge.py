@@ -0,0 +1,205 @@
+import os
+import time
+
+import pytest
+
+from drytoml import merge
+from drytoml import settings
+from drytoml.parser import Parser
+
+
+@pytest.fixture(name="chain")
+def chain_fixture(tmp_path):
+    (tmp_path / "base.toml").write_text("[tool.black]\nline-length = 79\n")
+    (tmp_path / "mid.toml").write_text(
+        '__extends = "base.toml"\n[tool.isort]\nprofile = "black"\n'
+    )
+    leaf = tmp_path / "leaf.toml"
+    leaf.write_text('__extends = "mid.toml"\n[tool.black]\ntarget = 1\n')
+    return leaf
+
+
+def test_layers_reused_when_leaf_changes(chain, monkeypatch):
+    first = Parser.from_file(chain).parse()
+    chain.write_text('__extends = "mid.toml"\n[tool.black]\ntarget = 2\n')
+
+    parsed = []
+    original = Parser.from_file.__func__
+
+    def from_file(cls, path, *args, **kwargs):
+        parsed.append(os.path.basename(path))
+        return original(cls, path, *args, **kwargs)
+
+    monkeypatch.setattr(Parser, "from_file", classmethod(from_file))
+    second = Parser.from_file(chain).parse()
+
+    assert parsed == ["leaf.toml"]
+    assert merge.LAYERS.hits == 1
+    assert first["tool"]["black"]["target"] == 1
+    assert second["tool"]["black"]["target"] == 2
+    assert second["tool"]["black"]["line-length"] == 79
+    assert second["tool"]["isort"]["profile"] == "black"
+
+
+def test_layers_invalidated_when_base_changes(chain, tmp_path):
+    Parser.from_file(chain).parse()
+    base = tmp_path / "base.toml"
+    stat = base.stat()
+    base.write_text("[tool.black]\nline-length = 100\n")
+    os.utime(base, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    document = Parser.from_file(chain).parse()
+
+    assert document["tool"]["black"]["line-length"] == 100
+
+
+def test_layers_invalidated_when_url_expires(
+    tmp_path, cache_dir, server, monkeypatch
+):
+    server.routes["/base.toml"] = (200, "[tool.black]\nline-length = 79\n")
+    leaf = tmp_path / "leaf.toml"
+    leaf.write_text(f'__extends = "{server.url}/base.toml"\n')
+    Parser.from_file(leaf).parse()
+
+    server.routes["/base.toml"] = (200, "[tool.black]\nline-length = 100\n")
+    monkeypatch.setattr(settings, "CACHE_TTL", 0.01)
+    time.sleep(0.02)
+    document = Parser.from_file(leaf).parse()
+
+    assert document["tool"]["black"]["line-length"] == 100
+    assert server.routes.hits["/base.toml"] == 2
+
+
+def test_cached_layers_are_not_shared(chain):
+    first = Parser.from_file(chain).parse()
+    first["tool"]["isort"]["profile"] = "changed"
+
+    second = Parser.from_file(chain).parse()
+
+    assert second["tool"]["isort"]["profile"] == "black"
+    assert "__extends" not in second
+
+
+def test_chain_precedence(tmp_path):
+    (tmp_path / "base.toml").write_text(
+        "[tool.black]\nline-length = 79\ntarget = ['py36']\nskip = true\n"
+    )
+    for name, parent in (("mid", "base"), ("top", "mid")):
+        (tmp_path / f"{name}.toml").write_text(
+            f'__extends = "{parent}.toml"\n'
+            f"[tool.black]\nline-length = {len(name)}\n"
+            f"target = ['{name}']\n{name} = true\n"
+        )
+    leaf = tmp_path / "leaf.toml"
+    leaf.write_text('__extends = "top.toml"\n')
+
+    document = Parser.from_file(leaf).parse()
+
+    assert document["tool"]["black"] == {
+        "line-length": 3,
+        "target": ["top", "mid", "py36"],
+        "skip": True,
+        "mid": True,
+        "top": True,
+    }
+    assert "\n\n\n" not in document.as_string()
+
+
+@pytest.fixture(name="mypy_keys")
+def mypy_keys_fixture(monkeypatch):
+    monkeypatch.setattr(
+        merge.settings, "MERGE_KEYS", "tool.mypy.overrides=module"
+    )
+    merge.merge_keys.cache_clear()
+    yield
+    merge.merge_keys.cache_clear()
+
+
+@pytest.mark.usefixtures("mypy_keys")
+def test_keyed_aot_merge(tmp_path):
+    (tmp_path / "base.toml").write_text(
+        "[[tool.mypy.overrides]]\n"
+        'module = "requests.*"\n'
+        "ignore_missing_imports = true\n"
+        "disallow_untyped_defs = false\n"
+        "[[tool.mypy.overrides]]\n"
+        'module = ["yaml", "toml"]\n'
+        "ignore_errors = true\n"
+    )
+    leaf = tmp_path / "leaf.toml"
+    leaf.write_text(
+        '__extends = "base.toml"\n'
+        "[[tool.mypy.overrides]]\n"
+        'module = "requests.*"\n'
+        "disallow_untyped_defs = true\n"
+        "[[tool.mypy.overrides]]\n"
+        'module = "attr"\n'
+        "strict = true\n"
+    )
+
+    document = Parser.from_file(leaf).parse()
+    overrides = document["tool"]["mypy"]["overrides"]
+
+    assert [entry["module"] for entry in overrides] == [
+        "requests.*",
+        "attr",
+        ["yaml", "toml"],
+    ]
+    assert overrides[0]["disallow_untyped_defs"] is True
+    assert overrides[0]["ignore_missing_imports"] is True
+    reparsed = Parser(document.as_string()).parse()
+    assert len(reparsed["tool"]["mypy"]["overrides"]) == 3
+    assert reparsed["tool"]["mypy"]["overrides"][0]["ignore_missing_imports"]
+
+
+def test_unkeyed_aot_is_concatenated(tmp_path):
+    block = '[[tool.mypy.overrides]]\nmodule = "requests.*"\n'
+    (tmp_path / "base.toml").write_text(block)
+    leaf = tmp_path / "leaf.toml"
+    leaf.write_text(f'__extends = "base.toml"\n{block}')
+
+    document = Parser.from_file(leaf).parse()
+
+    assert len(document["tool"]["mypy"]["overrides"]) == 2
+
+
+def test_parse_merge_keys():
+    assert merge.parse_merge_keys("a.b=name c=id") == {
+        ("a", "b"): "name",
+        ("c",): "id",
+    }
+    with pytest.raises(ValueError, match="Invalid merge key"):
+        merge.parse_merge_keys("a.b")
+
+
+@pytest.mark.parametrize("maxsize", [0, 256])
+def test_layers_used_twice_are_copied(tmp_path, monkeypatch, maxsize):
+    monkeypatch.setattr(merge.LAYERS, "maxsize", maxsize)
+    (tmp_path / "shared.toml").write_text(
+        "[tool.x]\na = 1\n[tool.z]\nc = [1]\n"
+    )
+    (tmp_path / "other.toml").write_text("[tool.z]\nc = [2]\n")
+    # the root adopts shared's `c` array and extends it with other's,
+    # which must not leak into the second use of shared
+    root = tmp_path / "root.toml"
+    root.write_text(
+        '__extends = ["other.toml", "shared.toml"]\n'
+        '[tool.z]\n__extends = "shared.toml"\n'
+    )
+
+    document = Parser.from_file(root).parse()
+
+    assert document["tool"]["z"]["c"] == [1, 2, 1]
+
+
+def test_unshared_layers_are_not_copied(chain, monkeypatch):
+    copies = []
+    monkeypatch.setattr(merge.LAYERS, "maxsize", 0)
+    monkeypatch.setattr(
+        merge.copy, "deepcopy", lambda item: copies.append(item) or item
+    )
+
+    document = Parser.from_file(chain).parse()
+
+    assert document["tool"]["black"]["line-length"] == 79
+    assert not copies
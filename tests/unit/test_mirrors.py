@@ -0,0 +1,99 @@
+from pathlib import Path
+
+import pytest
+
+from drytoml import mirrors
+from drytoml import paths
+from drytoml import settings
+from drytoml.parser import Parser
+from drytoml.types import Url
+
+REMOTE = "https://raw.githubusercontent.com/org/style/main/"
+
+
+@pytest.fixture(autouse=True)
+def _rules(tmp_path, monkeypatch):
+    monkeypatch.setattr(paths, "CONFIG", tmp_path / "config")
+    monkeypatch.setattr(settings, "MIRRORS", "")
+    mirrors.rules.cache_clear()
+    yield
+    mirrors.rules.cache_clear()
+
+
+@pytest.fixture(name="vendor")
+def vendor_fixture(tmp_path):
+    vendor = tmp_path / "vendor"
+    (vendor / "python").mkdir(parents=True)
+    (vendor / "base.toml").write_text("[tool.black]\nline-length = 79\n")
+    (vendor / "python" / "black.toml").write_text(
+        '__extends = "../base.toml"\n'
+    )
+    return vendor
+
+
+def test_parse_rules():
+    assert mirrors.parse_rules(" a=b\n c=d=e ") == {"a": "b", "c": "d=e"}
+    with pytest.raises(ValueError):
+        mirrors.parse_rules("https://example.com/")
+
+
+def test_no_rules_keeps_url():
+    url = REMOTE + "black.toml"
+
+    assert mirrors.rewrite(url) == url
+    assert isinstance(mirrors.rewrite(url), Url)
+
+
+def test_longest_prefix_wins(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        settings,
+        "MIRRORS",
+        f"{REMOTE}={tmp_path}/ {REMOTE}python/=http://127.0.0.1:8000/py/",
+    )
+
+    assert mirrors.rewrite(REMOTE + "python/a.toml") == (
+        "http://127.0.0.1:8000/py/a.toml"
+    )
+    assert mirrors.rewrite(REMOTE + "b.toml") == tmp_path / "b.toml"
+
+
+def test_env_overrides_file(monkeypatch, tmp_path):
+    paths.CONFIG.mkdir()
+    (paths.CONFIG / mirrors.MIRRORS_NAME).write_text(
+        f'[mirrors]\n"{REMOTE}" = "/from/file/"\n'
+        '"https://example.com/" = "/example/"\n'
+    )
+    monkeypatch.setattr(settings, "MIRRORS", f"{REMOTE}={tmp_path}/")
+
+    assert mirrors.rewrite(REMOTE + "a.toml") == tmp_path / "a.toml"
+    assert mirrors.rewrite("https://example.com/a.toml") == Path(
+        "/example/a.toml"
+    )
+
+
+def test_parser_resolves_mirrored_url_locally(monkeypatch, vendor, tmp_path):
+    monkeypatch.setattr(settings, "MIRRORS", f"{REMOTE}={vendor}/")
+    child = tmp_path / "pyproject.toml"
+    child.write_text(f'__extends = "{REMOTE}python/black.toml"\n')
+
+    document = Parser.from_file(child).parse()
+
+    assert document["tool"]["black"]["line-length"] == 79
+    assert Parser.from_file(child).references() == [
+        vendor / "python" / "black.toml"
+    ]
+
+
+def test_mirror_to_local_server(monkeypatch, server, cache_dir, tmp_path):
+    server.routes["/style/black.toml"] = (
+        200,
+        "[tool.black]\nline-length = 100\n",
+    )
+    monkeypatch.setattr(settings, "MIRRORS", f"{REMOTE}={server.url}/style/")
+    child = tmp_path / "pyproject.toml"
+    child.write_text(f'[tool.black]\n__extends = "{REMOTE}black.toml"\n')
+
+    document = Parser.from_file(child).parse()
+
+    assert document["tool"]["black"]["line-length"] == 100
+    assert server.routes.hits["/style/black.toml"] == 1
@@ -0,0 +1,93 @@
+import sys
+import zipfile
+
+import pytest
+
+from drytoml.memo import stat_signature
+from drytoml.parser import Parser
+from drytoml.types import PkgRef
+from drytoml.utils import package_file
+from drytoml.utils import package_read
+
+
+@pytest.fixture(name="styleguide")
+def styleguide_fixture(tmp_path, monkeypatch):
+    package = tmp_path / "site" / "drytoml_styleguide"
+    (package / "bases").mkdir(parents=True)
+    (package / "__init__.py").write_text("")
+    (package / "bases" / "black.toml").write_text(
+        "[tool.black]\nline-length = 79\n"
+    )
+    (package / "pyproject.toml").write_text(
+        '__extends = "bases/black.toml"\n[tool.isort]\nprofile = "black"\n'
+    )
+    monkeypatch.syspath_prepend(str(tmp_path / "site"))
+    yield package
+    sys.modules.pop("drytoml_styleguide", None)
+
+
+def test_pkg_ref():
+    ref = PkgRef("pkg://org.styleguide/bases/black.toml")
+    assert (ref.package, ref.path) == ("org.styleguide", "bases/black.toml")
+    assert ref.at("isort.toml") == "pkg://org.styleguide/isort.toml"
+    assert not PkgRef.validate("pkg://1org/a.toml")
+    assert not PkgRef.validate("pkg://org")
+
+
+def test_package_reference(styleguide, tmp_path, cache_dir):
+    leaf = tmp_path / "pyproject.toml"
+    leaf.write_text(
+        '__extends = "pkg://drytoml_styleguide/pyproject.toml"\n'
+        "[tool.black]\ntarget = 1\n"
+    )
+
+    parser = Parser.from_file(leaf)
+    document = parser.parse()
+
+    assert document["tool"]["black"]["line-length"] == 79
+    assert document["tool"]["isort"]["profile"] == "black"
+    assert parser.dependencies[1:] == [
+        "pkg://drytoml_styleguide/pyproject.toml",
+        "pkg://drytoml_styleguide/bases/black.toml",
+    ]
+    assert not cache_dir.exists() or not list(cache_dir.glob("*"))
+    base = styleguide / "bases" / "black.toml"
+    assert stat_signature(parser.dependencies[-1]) == (
+        base.stat().st_mtime_ns,
+        base.stat().st_size,
+    )
+
+
+def test_zipped_package(tmp_path, monkeypatch):
+    archive = tmp_path / "styleguide.zip"
+    with zipfile.ZipFile(archive, "w") as zipped:
+        zipped.writestr("drytoml_zipped/__init__.py", "")
+        zipped.writestr("drytoml_zipped/base.toml", "a = 1\n")
+    monkeypatch.syspath_prepend(str(archive))
+
+    try:
+        assert package_read("pkg://drytoml_zipped/base.toml") == "a = 1\n"
+        assert stat_signature("pkg://drytoml_zipped/base.toml") == (
+            archive.stat().st_mtime_ns,
+            archive.stat().st_size,
+        )
+    finally:
+        sys.modules.pop("drytoml_zipped", None)
+
+
+def test_missing_package():
+    with pytest.raises(FileNotFoundError, match="drytoml_missing"):
+        package_read("pkg://drytoml_missing/base.toml")
+    assert stat_signature("pkg://drytoml_missing/base.toml") is None
+
+
+@pytest.mark.parametrize(
+    "path", ["../secret.toml", "bases/../../secret.toml", "/etc/passwd"]
+)
+def test_paths_outside_the_package(styleguide, path):
+    (styleguide.parent / "secret.toml").write_text("a = 1\n")
+    ref = f"pkg://drytoml_styleguide/{path}"
+
+    with pytest.raises(ValueError, match="outside its package"):
+        package_read(ref)
+    assert package_file(ref) is None
@@ -0,0 +1,87 @@
+import json
+import logging
+import pstats
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from textwrap import dedent as _
+
+import pytest
+
+from drytoml import app
+from drytoml import profiling
+from drytoml.parser import Parser
+
+
+@pytest.fixture(name="child")
+def child_fixture(tmp_path):
+    (tmp_path / "base.toml").write_text("[a]\nc = 2\n")
+    child = tmp_path / "child.toml"
+    child.write_text(
+        _(
+            """\
+            __extends = "base.toml"
+            [a]
+            b = 1
+            """
+        )
+    )
+    return child
+
+
+def test_profile_flag(child, tmp_path, monkeypatch, capsys):
+    report = tmp_path / "report.pstats"
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["dry", "--profile", str(report), "export", f"--file={child}"],
+    )
+
+    app.main()
+
+    assert "c = 2" in capsys.readouterr().out
+    assert report.exists()
+    phases = json.loads((tmp_path / "report.pstats.phases.json").read_text())
+    assert set(phases["phases"]) == {"drytoml", "resolve"}
+    collapsed = (tmp_path / "report.pstats.collapsed").read_text()
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed.splitlines())
+    assert profiling.PROFILER is None
+
+
+def test_pool_threads_are_profiled(tmp_path):
+    report = tmp_path / "report.pstats"
+    with profiling.profiled(report):
+        with ThreadPoolExecutor(2) as pool:
+            list(pool.map(_busy, [0.05, 0.05]))
+
+    functions = {name for __, __, name in pstats.Stats(str(report)).stats}
+    assert "_busy" in functions
+    collapsed = (tmp_path / "report.pstats.collapsed").read_text()
+    assert "_busy (test_profiling.py" in collapsed
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_phase_is_noop_without_profiler():
+    with profiling.phase("resolve"):
+        pass
+    assert profiling.PROFILER is None
+
+
+def test_setup_profile_only_leading_flag():
+    argv = ["dry", "pylint", "--profile", "x"]
+    assert app.setup_profile(argv) == ("", argv)
+
+
+def test_documents_are_only_serialized_for_debug_logs(child, monkeypatch):
+    def fail(*args):
+        raise AssertionError("serialized without debug logging")
+
+    monkeypatch.setattr(Parser, "_log_document", fail)
+    monkeypatch.setattr(logging.getLogger("drytoml"), "level", logging.INFO)
+
+    assert Parser.from_file(child).parse()["a"]["c"] == 2
@@ -0,0 +1,121 @@
+import pytest
+
+from drytoml import merge
+from drytoml.app.explain import explain
+from drytoml.parser import Parser
+from drytoml.provenance import Origin
+from drytoml.provenance import split
+
+
+@pytest.fixture(name="leaf")
+def leaf_fixture(tmp_path):
+    (tmp_path / "base.toml").write_text(
+        "[tool.black]\nline-length = 79\ntarget-version = ['py36']\n"
+        "[tool.isort]\nprofile = 'black'\n"
+    )
+    (tmp_path / "mid.toml").write_text(
+        '__extends = "base.toml"\n'
+        "[tool.black]\nline-length = 88\ntarget-version = ['py38']\n"
+    )
+    leaf = tmp_path / "leaf.toml"
+    leaf.write_text(
+        '__extends = "mid.toml"\n[tool.black]\nline-length = 100\n'
+    )
+    return leaf
+
+
+def test_tracks_winner_and_shadowed(leaf, tmp_path):
+    parser = Parser.from_file(leaf)
+    parser.parse(provenance=True)
+
+    found = parser.provenance.lookup("tool.black.line-length")
+
+    assert found == {
+        ("tool", "black", "line-length"): [
+            Origin(str(leaf), 0, 100),
+            Origin(str(tmp_path / "mid.toml"), 1, 88, used=False),
+            Origin(str(tmp_path / "base.toml"), 2, 79, used=False),
+        ]
+    }
+
+
+def test_arrays_accumulate(leaf, tmp_path):
+    parser = Parser.from_file(leaf)
+    document = parser.parse(provenance=True)
+
+    origins = parser.provenance.lookup("tool.black.target-version")
+
+    assert document["tool"]["black"]["target-version"] == ["py38", "py36"]
+    assert origins[("tool", "black", "target-version")] == [
+        Origin(str(tmp_path / "mid.toml"), 1, ["py38"]),
+        Origin(str(tmp_path / "base.toml"), 2, ["py36"]),
+    ]
+
+
+def test_lookup_table(leaf, tmp_path):
+    parser = Parser.from_file(leaf)
+    parser.parse(provenance=True)
+
+    assert list(parser.provenance.lookup("tool.isort")) == [
+        ("tool", "isort", "profile")
+    ]
+    assert not parser.provenance.lookup("tool.pylint")
+
+
+def test_lookup_quoted_key(tmp_path):
+    base = tmp_path / "base.toml"
+    base.write_text('[tool."a.b"]\nc = 1\n[tool.a.b]\nc = 2\n')
+    leaf = tmp_path / "leaf.toml"
+    leaf.write_text('__extends = "base.toml"\n')
+    parser = Parser.from_file(leaf)
+    parser.parse(provenance=True)
+
+    found = parser.provenance.lookup('tool."a.b".c')
+
+    assert found == {("tool", "a.b", "c"): [Origin(str(base), 1, 1)]}
+    assert parser.provenance.explain(("tool", "a.b")).startswith(
+        'tool."a.b".c\n'
+    )
+
+
+@pytest.mark.parametrize("key", ["tool..black", "tool]\n[other", "[tool]"])
+def test_split_rejects_invalid_keys(key):
+    with pytest.raises(ValueError):
+        split(key)
+
+
+def test_provenance_survives_cached_layers(leaf):
+    Parser.from_file(leaf).parse(provenance=True)
+    parser = Parser.from_file(leaf)
+    parser.parse(provenance=True)
+
+    found = parser.provenance.lookup("tool.black.line-length")
+    (origins,) = found.values()
+
+    assert merge.LAYERS.hits == 1
+    assert [origin.level for origin in origins] == [0, 1, 2]
+
+
+def test_provenance_is_only_recorded_on_demand(leaf):
+    Parser.from_file(leaf).parse()
+    parser = Parser.from_file(leaf)
+    parser.parse()
+
+    assert not parser.provenance.lookup("tool")
+
+    parser = Parser.from_file(leaf)
+    parser.parse(provenance=True)
+
+    (origins,) = parser.provenance.lookup("tool.black.line-length").values()
+    assert [origin.level for origin in origins] == [0, 1, 2]
+
+
+def test_explain_lookup(leaf, tmp_path):
+    result = explain(str(leaf), lookup="tool.black.line-length")
+
+    assert result.splitlines() == [
+        "tool.black.line-length",
+        f"  uses 100 from {leaf} (level 0)",
+        f"  shadows 88 from {tmp_path / 'mid.toml'} (level 1)",
+        f"  shadows 79 from {tmp_path / 'base.toml'} (level 2)",
+    ]
@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+
+from drytoml import settings
+from drytoml.memo import SingleFlight
+from drytoml.parser import Parser
+from drytoml.resolver import Resolver
+
+
+@pytest.fixture(name="repos")
+def repos_fixture(tmp_path, server, cache_dir):
+    server.routes["/base.toml"] = (
+        200,
+        "[tool.black]\nline-length = 79\n",
+        0.2,
+    )
+    repos = []
+    for number in range(8):
+        repo = tmp_path / f"repo{number}.toml"
+        repo.write_text(
+            f'[tool.black]\n__extends = "{server.url}/base.toml"\n'
+            f"target = {number}\n"
+        )
+        repos.append(repo)
+    return repos
+
+
+def test_single_flight_shares_result():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(1)
+        return object()
+
+    results = []
+    leader = threading.Thread(
+        target=lambda: results.append(flights.do("key", compute))
+    )
+    leader.start()
+    started.wait(1)
+    followers = [
+        threading.Thread(
+            target=lambda: results.append(flights.do("key", compute))
+        )
+        for __ in range(4)
+    ]
+    for follower in followers:
+        follower.start()
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(results) == 5
+    assert len({id(result) for result in results}) == 1
+
+
+def test_single_flight_detects_cycles():
+    flights = SingleFlight()
+
+    with pytest.raises(RecursionError):
+        flights.do("key", lambda: flights.do("key", lambda: None))
+
+
+def test_concurrent_resolutions_share_bases(repos, server, monkeypatch):
+    parsed = []
+    original = Parser.from_url.__func__
+
+    def from_url(cls, url, *args, **kwargs):
+        parsed.append(url)
+        return original(cls, url, *args, **kwargs)
+
+    monkeypatch.setattr(Parser, "from_url", classmethod(from_url))
+    resolver = Resolver()
+
+    documents = resolver.resolve_all(repos, max_workers=8)
+
+    assert server.routes.hits["/base.toml"] == 1
+    assert len(parsed) == 1
+    for number, repo in enumerate(repos):
+        black = documents[repo]["tool"]["black"]
+        assert (black["target"], black["line-length"]) == (number, 79)
+
+
+def test_concurrent_resolutions_of_same_document(repos, monkeypatch):
+    parsed = []
+    original = Parser.from_file.__func__
+
+    def from_file(cls, path, *args, **kwargs):
+        parsed.append(path)
+        return original(cls, path, *args, **kwargs)
+
+    monkeypatch.setattr(Parser, "from_file", classmethod(from_file))
+    resolver = Resolver()
+
+    documents = resolver.resolve_all([repos[0]] * 4, max_workers=4)
+    again = resolver.resolve(repos[0])
+
+    assert parsed == [repos[0]]
+    assert resolver.cache.hits == 1
+    assert again == documents[repos[0]]
+
+
+def test_resolutions_refetch_expired_urls(repos, server, monkeypatch):
+    resolver = Resolver()
+    resolver.resolve(repos[0])
+
+    server.routes["/base.toml"] = (200, "[tool.black]\nline-length = 100\n")
+    monkeypatch.setattr(settings, "CACHE_TTL", 0.01)
+    time.sleep(0.02)
+    document = resolver.resolve(repos[0])
+
+    assert document["tool"]["black"]["line-length"] == 100
+    assert resolver.cache.hits == 0
@@ -0,0 +1,112 @@
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from drytoml import settings
+from drytoml import utils
+from drytoml.metrics import METRICS
+from drytoml.server import CacheServer
+
+
+@pytest.fixture(name="cache_server")
+def cache_server_fixture(cache_dir, server):
+    httpd = CacheServer(("127.0.0.1", 0), allow=[f"{server.url}/*"])
+    thread = threading.Thread(
+        target=httpd.serve_forever, args=(0.01,), daemon=True
+    )
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url) as response:  # noqa: S310
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as exc:
+        return exc.code, exc.read().decode()
+
+
+def test_server_fetches_through_cache(cache_server, server):
+    server.routes["/base.toml"] = (200, "a = 1\n")
+    url = f"{server.url}/base.toml"
+
+    assert get(utils.proxied(url, cache_server.url)) == (200, "a = 1\n")
+    assert get(utils.proxied(url, cache_server.url)) == (200, "a = 1\n")
+    assert server.routes.hits["/base.toml"] == 1
+    assert utils.cache_path(url).exists()
+
+
+def relayed(url):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(url)  # noqa: S310
+    return bool(error.value.headers.get(utils.RELAYED_HEADER))
+
+
+def test_server_errors(cache_server, server):
+    missing = utils.proxied(f"{server.url}/missing", cache_server.url)
+    forbidden = utils.proxied("https://example.com/a", cache_server.url)
+
+    assert get(missing)[0] == 404
+    assert get(forbidden)[0] == 403
+    assert get(f"{cache_server.url}/fetch?url=nope")[0] == 400
+    assert get(f"{cache_server.url}/healthz") == (200, "ok")
+    assert relayed(utils.proxied(f"{server.url}/gone", cache_server.url))
+    assert not relayed(forbidden)
+
+
+def test_client_uses_proxy(cache_dir, server, monkeypatch):
+    upstream = "https://example.com/base.toml"
+    server.routes[utils.proxied(upstream, "")] = (200, "a = 1\n")
+    monkeypatch.setattr(settings, "PROXY", server.url)
+
+    assert utils.request(upstream) == "a = 1\n"
+    assert utils.request(upstream) == "a = 1\n"
+    assert sum(server.routes.hits.values()) == 1
+
+
+def test_client_falls_back_to_direct_fetch(cache_dir, server, monkeypatch):
+    server.routes["/base.toml"] = (200, "a = 1\n")
+    url = f"{server.url}/base.toml"
+    monkeypatch.setattr(settings, "PROXY", "http://127.0.0.1:9")
+    monkeypatch.setattr(settings, "RETRIES", 0)
+
+    assert utils.request(url) == "a = 1\n"
+    assert METRICS.counters["proxy_fallbacks"] == {
+        url.split("/")[2]: 1,
+    }
+
+
+@pytest.mark.parametrize("status", [404, 503])
+def test_client_relays_upstream_errors(cache_dir, server, monkeypatch, status):
+    upstream = f"{server.url}/missing.toml"
+    proxied = utils.proxied(upstream, "")
+    server.routes[proxied] = (status, "upstream error")
+    server.routes.headers[proxied] = {utils.RELAYED_HEADER: "1"}
+    monkeypatch.setattr(settings, "PROXY", server.url)
+
+    with pytest.raises(urllib.error.HTTPError):
+        utils.request(upstream)
+    assert server.routes.hits["/missing.toml"] == 0
+    assert server.routes.hits[proxied] == 1
+
+
+def test_client_bypasses_refusing_proxy(cache_dir, server, monkeypatch):
+    upstream = f"{server.url}/base.toml"
+    server.routes["/base.toml"] = (200, "a = 1\n")
+    server.routes[utils.proxied(upstream, "")] = (403, "Url not allowed")
+    monkeypatch.setattr(settings, "PROXY", server.url)
+
+    assert utils.request(upstream) == "a = 1\n"
+    assert server.routes.hits["/base.toml"] == 1
+
+
+def test_server_allows_nothing_by_default(cache_dir):
+    httpd = CacheServer(("127.0.0.1", 0))
+    try:
+        assert httpd.allow == ()
+    finally:
+        httpd.server_close()
@@ -0,0 +1,74 @@
+import time
+import urllib.error
+
+import pytest
+
+from drytoml import settings
+from drytoml import utils
+
+
+@pytest.fixture(autouse=True)
+def _fast_settings(monkeypatch):
+    monkeypatch.setattr(settings, "BACKOFF", 0.01)
+    monkeypatch.setattr(settings, "RETRIES", 2)
+    monkeypatch.setattr(settings, "CACHE_TTL", None)
+    monkeypatch.setattr(settings, "NEGATIVE_TTL", 60)
+    monkeypatch.setattr(settings, "STALE_FALLBACK", False)
+
+
+def test_request_caches(cache_dir, server):
+    server.routes["/base.toml"] = (200, "a = 1\n")
+    url = f"{server.url}/base.toml"
+
+    assert utils.request(url) == "a = 1\n"
+    assert utils.request(url) == "a = 1\n"
+
+    assert server.routes.hits["/base.toml"] == 1
+    assert utils.cache_path(url).exists()
+
+
+def test_request_retries_transient_errors(cache_dir, server):
+    server.routes["/flaky.toml"] = (503, "unavailable")
+    url = f"{server.url}/flaky.toml"
+
+    with pytest.raises(urllib.error.HTTPError):
+        utils.request(url)
+
+    assert server.routes.hits["/flaky.toml"] == 3
+
+
+def test_request_negative_cache(cache_dir, server):
+    url = f"{server.url}/missing.toml"
+
+    for _ in range(3):
+        with pytest.raises(urllib.error.URLError):
+            utils.request(url)
+
+    # 404 is not retryable, and the failure is remembered
+    assert server.routes.hits["/missing.toml"] == 1
+
+
+def test_request_stale_fallback(cache_dir, server, monkeypatch):
+    server.routes["/base.toml"] = (200, "a = 1\n")
+    url = f"{server.url}/base.toml"
+    utils.request(url)
+
+    monkeypatch.setattr(settings, "CACHE_TTL", 0.01)
+    monkeypatch.setattr(settings, "STALE_FALLBACK", True)
+    server.routes["/base.toml"] = (500, "boom")
+    time.sleep(0.02)
+
+    assert utils.request(url) == "a = 1\n"
+
+
+def test_deadline(cache_dir, server):
+    server.routes["/flaky.toml"] = (503, "unavailable")
+    url = f"{server.url}/flaky.toml"
+
+    with utils.deadline(0.001):
+        time.sleep(0.002)
+        with pytest.raises(utils.DeadlineExceeded):
+            utils.request(url)
+
+    assert server.routes.hits["/flaky.toml"] == 0
+    assert not utils.cache_path(url).with_suffix(".failed").exists()
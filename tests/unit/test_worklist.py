@@ -0,0 +1,116 @@
+import sys
+import time
+
+import pytest
+
+from drytoml import merge
+from drytoml.parser import Parser
+
+
+@pytest.fixture
+def _low_recursion_limit():
+    limit = sys.getrecursionlimit()
+    # far less than a recursive resolution of `test_deep_chain` needs
+    sys.setrecursionlimit(300)
+    yield
+    sys.setrecursionlimit(limit)
+
+
+@pytest.mark.usefixtures("_low_recursion_limit")
+def test_deep_chain(tmp_path):
+    depth = 600
+    for level in range(depth):
+        extends = (
+            f'__extends = "{level + 1}.toml"\n'
+            if level < depth - 1
+            else "base = true\n"
+        )
+        (tmp_path / f"{level}.toml").write_text(
+            f"[tool.deep]\n{extends}level = {level}\n"
+        )
+
+    parser = Parser.from_file(tmp_path / "0.toml")
+    document = parser.parse()
+
+    assert document["tool"]["deep"] == {"level": 0, "base": True}
+    assert len(parser.dependencies) == depth
+
+
+def test_growing_chain(tmp_path):
+    depth = 1000
+    for level in range(depth):
+        extends = ""
+        if level < depth - 1:
+            extends = f'__extends = "{level + 1}.toml"\n'
+        (tmp_path / f"{level}.toml").write_text(
+            f"{extends}[tool.deep]\nkey{level} = {level}\nlevel = {level}\n"
+        )
+
+    start = time.monotonic()
+    document = Parser.from_file(tmp_path / "0.toml").parse()
+
+    # well within the default deadline: merging each link costs its own
+    # keys, not the ones accumulated so far
+    assert time.monotonic() - start < 20
+    deep = document["tool"]["deep"]
+    assert deep["level"] == 0
+    assert {key: deep[key] for key in deep if key != "level"} == {
+        f"key{level}": level for level in range(depth)
+    }
+
+
+def test_diamond_parses_shared_layer_once(tmp_path, monkeypatch):
+    (tmp_path / "shared.toml").write_text("[tool.black]\nline-length = 79\n")
+    for name in ("left", "right"):
+        (tmp_path / f"{name}.toml").write_text(
+            f'__extends = "shared.toml"\n[tool.{name}]\nx = 1\n'
+        )
+    root = tmp_path / "root.toml"
+    root.write_text('__extends = ["left.toml", "right.toml"]\n')
+    parsed = []
+    original = Parser.from_file.__func__
+
+    def from_file(cls, path, *args, **kwargs):
+        parsed.append(path.name)
+        return original(cls, path, *args, **kwargs)
+
+    monkeypatch.setattr(Parser, "from_file", classmethod(from_file))
+
+    document = Parser.from_file(root).parse()
+
+    assert sorted(parsed) == [
+        "left.toml",
+        "right.toml",
+        "root.toml",
+        "shared.toml",
+    ]
+    assert document["tool"]["black"]["line-length"] == 79
+    assert set(document["tool"]) == {"black", "left", "right"}
+
+
+def test_independent_branches_are_concurrent(tmp_path, server, cache_dir):
+    branches = [f"{server.url}/{number}.toml" for number in range(4)]
+    for number in range(4):
+        server.routes[f"/{number}.toml"] = (
+            200,
+            f"[tool]\nb{number} = 1\n",
+            0.3,
+        )
+    root = tmp_path / "root.toml"
+    root.write_text(f"__extends = {branches}\n".replace("'", '"'))
+
+    start = time.monotonic()
+    document = Parser.from_file(root).parse()
+
+    assert time.monotonic() - start < 0.9
+    assert set(document["tool"]) == {"b0", "b1", "b2", "b3"}
+
+
+def test_circular_transclusion(tmp_path):
+    (tmp_path / "a.toml").write_text('__extends = "b.toml"\n')
+    (tmp_path / "b.toml").write_text('__extends = "a.toml"\n')
+
+    with pytest.raises(RecursionError, match="Circular"):
+        Parser.from_file(tmp_path / "a.toml").parse()
+
+    assert not merge.FLIGHTS._flights
@@ -0,0 +1,57 @@
+import importlib
+import sys
+
+import pytest
+
+from drytoml.app.export import export
+from drytoml.app.wrappers import Cli
+from drytoml.parser import requires_transclusion
+
+PLAIN = "[tool.black]  # no inheritance\nline-length   = 79\n"
+
+
+@pytest.fixture(name="plain")
+def plain_fixture(tmp_path):
+    path = tmp_path / "pyproject.toml"
+    path.write_text(PLAIN)
+    return path
+
+
+@pytest.fixture(name="child")
+def child_fixture(tmp_path):
+    (tmp_path / "base.toml").write_text("[tool.black]\nline-length = 79\n")
+    path = tmp_path / "child.toml"
+    path.write_text('[tool.black]\n__extends = "base.toml"\n')
+    return path
+
+
+def test_requires_transclusion():
+    assert not requires_transclusion(PLAIN)
+    assert requires_transclusion('__extends = "base.toml"')
+    assert requires_transclusion('base = "base.toml"', "base")
+
+
+def test_wrapper_passes_plain_files_through(plain, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["black", "--config", str(plain)])
+
+    with Cli(["--config"]).tmp_dump() as virtual:
+        assert virtual.name == str(plain)
+        assert virtual.read() == PLAIN
+
+
+def test_wrapper_dumps_transcluded_files(child, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["black", "--config", str(child)])
+
+    with Cli(["--config"]).tmp_dump() as virtual:
+        assert virtual.name != str(child)
+        assert "line-length = 79" in virtual.read()
+
+
+def test_export_returns_plain_files_as_is(plain, monkeypatch):
+    module = importlib.import_module("drytoml.app.export")
+    monkeypatch.setattr(module, "Parser", None)
+
+    assert export(str(plain)) == PLAIN
+    assert export(str(plain), format="json") == (
+        '{"tool": {"black": {"line-length": 79}}}'
+    )
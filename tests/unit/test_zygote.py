@@ -0,0 +1,181 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from drytoml.app.zygote import ACCEPTED
+from drytoml.app.zygote import delegate
+from drytoml.app.zygote import exit_code
+from drytoml.budget import Budget
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "fork"), reason="The zygote requires fork"
+)
+
+SRC = Path(__file__).parents[2] / "src"
+
+
+@pytest.fixture(name="project")
+def project_fixture(tmp_path):
+    (tmp_path / "base.toml").write_text("[tool.black]\nline-length = 20\n")
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.black]\n__extends = "base.toml"\n'
+    )
+    (tmp_path / "example.py").write_text("x = [1, 2, 3, 4, 5, 6, 7, 8, 9]\n")
+    return tmp_path
+
+
+@pytest.fixture(name="server")
+def server_fixture(project):
+    path = project / "z.sock"
+    env = dict(os.environ, PYTHONPATH=str(SRC))
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "drytoml",
+            "zygote",
+            f"--socket={path}",
+            "--tools=black",
+        ],
+        cwd=project,
+        env=env,
+        stderr=subprocess.DEVNULL,
+    )
+    for __ in range(200):
+        if path.exists():
+            break
+        time.sleep(0.05)
+    yield path
+    process.terminate()
+    process.wait(10)
+    assert not path.exists()
+
+
+def _run(project, server, monkeypatch, *args, tool="black", **kwargs):
+    monkeypatch.chdir(project)
+    stdin = os.open(os.devnull, os.O_RDONLY)
+    with open(project / "out", "w+") as out, open(
+        project / "err", "w+"
+    ) as err:
+        try:
+            code = delegate(
+                tool,
+                [tool, *args],
+                server,
+                (stdin, out.fileno(), err.fileno()),
+                **kwargs,
+            )
+        finally:
+            os.close(stdin)
+        err.seek(0)
+        return code, err.read()
+
+
+def test_delegate_runs_tools_in_the_zygote(project, server, monkeypatch):
+    assert server.stat().st_mode & 0o777 == 0o600
+
+    code, err = _run(project, server, monkeypatch, "--check", "example.py")
+    assert code == 1
+    assert "would reformat" in err
+
+    code, err = _run(project, server, monkeypatch, "example.py")
+    assert code == 0
+    assert (project / "example.py").read_text().startswith("x = [\n")
+
+
+def test_zygote_sees_config_changes(project, server, monkeypatch):
+    (project / "base.toml").write_text("[tool.black]\nline-length = 79\n")
+
+    code, err = _run(project, server, monkeypatch, "--check", "example.py")
+    assert code == 0, err
+
+
+def test_zygote_applies_limits_and_profiles(project, server, monkeypatch):
+    code, err = _run(
+        project,
+        server,
+        monkeypatch,
+        "--check",
+        "example.py",
+        limits=Budget(max_bytes=10),
+    )
+    assert code != 0
+    assert "byte budget" in err
+
+    profile = project / "black.prof"
+    code, err = _run(
+        project, server, monkeypatch, "example.py", profile=str(profile)
+    )
+    assert code == 0, err
+    assert profile.exists()
+
+
+def test_delegate_without_zygote(tmp_path):
+    assert delegate("black", ["black"], tmp_path / "missing.sock") is None
+
+
+def test_rejected_requests_run_in_process(project, server, monkeypatch):
+    assert _run(project, server, monkeypatch, tool="isort") == (None, "")
+
+    monkeypatch.setenv("DRYTOML_MAX_DEPTH", "3")
+    assert _run(project, server, monkeypatch, "example.py") == (None, "")
+    assert (project / "example.py").read_text().startswith("x = [1,")
+
+
+def test_delegate_to_dead_zygote(tmp_path):
+    path = tmp_path / "dead.sock"
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(path))
+    listener.listen()
+
+    def crash():
+        conn, __ = listener.accept()
+        conn.recv(65536)
+        conn.close()
+
+    thread = threading.Thread(target=crash)
+    thread.start()
+    try:
+        assert delegate("black", ["black"], path) is None
+    finally:
+        thread.join()
+        listener.close()
+
+    # the socket file outlives the zygote
+    assert path.exists()
+    assert delegate("black", ["black"], path) is None
+
+
+def test_zygote_failing_after_accepting(tmp_path):
+    path = tmp_path / "crash.sock"
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(path))
+    listener.listen()
+
+    def crash():
+        conn, __ = listener.accept()
+        request = b""
+        while not request.endswith(b"\n"):
+            request += conn.recv(65536)
+        conn.sendall(ACCEPTED)
+        conn.close()
+
+    thread = threading.Thread(target=crash)
+    thread.start()
+    try:
+        # the tool might be running: never run it again in-process
+        assert delegate("black", ["black"], path) == 1
+    finally:
+        thread.join()
+        listener.close()
+
+
+def test_exit_code():
+    assert exit_code(3 << 8) == 3
+    assert exit_code(9) == 128 + 9